@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import shutil
+import numpy as np
+
+# Materialized trigger counts per station and month/day/hour, updated as triggers are written. Sharded as
+# <root>/<station>/<YYYY-MM>.json, so adding a batch rewrites only the months it touched, not years of history.
+AGGREGATES_DIR_NAME = "trigger_aggregates"
+# Per-month key holding the counts of each named batch, so re-adding a batch replaces it
+BATCHES = "_batches"
+BUCKETS = {'month': 'datetime64[M]', 'day': 'datetime64[D]', 'hour': 'datetime64[h]'}
+
+class AggregateCache:
+    """Small per-station, per-month JSON files of {bucket: {label: count}} that plots read instead of the raw trigger log."""
+
+    def __init__(self, root):
+        self.root = root
+        self.counts = {}  # {station: {month: {bucket: {label: count}}}}, months loaded as they are needed
+        self._dirty = set()
+
+    def _month(self, station, month):
+        months = self.counts.setdefault(station, {})
+        if month not in months:
+            path = os.path.join(self.root, station, month + ".json")
+            months[month] = {}
+            if os.path.exists(path):
+                with open(path) as f:
+                    months[month] = json.load(f)
+        return months[month]
+
+    def months(self, station):
+        folder = os.path.join(self.root, station)
+        on_disk = [name[:-len(".json")] for name in os.listdir(folder) if name.endswith(".json")] if os.path.isdir(folder) else []
+        return sorted(set(on_disk) | set(self.counts.get(station, {})))
+
+    def add(self, columns, save=True, name=None):
+        """Adds trigger store columns (needs 'station' and 'on_time') to the counts.
+
+        With a name (as given to TriggerStore.append) each month also keeps that batch's own counts under
+        BATCHES, so adding the same name again swaps the old counts for the new ones instead of adding twice.
+        """
+        if len(columns['on_time']) == 0:
+            return
+        seconds = np.asarray(columns['on_time']).astype('datetime64[s]')
+        stations = np.asarray(columns['station']).astype(str)
+        months = seconds.astype('datetime64[M]')
+        for station in np.unique(stations):
+            for month in np.unique(months[stations == station]):
+                mask = (stations == station) & (months == month)
+                per_month = self._month(str(station), str(month))
+                batch = {}
+                for bucket, unit in BUCKETS.items():
+                    labels, counts = np.unique(seconds[mask].astype(unit), return_counts=True)
+                    batch[bucket] = {str(label): int(count) for label, count in zip(labels.astype(str), counts)}
+                if name is not None:
+                    batches = per_month.setdefault(BATCHES, {})
+                    self._count(per_month, batches.pop(name, {}), -1)
+                    batches[name] = batch
+                self._count(per_month, batch, 1)
+                self._dirty.add((str(station), str(month)))
+        if save:
+            self.save()
+
+    def _count(self, per_month, batch, sign):
+        for bucket, counts in batch.items():
+            table = per_month.setdefault(bucket, {})
+            for label, count in counts.items():
+                table[label] = table.get(label, 0) + sign * count
+                if table[label] == 0:
+                    del table[label]
+
+    def save(self):
+        """Writes the months changed since the last save."""
+        for station, month in sorted(self._dirty):
+            folder = os.path.join(self.root, station)
+            os.makedirs(folder, exist_ok=True)
+            path = os.path.join(folder, month + ".json")
+            with open(path + ".tmp", 'w') as f:
+                json.dump(self.counts[station][month], f, sort_keys=True)
+            os.replace(path + ".tmp", path)
+        self._dirty.clear()
+
+    def series(self, station, bucket='month'):
+        """Returns (labels, counts) for one station, sorted by time."""
+        table = {}
+        for month in self.months(station):
+            table.update(self._month(station, month).get(bucket, {}))
+        labels = sorted(table)
+        return labels, [table[label] for label in labels]
+
+    def rebuild(self, store, stations=None):
+        """Recomputes the counts (of all stations, or just the given ones) from the trigger store, e.g. after a crash left them stale."""
+        if stations is None:
+            shutil.rmtree(self.root, ignore_errors=True)
+            self.counts = {}
+        else:
+            for station in stations:
+                shutil.rmtree(os.path.join(self.root, station), ignore_errors=True)
+                self.counts.pop(station, None)
+        self._dirty = set(key for key in self._dirty if key[0] in self.counts)
+        for station in sorted(set(station for station, _, _ in store.partitions(stations))):
+            self.add(store.read(stations=[station], columns=('station', 'on_time')), save=False)
+        self.save()
+
+if __name__ == "__main__":
+    # Usage: python aggregates.py rebuild <store_dir> [aggregates_dir]
+    #        python aggregates.py show <aggregates_dir> <station> [month|day|hour]
+    from trigger_store import TriggerStore
+
+    command = sys.argv[1]
+    if command == "rebuild":
+        store = TriggerStore(sys.argv[2])
+        path = sys.argv[3] if len(sys.argv) > 3 else os.path.join(os.path.dirname(os.path.abspath(store.root)), AGGREGATES_DIR_NAME)
+        cache = AggregateCache(path)
+        cache.rebuild(store)
+        print(f"✅ Rebuilt {path} for {len(cache.counts)} stations")
+    elif command == "show":
+        bucket = sys.argv[4] if len(sys.argv) > 4 else 'month'
+        for label, count in zip(*AggregateCache(sys.argv[2]).series(sys.argv[3], bucket)):
+            print(f"{label}  {count}")
+    else:
+        print(f"Unknown command: {command}")
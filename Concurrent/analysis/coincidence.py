@@ -0,0 +1,103 @@
+import os
+import csv
+import sys
+from datetime import datetime, timezone
+import numpy as np
+from trigger_store import TriggerStore
+
+# Network coincidence: an event candidate is a span where at least MIN_STATIONS stations are triggered at once.
+# Each trigger counts as active from on_time to off_time + TOLERANCE, so stations whose triggers start up to
+# TOLERANCE seconds apart still coincide. One sort plus a cumulative sum over all on/off edges, no pairwise loop.
+MIN_STATIONS = 3
+TOLERANCE = 10.0  # seconds
+EVENT_FIELDNAMES = ['Start_Time', 'End_Time', 'Duration', 'Max_Stations', 'Number_of_Stations', 'Stations']
+
+def station_intervals(columns, tolerance=TOLERANCE):
+    """Merges each station's triggers into sorted, non-overlapping [start, end) activity intervals.
+
+    Returns {station: (starts, ends)}; both arrays are sorted, so either can be searched with np.searchsorted.
+    """
+    stations = np.asarray(columns['station']).astype(str)
+    on = np.asarray(columns['on_time'], dtype=np.float64)
+    off = np.maximum(np.asarray(columns['off_time'], dtype=np.float64), on) + tolerance
+    intervals = {}
+    for station in np.unique(stations):
+        mask = stations == station
+        order = np.argsort(on[mask], kind='stable')
+        starts, ends = on[mask][order], off[mask][order]
+        # A trigger opens a new interval only if it starts after everything before it has ended
+        reach = np.maximum.accumulate(ends)
+        first = np.r_[True, starts[1:] > reach[:-1]]
+        group = np.cumsum(first) - 1
+        merged_ends = np.full(group[-1] + 1, -np.inf)
+        np.maximum.at(merged_ends, group, ends)
+        intervals[str(station)] = (starts[first], merged_ends)
+    return intervals
+
+def coincidence_spans(intervals, min_stations=MIN_STATIONS):
+    """Sweep line over all stations' interval edges; returns (starts, ends, max_active) of spans with >= min_stations active."""
+    if not intervals:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    times = np.concatenate([np.concatenate(pair) for pair in intervals.values()])
+    deltas = np.concatenate([np.r_[np.ones(len(s), dtype=np.int64), -np.ones(len(e), dtype=np.int64)]
+                             for s, e in intervals.values()])
+    # Ends sort before starts at the same instant, since intervals are half-open
+    order = np.lexsort((deltas, times))
+    times, level = times[order], np.cumsum(deltas[order])
+
+    above = level >= min_stations
+    rising = np.flatnonzero(above & ~np.r_[False, above[:-1]])
+    falling = np.flatnonzero(~above & np.r_[False, above[:-1]])
+    if len(rising) == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    # Every span closes (all intervals end), so rising/falling interleave: r0 < f0 < r1 < f1 ...
+    max_active = np.maximum.reduceat(level, np.column_stack((rising, falling)).ravel())[::2]
+    return times[rising], times[falling], max_active
+
+def stations_in_spans(intervals, starts, ends):
+    """For each span, the stations with an interval overlapping it (one searchsorted per station)."""
+    members = [[] for _ in range(len(starts))]
+    for station, (s, e) in intervals.items():
+        # The last interval starting before a span ends has the latest end, since intervals don't overlap
+        last = np.searchsorted(s, ends, side='left') - 1
+        hit = (last >= 0) & (e[np.maximum(last, 0)] > starts)
+        for i in np.flatnonzero(hit):
+            members[i].append(station)
+    return members
+
+def find_events(store, min_stations=MIN_STATIONS, tolerance=TOLERANCE, stations=None, start=None, end=None):
+    """Event candidates from the trigger store as dicts with start/end epoch times and the stations involved."""
+    columns = store.read(stations, start, end, columns=('on_time', 'off_time', 'station'))
+    intervals = station_intervals(columns, tolerance)
+    starts, ends, max_active = coincidence_spans(intervals, min_stations)
+    members = stations_in_spans(intervals, starts, ends)
+    return [{'start': float(s), 'end': float(e), 'max_stations': int(m), 'stations': sorted(names)}
+            for s, e, m, names in zip(starts, ends, max_active, members)]
+
+def to_csv_row(event):
+    def iso(epoch):
+        return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    return {
+        'Start_Time': iso(event['start']),
+        'End_Time': iso(event['end']),
+        'Duration': round(event['end'] - event['start'], 3),
+        'Max_Stations': event['max_stations'],
+        'Number_of_Stations': len(event['stations']),
+        'Stations': ' '.join(event['stations']),
+    }
+
+if __name__ == "__main__":
+    # Usage: python coincidence.py <store_dir> [min_stations] [tolerance_s] [start YYYY-MM-DD] [end YYYY-MM-DD]
+    store = TriggerStore(sys.argv[1])
+    min_stations = int(sys.argv[2]) if len(sys.argv) > 2 else MIN_STATIONS
+    tolerance = float(sys.argv[3]) if len(sys.argv) > 3 else TOLERANCE
+    start = datetime.strptime(sys.argv[4], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() if len(sys.argv) > 4 else None
+    end = datetime.strptime(sys.argv[5], "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() if len(sys.argv) > 5 else None
+
+    events = find_events(store, min_stations, tolerance, start=start, end=end)
+    out_path = os.path.join(os.path.dirname(os.path.abspath(store.root)), 'event_candidates.csv')
+    with open(out_path, 'w', newline='') as csvfile:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=EVENT_FIELDNAMES)
+        csv_writer.writeheader()
+        csv_writer.writerows(to_csv_row(event) for event in events)
+    print(f"✅ {len(events)} event candidates with >= {min_stations} stations written to {out_path}")
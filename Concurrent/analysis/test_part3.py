@@ -1,26 +1,25 @@
-import pandas as pd
+import sys
 import matplotlib.pyplot as plt
-from matplotlib.dates import DateFormatter
+from trigger_query import TriggerQuery
 
-file_path = "/Volumes/Marc/2025_Marco/PB28/NewPorcessConcurrent/trigger_info.csv"
-df = pd.read_csv(file_path)
+# Trigger counts straight from the time index over the trigger store (built/updated on first query)
+# Usage: python test_part3.py [month|day|hour] [start YYYY-MM-DD] [end YYYY-MM-DD]
+trigger_store_path = "/Volumes/Marc/2025_Marco/PB28/NewPorcessConcurrent/trigger_store"
+station = "PB28"
 
-# Convert 'Start_Time' column to datetime format
-df['Start_Time'] = pd.to_datetime(df['Start_Time'], format='%Y-%m-%dT%H:%M:%S.%fZ')
+bucket = sys.argv[1] if len(sys.argv) > 1 else 'month'
+start = sys.argv[2] if len(sys.argv) > 2 else None
+end = sys.argv[3] if len(sys.argv) > 3 else None
 
-# Create a new column for the month
-df['Month'] = df['Start_Time'].dt.to_period('M')
-
-# Group by month and sum the number of triggers
-monthly_totals = df.groupby('Month')['Number_of_Triggers'].sum()
+labels, totals = TriggerQuery(trigger_store_path).histogram(station, start, end, bucket)
 
 # Plotting
 fig, ax = plt.subplots(figsize=(12, 6))
-ax.bar(monthly_totals.index.astype(str), monthly_totals, color='skyblue')
+ax.bar(labels, totals, color='skyblue')
 
-ax.set_xlabel('Month')
+ax.set_xlabel(bucket.capitalize())
 ax.set_ylabel('Total Number of Triggers')
-ax.set_title('Total Number of Triggers Each Month')
+ax.set_title(f'Total Number of Triggers Each {bucket.capitalize()}')
 
 # Rotate x-axis labels for better readability
 plt.xticks(rotation=45, ha="right")
@@ -0,0 +1,163 @@
+import os
+import sys
+import json
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+from trigger_store import TriggerStore, live_parts
+
+# Persistent time index over the trigger store: per station, time-sorted on_time/off_time/peak_cft arrays
+# saved as .npy under <store>/_index/<station>.v<n>/, with <station>.json pointing at the current version,
+# and memory-mapped at query time. Range, count and histogram queries are binary searches into on_time,
+# so they cost milliseconds however long the log gets.
+INDEX_DIR_NAME = "_index"
+INDEX_COLUMNS = ('on_time', 'off_time', 'peak_cft')
+BUCKETS = {'month': 'M', 'day': 'D', 'hour': 'h', 'minute': 'm'}
+
+def to_epoch(value):
+    """Epoch seconds (UTC) from None, a number, a datetime (naive = UTC) or an ISO string like '2022-03-01T12:00'."""
+    if value is None or isinstance(value, (int, float, np.floating, np.integer)):
+        return value
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    return np.datetime64(str(value).rstrip('Z'), 'us').astype(np.int64) / 1e6
+
+class TriggerQuery:
+    """Time-range queries over a TriggerStore, backed by a per-station sorted index that updates itself."""
+
+    def __init__(self, store_root):
+        self.store = TriggerStore(store_root)
+        self.index_root = os.path.join(store_root, INDEX_DIR_NAME)
+        self._loaded = {}
+
+    def _parts(self, station):
+        return sorted(os.path.relpath(path, self.store.root)
+                      for _, _, folder in self.store.partitions(stations=[station])
+                      for path in live_parts(folder))
+
+    def _read_parts(self, parts):
+        columns = {name: [] for name in INDEX_COLUMNS}
+        for relative in parts:
+            with np.load(os.path.join(self.store.root, relative)) as part:
+                for name in INDEX_COLUMNS:
+                    columns[name].append(part[name])
+        return {name: np.concatenate(values) if values else np.empty(0) for name, values in columns.items()}
+
+    def _pointer(self, station):
+        """The station's current index version: {'version': folder name, 'generation': n, 'parts': [...]}, or None."""
+        path = os.path.join(self.index_root, station + ".json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def refresh(self, station):
+        """Brings one station's index up to date: new parts are merged in, a compaction triggers a full rebuild.
+
+        Each refresh writes a new <station>.v<n> folder and then switches <station>.json to it with one
+        os.replace, so a crash at any point leaves the previous index whole; old versions are deleted after.
+        """
+        pointer = self._pointer(station)
+        parts = self._parts(station)
+        indexed = pointer['parts'] if pointer is not None else []
+        if pointer is not None and indexed == parts:
+            return False
+
+        if indexed and set(indexed) <= set(parts):
+            new = self._read_parts(sorted(set(parts) - set(indexed)))
+            old = self._load(station)
+            columns = {name: np.concatenate([old[name], new[name]]) for name in INDEX_COLUMNS}
+        else:
+            columns = self._read_parts(parts)
+        # Stable sort of an already-sorted prefix plus a small tail is close to linear
+        order = np.argsort(columns['on_time'], kind='stable')
+
+        generation = pointer['generation'] + 1 if pointer is not None else 1
+        version = f"{station}.v{generation}"
+        folder = os.path.join(self.index_root, version)
+        shutil.rmtree(folder, ignore_errors=True)  # Left by a crash before its pointer was written
+        os.makedirs(folder)
+        for name in INDEX_COLUMNS:
+            np.save(os.path.join(folder, name + ".npy"), columns[name][order])
+        pointer_path = os.path.join(self.index_root, station + ".json")
+        with open(pointer_path + ".tmp", 'w') as f:
+            json.dump({'version': version, 'generation': generation, 'parts': parts}, f)
+        os.replace(pointer_path + ".tmp", pointer_path)
+        self._loaded.pop(station, None)
+
+        # Older versions (and the pre-versioning <station>/ folder); open memmaps of them stay readable
+        for name in os.listdir(self.index_root):
+            if name != version and (name == station or name.startswith(station + ".v")):
+                shutil.rmtree(os.path.join(self.index_root, name), ignore_errors=True)
+        return True
+
+    def _load(self, station):
+        if station not in self._loaded:
+            pointer = self._pointer(station)
+            if pointer is None:
+                return {name: np.empty(0) for name in INDEX_COLUMNS}
+            folder = os.path.join(self.index_root, pointer['version'])
+            self._loaded[station] = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode='r')
+                                     for name in INDEX_COLUMNS}
+        return self._loaded[station]
+
+    def _index(self, station):
+        self.refresh(station)
+        return self._load(station)
+
+    def stations(self):
+        return sorted(set(station for station, _, _ in self.store.partitions()))
+
+    def _bounds(self, on_time, start, end):
+        lo = 0 if start is None else np.searchsorted(on_time, to_epoch(start), side='left')
+        hi = len(on_time) if end is None else np.searchsorted(on_time, to_epoch(end), side='left')
+        return lo, max(lo, hi)
+
+    def range(self, station, start=None, end=None, columns=INDEX_COLUMNS):
+        """Triggers with start <= on_time < end, as {column: array} views into the index."""
+        index = self._index(station)
+        lo, hi = self._bounds(index['on_time'], start, end)
+        return {name: index[name][lo:hi] for name in columns}
+
+    def count(self, station, start=None, end=None):
+        """Number of triggers with start <= on_time < end."""
+        lo, hi = self._bounds(self._index(station)['on_time'], start, end)
+        return int(hi - lo)
+
+    def histogram(self, station, start=None, end=None, bucket='hour'):
+        """(labels, counts) per month/day/hour/minute bucket between start and end (default: the data's extent)."""
+        on_time = self._index(station)['on_time']
+        if len(on_time) == 0 and (start is None or end is None):
+            return [], []
+        unit = BUCKETS[bucket]
+        first_epoch = to_epoch(start) if start is not None else on_time[0]
+        last_epoch = to_epoch(end) if end is not None else on_time[-1] + 1
+        first = np.datetime64(int(np.floor(first_epoch)), 's').astype(f'datetime64[{unit}]')
+        last = np.datetime64(int(np.ceil(last_epoch)) - 1, 's').astype(f'datetime64[{unit}]')
+        edges = np.arange(first, last + 2)
+        # Bucket edges in epoch seconds, with the outer two clipped to the requested range
+        edge_epochs = edges.astype('datetime64[s]').astype(np.int64).astype(np.float64)
+        edge_epochs[0] = max(edge_epochs[0], first_epoch)
+        edge_epochs[-1] = min(edge_epochs[-1], last_epoch)
+        counts = np.diff(np.searchsorted(on_time, edge_epochs, side='left'))
+        return [str(label) for label in edges[:-1]], counts.tolist()
+
+if __name__ == "__main__":
+    # Usage: python trigger_query.py refresh <store_dir>
+    #        python trigger_query.py count <store_dir> <station> <start> <end>
+    #        python trigger_query.py histogram <store_dir> <station> <start> <end> [month|day|hour|minute]
+    command = sys.argv[1]
+    query = TriggerQuery(sys.argv[2])
+    if command == "refresh":
+        updated = [station for station in query.stations() if query.refresh(station)]
+        print(f"✅ Index up to date ({len(updated)} stations updated)")
+    elif command == "count":
+        print(query.count(sys.argv[3], sys.argv[4], sys.argv[5]))
+    elif command == "histogram":
+        bucket = sys.argv[6] if len(sys.argv) > 6 else 'hour'
+        for label, count in zip(*query.histogram(sys.argv[3], sys.argv[4], sys.argv[5], bucket)):
+            print(f"{label}  {count}")
+    else:
+        print(f"Unknown command: {command}")
@@ -0,0 +1,219 @@
+import os
+import re
+import csv
+import sys
+import glob
+import itertools
+from datetime import datetime, timezone
+import numpy as np
+
+# Columnar trigger store: <root>/<station>/<YYYY-MM>/part-*.npz, one row per trigger.
+# Each part holds one array per column, so readers load only the columns they ask for.
+COLUMNS = {
+    'on_time': np.float64,       # epoch seconds (UTC)
+    'off_time': np.float64,
+    'peak_cft': np.float32,      # NaN for rows migrated from the old CSV
+    'sampling_rate': np.float32,
+    'network': '<U2',
+    'station': '<U5',
+    'channel': '<U3',
+}
+
+# A part written by compact() also lists the parts it merged (REPLACES); until they are deleted, readers skip them
+MERGED_SUFFIX = "-merged"
+REPLACES = "_replaces"
+
+_part_counter = itertools.count()
+
+def month_of(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime("%Y-%m")
+
+def parse_time(text):
+    """Parses a Start_Time as written to trigger_info.csv (e.g. 2022-03-01T00:00:00.000000Z) to epoch seconds."""
+    text = text.strip().rstrip('Z')
+    fmt = "%Y-%m-%dT%H:%M:%S.%f" if '.' in text else "%Y-%m-%dT%H:%M:%S"
+    return datetime.strptime(text, fmt).replace(tzinfo=timezone.utc).timestamp()
+
+def live_parts(folder):
+    """A partition's part files as readers should see them: parts a merged part replaced are left out, so a
+    crash between writing a merged part and deleting its inputs never counts a trigger twice."""
+    paths = sorted(glob.glob(os.path.join(folder, "*.npz")))
+    replaced = set()
+    for path in paths:
+        if path.endswith(MERGED_SUFFIX + ".npz"):
+            with np.load(path) as part:
+                replaced.update(str(name) for name in part[REPLACES])
+    return [path for path in paths if os.path.basename(path) not in replaced]
+
+def records_to_columns(records):
+    """Turns detection records (start time, sampling rate, on/off sample pairs, peaks) into store columns."""
+    rows = {name: [] for name in COLUMNS}
+    for record in records:
+        if 'error' in record:
+            continue
+        start = float(record['starttime'])
+        df = record['sampling_rate']
+        peaks = record.get('peaks')
+        for i, (on, off) in enumerate(record['onsets']):
+            rows['on_time'].append(start + on / df)
+            rows['off_time'].append(start + off / df)
+            rows['peak_cft'].append(peaks[i] if peaks is not None else np.nan)
+            rows['sampling_rate'].append(df)
+            rows['network'].append(record['network'])
+            rows['station'].append(record['station'])
+            rows['channel'].append(record['channel'])
+    return {name: np.asarray(values, dtype=COLUMNS[name]) for name, values in rows.items()}
+
+class TriggerStore:
+    """Append-only, station/month-partitioned trigger table backed by .npz column files."""
+
+    def __init__(self, root):
+        self.root = root
+        self.touched = set()  # (station, month) partitions appended to through this instance
+        self.bytes_written = 0  # Part file bytes written through this instance, for callers' metrics
+
+    def _write_part(self, folder, columns, suffix="", name=None):
+        os.makedirs(folder, exist_ok=True)
+        if name is None:
+            name = f"part-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%f')}-{os.getpid()}-{next(_part_counter)}{suffix}"
+        tmp_path = os.path.join(folder, name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **columns)
+        # Readers only glob *.npz, so a part is either fully there or not there at all
+        os.replace(tmp_path, os.path.join(folder, name + ".npz"))
+        self.bytes_written += os.path.getsize(os.path.join(folder, name + ".npz"))
+
+    def append(self, columns, name=None):
+        """Appends rows (a dict of equal-length arrays), writing one new part per station/month touched.
+
+        With a name the parts are called part-<name>.npz, so appending the same batch again replaces them
+        instead of adding its rows twice.
+        """
+        n = len(columns['on_time'])
+        if n == 0:
+            return 0
+        months = np.array([month_of(t) for t in columns['on_time']])
+        keys = np.char.add(np.char.add(columns['station'].astype(str), '/'), months)
+        for key in np.unique(keys):
+            mask = keys == key
+            station, month = key.split('/')
+            self.touched.add((station, month))
+            self._write_part(os.path.join(self.root, station, month),
+                             {column: np.asarray(columns[column], dtype=COLUMNS[column])[mask] for column in COLUMNS},
+                             name=f"part-{name}" if name is not None else None)
+        return n
+
+    def partitions(self, stations=None, start=None, end=None):
+        """Lists (station, month, folder) partitions, pruned by station and by month against [start, end)."""
+        first = month_of(start) if start is not None else None
+        last = month_of(end - 1e-6) if end is not None else None
+        found = []
+        for station in sorted(os.listdir(self.root)) if os.path.isdir(self.root) else []:
+            if station.startswith('_') or (stations is not None and station not in stations):
+                continue  # _index and similar folders belong to readers of the store, not to a station
+            for month in sorted(os.listdir(os.path.join(self.root, station))):
+                if (first is not None and month < first) or (last is not None and month > last):
+                    continue
+                found.append((station, month, os.path.join(self.root, station, month)))
+        return found
+
+    def read(self, stations=None, start=None, end=None, columns=('on_time',)):
+        """Loads the requested columns for triggers with start <= on_time < end (epoch seconds)."""
+        need = list(columns) + (['on_time'] if 'on_time' not in columns and (start is not None or end is not None) else [])
+        parts = {name: [] for name in need}
+        for _, _, folder in self.partitions(stations, start, end):
+            for path in live_parts(folder):
+                with np.load(path) as part:
+                    loaded = {name: part[name] for name in need}
+                if start is not None or end is not None:
+                    on = loaded['on_time']
+                    mask = np.ones(len(on), dtype=bool)
+                    if start is not None:
+                        mask &= on >= start
+                    if end is not None:
+                        mask &= on < end
+                    loaded = {name: values[mask] for name, values in loaded.items()}
+                for name in need:
+                    parts[name].append(loaded[name])
+        return {name: (np.concatenate(parts[name]) if parts[name] else np.empty(0, dtype=COLUMNS[name]))
+                for name in columns}
+
+    def compact(self, stations=None, partitions=None):
+        """Merges each partition's parts into a single time-sorted part.
+
+        partitions limits this to a set of (station, month), e.g. `store.touched` after a run, so
+        partitions nobody wrote to keep their part names (and trigger_query.py its index).
+        """
+        merged = 0
+        for station, month, folder in self.partitions(stations):
+            if partitions is not None and (station, month) not in partitions:
+                continue
+            paths = live_parts(folder)
+            stale = sorted(set(glob.glob(os.path.join(folder, "*.npz"))) - set(paths))
+            if len(paths) < 2:
+                for path in stale:
+                    os.remove(path)  # Inputs of an earlier merge that a crash left behind
+                continue
+            columns = {name: [] for name in COLUMNS}
+            for path in paths:
+                with np.load(path) as part:
+                    for name in COLUMNS:
+                        columns[name].append(part[name])
+            columns = {name: np.concatenate(values) for name, values in columns.items()}
+            order = np.argsort(columns['on_time'], kind='stable')
+            merged_columns = {name: values[order] for name, values in columns.items()}
+            merged_columns[REPLACES] = np.array([os.path.basename(path) for path in paths + stale])
+            self._write_part(folder, merged_columns, MERGED_SUFFIX)
+            for path in paths + stale:
+                os.remove(path)
+            merged += 1
+        return merged
+
+# Trigger_Times in the old CSV is a str() of numpy [on off] sample-index pairs, e.g. "[123 456], [789 1011]"
+_PAIR = re.compile(r'\[\s*(\d+)\s+(\d+)\s*\]')
+
+def migrate_csv(csv_path, store, network="TX", channel="HHZ", sampling_rate=100.0, batch_rows=100000):
+    """Converts an existing trigger_info.csv into store rows with absolute on/off times."""
+    batch = {name: [] for name in COLUMNS}
+    total = 0
+
+    def flush():
+        nonlocal batch, total
+        total += store.append({name: np.asarray(values, dtype=COLUMNS[name]) for name, values in batch.items()})
+        batch = {name: [] for name in COLUMNS}
+
+    with open(csv_path, newline='') as csvfile:
+        for row in csv.DictReader(csvfile):
+            pairs = _PAIR.findall(row.get('Trigger_Times') or '')
+            if not pairs:
+                continue
+            start = parse_time(row['Start_Time'])
+            for on, off in pairs:
+                batch['on_time'].append(start + int(on) / sampling_rate)
+                batch['off_time'].append(start + int(off) / sampling_rate)
+                batch['peak_cft'].append(np.nan)
+                batch['sampling_rate'].append(sampling_rate)
+                batch['network'].append(network)
+                batch['station'].append(row['Station'])
+                batch['channel'].append(channel)
+            if len(batch['on_time']) >= batch_rows:
+                flush()
+    flush()
+    store.compact(partitions=store.touched)
+    return total
+
+if __name__ == "__main__":
+    # Usage: python trigger_store.py migrate <trigger_info.csv> <store_dir> [network] [channel] [sampling_rate]
+    #        python trigger_store.py compact <store_dir>
+    command = sys.argv[1]
+    if command == "migrate":
+        store = TriggerStore(sys.argv[3])
+        network = sys.argv[4] if len(sys.argv) > 4 else "TX"
+        channel = sys.argv[5] if len(sys.argv) > 5 else "HHZ"
+        sampling_rate = float(sys.argv[6]) if len(sys.argv) > 6 else 100.0
+        count = migrate_csv(sys.argv[2], store, network, channel, sampling_rate)
+        print(f"✅ Migrated {count} triggers into {store.root}")
+    elif command == "compact":
+        print(f"✅ Compacted {TriggerStore(sys.argv[2]).compact()} partitions")
+    else:
+        print(f"Unknown command: {command}")
@@ -0,0 +1,214 @@
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import tempfile
+import contextlib
+import subprocess
+from datetime import datetime, timedelta
+import numpy as np
+from obspy import UTCDateTime
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'download'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'process'))
+from fdsn_standin import start_server
+from fdsn_client import DataselectClient
+from flow_control import HostController, host_of
+from windows import WindowPlanner
+from synthetic_sac import write_folder, make_sac_zip
+from sac_reader import read_sac
+from detection import detect_file, detect_files, list_sac_files
+
+# End-to-end benchmark on synthetic data: downloads from a local stand-in (latency, bandwidth cap, 413 on long
+# windows, injected 5xx), then reads and detects synthetic SAC files with known events. Each run is saved as
+# bench_results/<commit>.json so runs on different commits can be compared with `compare`.
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_results')
+DAYS = 2                    # Days requested from the stand-in
+FILES = 48                  # Hourly synthetic files for the read/detect stages
+LATENCY = 0.05              # seconds of simulated server time per request
+BANDWIDTH = 20e6            # bytes/s per connection
+MAX_WINDOW = 6 * 3600       # Longer windows get a 413, so the client has to split day requests
+ERROR_RATE = 0.02           # Fraction of requests answered with a random 5xx
+MAX_IN_FLIGHT = 16
+DETECT_WORKERS = 4
+MATCH_SECONDS = 3           # A trigger this close to an injected onset counts as finding it
+
+def git_commit():
+    """Short HEAD hash of the repo, with '-dirty' for uncommitted changes to tracked files."""
+    folder = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=folder, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=folder,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + ("-dirty" if dirty else "")
+
+def stage_stats(latencies, seconds, nbytes=None, requests_made=None):
+    """Throughput and p50/p99 latency (ms) of one stage."""
+    latencies = np.asarray(latencies, dtype=float)
+    stats = {'items': len(latencies), 'seconds': round(seconds, 3),
+             'files_per_s': round(len(latencies) / seconds, 2) if seconds > 0 else None}
+    if len(latencies):
+        stats['p50_ms'] = round(float(np.percentile(latencies, 50)) * 1000, 2)
+        stats['p99_ms'] = round(float(np.percentile(latencies, 99)) * 1000, 2)
+    if nbytes is not None:
+        stats['mb_per_s'] = round(nbytes / 1e6 / seconds, 2)
+    if requests_made is not None:
+        stats['requests_per_s'] = round(requests_made / seconds, 2)
+    return stats
+
+def bench_download(days):
+    """Fetches `days` days of one channel through DataselectClient; latency is per HTTP request (time to headers)."""
+    server, base_url = start_server(latency=LATENCY, bandwidth=BANDWIDTH, max_window=MAX_WINDOW,
+                                    error_rate=ERROR_RATE, synthetic=True)
+    start = datetime(2022, 3, 1)
+    day_starts = [start + timedelta(days=i) for i in range(days)]
+    # Generate the synthetic members up front, so the stand-in's CPU time doesn't count against the client
+    for day in day_starts:
+        make_sac_zip("TX", "PB28", "HHZ", day, day + timedelta(days=1))
+    planner = WindowPlanner()
+    controller = HostController(host_of(base_url), max_limit=MAX_IN_FLIGHT)
+    request_latencies = []
+    members = []
+
+    def fetch_day(day):
+        return client.fetch_members("TX", "PB28", "HHZ", day, day + timedelta(days=1),
+                                    lambda name, data: members.append(len(data)), planner)
+
+    tic = time.perf_counter()
+    with DataselectClient(base_url, max_in_flight=MAX_IN_FLIGHT, controller=controller) as client, \
+            contextlib.redirect_stdout(open(os.devnull, 'w')):
+        client.session.hooks['response'].append(
+            lambda response, *args, **kwargs: request_latencies.append(response.elapsed.total_seconds()))
+        statuses = client.map(fetch_day, day_starts)
+    seconds = time.perf_counter() - tic
+    server.shutdown()
+
+    stats = stage_stats(request_latencies, seconds, nbytes=server.bytes_served, requests_made=len(request_latencies))
+    stats['files_per_s'] = round(len(members) / seconds, 2)
+    stats.update({'files': len(members), 'too_large': server.too_large, 'errors_injected': server.errors_injected,
+                  'failed_days': sum(not status.startswith("Success") for status in statuses)})
+    return stats
+
+def bench_read(file_paths):
+    latencies = []
+    nbytes = 0
+    tic = time.perf_counter()
+    for file_path in file_paths:
+        t = time.perf_counter()
+        # Sum the samples so the memmap is really paged in
+        float(read_sac(file_path)['data'].sum())
+        latencies.append(time.perf_counter() - t)
+        nbytes += os.path.getsize(file_path)
+    return stage_stats(latencies, time.perf_counter() - tic, nbytes=nbytes)
+
+def recall(records, events):
+    """Fraction of injected events with a trigger onset within MATCH_SECONDS, and the total trigger count."""
+    onsets = np.sort(np.array([float(record['starttime']) + on / record['sampling_rate']
+                               for record in records for on, _ in record['onsets']]))
+    if len(events) == 0:
+        return None, len(onsets)
+    if len(onsets) == 0:
+        return 0.0, 0
+    found = 0
+    for event in events:
+        epoch = float(UTCDateTime(event))
+        i = np.searchsorted(onsets, epoch)
+        nearest = min(abs(onsets[j] - epoch) for j in (i - 1, i) if 0 <= j < len(onsets))
+        found += nearest <= MATCH_SECONDS
+    return round(found / len(events), 3), len(onsets)
+
+def bench_detect(file_paths, events):
+    latencies = []
+    records = []
+    tic = time.perf_counter()
+    for file_path in file_paths:
+        t = time.perf_counter()
+        records.append(detect_file(file_path))
+        latencies.append(time.perf_counter() - t)
+    stats = stage_stats(latencies, time.perf_counter() - tic)
+    stats['recall'], stats['triggers'] = recall(records, events)
+    return stats
+
+def bench_detect_pool(file_paths):
+    tic = time.perf_counter()
+    count = sum(1 for _ in detect_files(file_paths, workers=DETECT_WORKERS))
+    seconds = time.perf_counter() - tic
+    return {'items': count, 'seconds': round(seconds, 3), 'files_per_s': round(count / seconds, 2),
+            'workers': DETECT_WORKERS}
+
+def run(days=DAYS, files=FILES):
+    """Runs every stage and saves the results under RESULTS_DIR; returns the results dict."""
+    results = {'commit': git_commit(), 'date': datetime.now().isoformat(timespec='seconds'),
+               'config': {'days': days, 'files': files, 'latency': LATENCY, 'bandwidth': BANDWIDTH,
+                          'max_window': MAX_WINDOW, 'error_rate': ERROR_RATE, 'max_in_flight': MAX_IN_FLIGHT,
+                          'detect_workers': DETECT_WORKERS},
+               'stages': {}}
+    print(f"⏳ Download: {days} days from the stand-in...")
+    results['stages']['download'] = bench_download(days)
+
+    folder = tempfile.mkdtemp(prefix="bench_suite_")
+    try:
+        print(f"⏳ Writing {files} synthetic hourly SAC files...")
+        events = write_folder(folder, datetime(2022, 3, 1), files)
+        file_paths = list_sac_files(folder)
+        print("⏳ Read / detect...")
+        results['stages']['read'] = bench_read(file_paths)
+        results['stages']['detect'] = bench_detect(file_paths, events)
+        results['stages']['detect_pool'] = bench_detect_pool(file_paths)
+    finally:
+        shutil.rmtree(folder)
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, results['commit'] + ".json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print(f"✅ Saved {path}")
+    return results
+
+def print_results(results):
+    print(f"\nCommit {results['commit']} ({results['date']})")
+    for stage, stats in results['stages'].items():
+        print(f"  {stage:<12} " + "  ".join(f"{name}={value}" for name, value in stats.items()))
+
+def load_results(name):
+    """Loads a results file by path or by (a prefix of) the commit it was run on."""
+    if os.path.exists(name):
+        path = name
+    else:
+        matches = sorted(glob.glob(os.path.join(RESULTS_DIR, name + "*.json")))
+        if not matches:
+            raise FileNotFoundError(f"No benchmark results for {name} in {RESULTS_DIR}")
+        path = matches[-1]
+    with open(path) as f:
+        return json.load(f)
+
+def compare(old, new):
+    """Prints every numeric metric of two runs side by side with the relative change."""
+    print(f"{'':<12} {'metric':<16} {old['commit']:>14} {new['commit']:>14}   change")
+    for stage in new['stages']:
+        for name, value in new['stages'][stage].items():
+            before = old['stages'].get(stage, {}).get(name)
+            if not isinstance(value, (int, float)) or not isinstance(before, (int, float)):
+                continue
+            change = f"{(value - before) / before * 100:+7.1f}%" if before else ""
+            print(f"{stage:<12} {name:<16} {before:>14} {value:>14}   {change}")
+
+if __name__ == "__main__":
+    # Usage: python bench_suite.py run [days] [files]
+    #        python bench_suite.py compare <old commit|file> <new commit|file>
+    #        python bench_suite.py list
+    command = sys.argv[1] if len(sys.argv) > 1 else "run"
+    if command == "run":
+        run(int(sys.argv[2]) if len(sys.argv) > 2 else DAYS, int(sys.argv[3]) if len(sys.argv) > 3 else FILES)
+    elif command == "compare":
+        compare(load_results(sys.argv[2]), load_results(sys.argv[3]))
+    elif command == "list":
+        for path in sorted(glob.glob(os.path.join(RESULTS_DIR, "*.json")), key=os.path.getmtime):
+            print_results(load_results(path))
+    else:
+        print(f"Unknown command: {command}")
@@ -0,0 +1,48 @@
+import os
+import re
+import sys
+import subprocess
+
+# Startup guard for seismic.py and the detection workers: runs each case under `python -X importtime` and
+# fails (exit 1) if a heavy library it should not need gets imported or the total import time is over budget.
+# Budgets are in seconds and loose on purpose; the forbidden modules are the real check.
+FOLDER = os.path.dirname(os.path.abspath(__file__))
+SEISMIC = os.path.join(FOLDER, 'seismic.py')
+PROCESS_DIR = os.path.join(FOLDER, 'process')
+HEAVY = ('matplotlib', 'pandas')
+CASES = [
+    # (name, argv after `python -X importtime`, cwd, modules that must not load, budget)
+    ('seismic help', [SEISMIC, 'help'], FOLDER, HEAVY + ('obspy', 'scipy'), 0.3),
+    ('seismic status', [SEISMIC, 'status', FOLDER], FOLDER, HEAVY + ('obspy', 'scipy'), 0.3),
+    ('detection worker', ['-c', 'import detection'], PROCESS_DIR, HEAVY, 2.5),
+]
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def import_times(argv, cwd):
+    """{top-level module: cumulative seconds} from the -X importtime report of one run."""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + argv, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        # Nesting is shown by two spaces per level; level 0 is what the script itself imported
+        if match and len(match.group(3)) == 1:
+            modules[match.group(4)] = modules.get(match.group(4), 0) + int(match.group(2)) / 1e6
+    return modules, result.stderr
+
+def check(name, argv, cwd, forbidden, budget):
+    modules, report = import_times(argv, cwd)
+    loaded = sorted({module.split('.')[0] for module in re.findall(r"\|\s+(\S+)$", report, re.M)} & set(forbidden))
+    total = sum(modules.values())
+    slowest = sorted(modules.items(), key=lambda item: -item[1])[:3]
+    print(f"{'✅' if not loaded and total <= budget else '❌'} {name}: {total:.3f} s of imports (budget {budget} s); "
+          + ", ".join(f"{module} {seconds:.3f} s" for module, seconds in slowest))
+    if loaded:
+        print(f"   🚨 loaded {', '.join(loaded)}")
+    return not loaded and total <= budget
+
+if __name__ == "__main__":
+    # Usage: python check_importtime.py
+    ok = all([check(*case) for case in CASES])
+    sys.exit(0 if ok else 1)
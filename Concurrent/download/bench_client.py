@@ -0,0 +1,84 @@
+import sys
+import time
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+import requests
+from fdsn_client import DataselectClient
+from flow_control import HostController, host_of
+from fdsn_standin import start_server
+
+# Compares the old Pool-of-blocking-requests.get downloader with DataselectClient against a local stand-in
+NUM_HOURS = 240
+NUM_PROCESSES = 8
+LATENCY = 0.1  # seconds of simulated server time per request
+THROTTLE_AT = 16  # `throttle` mode: the stand-in answers 429 past this many concurrent requests
+
+def pool_download(args):
+    """The downloader2.py/test.py pattern: a fresh requests.get (new connection) per hour."""
+    base_url, out_dir, current_time = args
+    params = {
+        'net': "TX", 'sta': "PB28", 'cha': "HHZ", 'format': "sac.zip",
+        'starttime': current_time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'endtime': (current_time + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    response = requests.get(base_url, params=params, timeout=30)
+    with zipfile.ZipFile(BytesIO(response.content), 'r') as zip_ref:
+        zip_ref.extractall(out_dir)
+    return response.status_code
+
+def run_pool(base_url, hours, out_dir):
+    with Pool(NUM_PROCESSES) as pool:
+        pool.map(pool_download, [(base_url, out_dir, h) for h in hours])
+
+def run_client(base_url, hours, out_dir, max_in_flight, controller=None):
+    # Without a controller, start at the full limit so the run measures the client, not the ramp-up
+    if controller is None:
+        controller = HostController(host_of(base_url), max_limit=max_in_flight, initial=max_in_flight)
+    with DataselectClient(base_url, max_in_flight=max_in_flight, controller=controller) as client:
+        client.map(lambda h: client.download_and_extract("TX", "PB28", "HHZ", h, h + timedelta(hours=1), out_dir), hours)
+    return controller
+
+if __name__ == "__main__":
+    # Usage: python bench_client.py [num_hours] [throttle]
+    num_hours = int(sys.argv[1]) if len(sys.argv) > 1 else NUM_HOURS
+    throttle = len(sys.argv) > 2 and sys.argv[2] == "throttle"
+    server, base_url = start_server(latency=LATENCY, max_concurrent=THROTTLE_AT if throttle else None,
+                                    retry_after=1 if throttle else None)
+    start = datetime(2025, 1, 1)
+    hours = [start + timedelta(hours=i) for i in range(num_hours)]
+
+    results = []
+    if throttle:
+        # A fixed limit above what the server tolerates vs the AIMD controller finding it
+        host = host_of(base_url)
+        runs = [("Fixed 64 in flight", lambda d: run_client(base_url, hours, d, 64,
+                                                             HostController(host, 64, initial=64, min_limit=64))),
+                ("Adaptive, up to 64 in flight", lambda d: run_client(base_url, hours, d, 64,
+                                                                       HostController(host, 64)))]
+    else:
+        runs = [("Pool(%d) + requests.get" % NUM_PROCESSES, lambda d: run_pool(base_url, hours, d))]
+        for in_flight in (8, 64, 256):
+            runs.append((f"DataselectClient(max_in_flight={in_flight})",
+                         lambda d, n=in_flight: run_client(base_url, hours, d, n)))
+
+    for label, run in runs:
+        out_dir = tempfile.mkdtemp(prefix="bench_client_")
+        throttled_before = server.throttled
+        tic = time.time()
+        controller = run(out_dir)
+        toc = time.time()
+        shutil.rmtree(out_dir)
+        note = f"  {server.throttled - throttled_before} throttled"
+        if controller is not None:
+            note += f", final limit {int(controller.limit)}"
+        results.append((label, toc - tic, note))
+
+    server.shutdown()
+    print(f"\n{num_hours} hourly requests, {LATENCY * 1000:.0f} ms server latency"
+          + (f", 429 past {THROTTLE_AT} concurrent:" if throttle else ":"))
+    for label, seconds, note in results:
+        print(f"  {label:<40} {seconds:8.2f} s  {num_hours / seconds:8.1f} req/s{note}")
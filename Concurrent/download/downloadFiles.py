@@ -1,10 +1,6 @@
 import os
-from obspy import read
 from datetime import datetime, timedelta
-import requests
-from io import BytesIO
-import zipfile
-import time
+from fdsn_client import DataselectClient
 
 # URL for seismic waveform data in SAC.zip format
 base_url = "http://service.iris.edu/fdsnws/dataselect/1/query"
@@ -21,36 +17,15 @@ marco_disk_path = os.path.join('/', 'Volumes', 'Marco', 'SeismicData')
 # Create the directory if it doesn't exist
 os.makedirs(marco_disk_path, exist_ok=True)
 
+client = DataselectClient(base_url, max_in_flight=1)
+
 # Loop through each day from January 1, 2023, to January 31, 2023
 for day in range(1, 32):
     # Construct the date for the current iteration
     current_date = datetime(2022, 3, day, 0, 0, 0)
 
-    # Format the date in the required string format
-    current_date_str = current_date.strftime("%Y-%m-%dT%H:%M:%S")
-
-    # Construct the parameters for the request
-    params = {
-        'net': network,
-        'sta': station,
-        'cha': channel,
-        'format': format_type,
-        'starttime': current_date_str,
-        'endtime': (current_date + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M:%S"),
-    }
-
-    # Send HTTP request to get the SAC.zip file
-    response = requests.get(base_url, params=params)
-
-    # Check if the request was successful (status code 200)
-    if response.status_code == 200:
-        # Unzip the content directly without saving the intermediate ZIP file
-        with zipfile.ZipFile(BytesIO(response.content), 'r') as zip_ref:
-            zip_ref.extractall(marco_disk_path)
-
-        print(f"Downloaded and extracted files for {current_date}")
-
-    else:
-        # Print an error message if the request was not successful
-        print(f"Failed to retrieve data for {current_date}. Status code: {response.status_code}")
+    # Fetch the day; a 413 splits it into smaller windows instead of failing the day
+    client.download_and_extract(network, station, channel, current_date,
+                                current_date + timedelta(days=1), marco_disk_path)
 
+client.close()
@@ -1,11 +1,12 @@
 import os
-from obspy import read
+import sys
 from datetime import datetime, timedelta
-import requests
-from io import BytesIO
-import zipfile
-from multiprocessing import Pool
 import time
+from fdsn_client import DataselectClient
+from windows import WindowPlanner, window_key
+from waveform_cache import WaveformCache
+from manifest import DownloadManifest, MANIFEST_FILE_NAME
+from metrics import enable as enable_metrics, finish as finish_metrics
 
 # URL for seismic waveform data in SAC.zip format
 base_url = "http://service.iris.edu/fdsnws/dataselect/1/query"
@@ -26,53 +27,48 @@ os.makedirs(marco_disk_path, exist_ok=True)
 start_date = datetime(2023 ,12, 1, 0, 0, 0)
 end_date = datetime(2024, 5, 14, 23, 59, 59)
 
+# One shared client: pooled keep-alive connections, at most MAX_IN_FLIGHT requests at a time
+MAX_IN_FLIGHT = 64
+# Responses are kept in a local LRU cache, so re-running a range reads from disk instead of IRIS
+cache = WaveformCache(os.path.join(marco_disk_path, 'waveform_cache'))
+# Every window's status, bytes, members and sample coverage is recorded, so failures aren't lost
+manifest = DownloadManifest(os.path.join(marco_disk_path, MANIFEST_FILE_NAME))
+client = DataselectClient(base_url, max_in_flight=MAX_IN_FLIGHT, cache=cache, manifest=manifest)
+
+# Request windows start large and are halved on 413; learned sizes persist across runs
+planner = WindowPlanner(os.path.join(marco_disk_path, 'window_sizes.json'))
+
 # Function to download and extract data for a given time
 def download_and_extract_data(current_time):
-    current_time_str = current_time.strftime("%Y-%m-%dT%H:%M:%S")
-    params = {
-        'net': network,
-        'sta': station,
-        'cha': channel,
-        'format': format_type,
-        'starttime': current_time_str,
-        'endtime': (current_time + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S"),
-    }
+    return client.download_and_extract(network, station, channel, current_time,
+                                       current_time + timedelta(hours=1), marco_disk_path, planner)
 
-    max_retries = 3  # Number of retries for 413 error
-    retries = 0
+# Function to download and extract data for a planned (start, end) window
+def download_window(window):
+    return client.download_and_extract(network, station, channel, window[0], window[1], marco_disk_path, planner)
 
-    while retries < max_retries:
-        response = requests.get(base_url, params=params)
-
-        if response.status_code == 200:
-            with zipfile.ZipFile(BytesIO(response.content), 'r') as zip_ref:
-                zip_ref.extractall(marco_disk_path)
-            print(f"Downloaded and extracted files for {current_time}")
-            break
-        elif response.status_code == 413:
-            retries += 1
-            print(f"Retrying {current_time} (Retry {retries}) due to 413 error...")
-            time.sleep(5)  # Wait for a few seconds before retrying
-        else:
-            print(f"Failed to retrieve data for {current_time}. Status code: {response.status_code}")
-            break
+# Windows for the whole range, or with `resume` only the gaps the manifest has no finished window for
+def plan_windows(resume=False):
+    key = window_key(network, station, channel)
+    if not resume:
+        return planner.plan(key, start_date, end_date)
+    gaps = manifest.missing(network, station, channel, start_date, end_date)
+    return [window for gap in gaps for window in planner.plan(key, *gap)]
 
 if __name__ == "__main__":
+    # Usage: python downloader2.py [resume]
+    resume = len(sys.argv) > 1 and sys.argv[1] == "resume"
+    # HTTP latency/status/bytes and zip extraction times, written to metrics/ and reported at the end
+    enable_metrics(os.path.join(marco_disk_path, 'metrics'))
     tic = time.time()
-    # Specify the number of processes to use (adjust as needed)
-    
-    num_processes = 8 # we can change this to the desired number of processes
 
-    # Create a multiprocessing pool
-    with Pool(num_processes) as pool:
-        time_interval = timedelta(hours=1)
-        current_time = start_date
-        while current_time <= end_date:
-            pool.apply_async(download_and_extract_data, (current_time,))
-            current_time += time_interval
-        
-        pool.close()
-        pool.join()
-        
+    # All windows go through the shared client's I/O threads
+    with client:
+        windows = plan_windows(resume)
+        futures = [client.submit(download_window, window) for window in windows]
+        results = [f.result() for f in futures]
+
     toc = time.time()
     print('Done in {:.4f} seconds'.format(toc-tic))
+    finish_metrics()
+    print(f"{sum(r.startswith('Success') for r in results)} of {len(results)} windows downloaded")
@@ -0,0 +1,264 @@
+import time
+import zipfile
+import tempfile
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from windows import MIN_WINDOW, window_key
+from manifest import WindowTally
+from flow_control import controller_for, backoff_delay, retry_after_seconds, RETRY_STATUSES, MAX_RETRIES
+from metrics import METRICS
+from waveform_cache import clip_zip
+
+# URL for seismic waveform data in SAC.zip format
+IRIS_URL = "http://service.iris.edu/fdsnws/dataselect/1/query"
+# Data centers jobs can be routed to by name
+DATA_CENTERS = {
+    'IRIS': IRIS_URL,
+    'TEXNET': "http://rtserve.beg.utexas.edu/fdsnws/dataselect/1/query",
+}
+
+CHUNK_SIZE = 1024 * 1024           # Bytes read from the socket at a time
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024  # Responses larger than this spill from RAM to a temp file
+
+def iter_sac_members(zip_ref):
+    """Yields (name, bytes) for each SAC member, one member in memory at a time."""
+    for name in zip_ref.namelist():
+        if name.upper().endswith(".SAC"):
+            with zip_ref.open(name) as member:
+                yield name, member.read()
+
+def extract_all(zip_ref, out_dir):
+    """Extracts every member into out_dir, counting the bytes written as sac_bytes_out."""
+    zip_ref.extractall(out_dir)
+    METRICS.inc('sac_bytes_out', sum(info.file_size for info in zip_ref.infolist()))
+
+class DataselectClient:
+    """Threaded FDSN dataselect client sharing one pooled, keep-alive HTTP session.
+
+    Downloads are I/O bound, so threads waiting on sockets replace the old one-process-per-request
+    Pool; `max_in_flight` caps both the thread count and the connection pool, and defaults to the host's
+    HOST_MAX_IN_FLIGHT ceiling. How many of those threads may actually have a request out is decided per
+    host by a flow_control.HostController shared by every client of that host.
+    """
+
+    def __init__(self, base_url=IRIS_URL, max_in_flight=None, timeout=30, spool_dir=None, cache=None,
+                 controller=None, manifest=None):
+        self.base_url = base_url
+        self.timeout = timeout
+        self.spool_dir = spool_dir
+        self.cache = cache  # Optional WaveformCache, checked before every request
+        self.manifest = manifest  # Optional DownloadManifest, records the outcome of every fetched window
+        self.controller = controller if controller is not None else controller_for(base_url)
+        self.max_in_flight = max_in_flight if max_in_flight is not None else self.controller.max_limit
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.max_in_flight, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="dataselect")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+
+    def query(self, network, station, channel, start_time, end_time, format_type="sac.zip", stream=False):
+        """Issues one dataselect request and returns the response."""
+        params = {
+            'net': network,
+            'sta': station,
+            'cha': channel,
+            'format': format_type,
+            'starttime': start_time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'endtime': end_time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        return self.session.get(self.base_url, params=params, timeout=self.timeout, stream=stream)
+
+    def _spool(self, response):
+        """Copies a streamed response body into a spool file, chunk by chunk, and rewinds it."""
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY, dir=self.spool_dir)
+        for chunk in response.iter_content(CHUNK_SIZE):
+            spool.write(chunk)
+        spool.seek(0)
+        return spool
+
+    def _record(self, network, station, channel, window_start, window_end, result, tally=None):
+        """With a manifest, records the outcome of one window that was served or requested."""
+        if self.manifest is not None:
+            self.manifest.record(network, station, channel, window_start, window_end, result, tally)
+
+    def _deliver(self, network, station, channel, window_start, window_end, source, handle_zip):
+        """Passes one sac.zip to handle_zip, recording its members, bytes and coverage for its window."""
+        tally = WindowTally(handle_zip) if self.manifest is not None else handle_zip
+        with source, zipfile.ZipFile(source, 'r') as zip_ref, METRICS.timer('zip_extract'):
+            tally(zip_ref)
+        self._record(network, station, channel, window_start, window_end, "Success", tally)
+
+    def _read_cache(self, network, station, channel, start_time, end_time, handle_zip):
+        """Hands each cached entry overlapping the window to handle_zip and returns the gaps still to be requested.
+
+        Entries reaching past the window, or into time an earlier entry already served, are clipped first.
+        """
+        gaps = []
+        covered_until = start_time
+        for entry_start, entry_end, path in self.cache.covering(network, station, channel, start_time, end_time):
+            cached = self.cache.open_path(path)
+            if cached is None:
+                continue  # Corrupt, now evicted; its span stays in the next gap
+            if entry_start > covered_until:
+                gaps.append((covered_until, entry_start))
+            use_start, use_end = max(entry_start, covered_until), min(entry_end, end_time)
+            if (use_start, use_end) != (entry_start, entry_end):
+                with cached:
+                    cached = clip_zip(cached, use_start, use_end)
+            METRICS.inc('cache_hits')
+            self._deliver(network, station, channel, use_start, use_end, cached, handle_zip)
+            print(f"✅ Read {use_start} - {use_end} from the waveform cache")
+            covered_until = use_end
+        if covered_until < end_time:
+            gaps.append((covered_until, end_time))
+        return gaps
+
+    def fetch(self, network, station, channel, start_time, end_time, handle_zip, planner=None):
+        """Fetches a window as sac.zip and passes each opened zip to handle_zip, returning a status string.
+
+        Bodies are streamed into a spool file, so memory per request stays at SPOOL_MAX_MEMORY however
+        long the window is. With a cache, cached entries inside the window are served from disk, only the gaps
+        between them are requested, and each new response is stored. A 413 splits the window in half instead
+        of retrying it unchanged; with a WindowPlanner the smaller size is remembered for this channel (as it
+        is after a slow 200). 429/5xx replies, timeouts and dropped connections are retried with jittered
+        exponential backoff, or after Retry-After when given. With a manifest, every window actually served or requested is recorded
+        on its own, so a resume only asks again for the pieces that failed.
+        """
+        key = window_key(network, station, channel)
+        min_window = planner.min_window if planner is not None else MIN_WINDOW
+        # The cache is read before any planner split, so entries fetched with an earlier window size still count
+        pending = [(start_time, end_time)]
+        if self.cache is not None:
+            pending = self._read_cache(network, station, channel, start_time, end_time, handle_zip)
+        retries = {}
+        requests_made = 0
+
+        while pending:
+            window_start, window_end = pending.pop(0)
+            if planner is not None and window_end - window_start > planner.window_for(key):
+                # Already learned this is too large; split without paying for another 413
+                pending[0:0] = planner.plan(key, window_start, window_end)
+                continue
+            if self.cache is not None:
+                # Entries cached before their window was indexed are only found by their exact window
+                cached = self.cache.open(network, station, channel, window_start, window_end)
+                if cached is not None:
+                    METRICS.inc('cache_hits')
+                    self._deliver(network, station, channel, window_start, window_end, cached, handle_zip)
+                    print(f"✅ Read {window_start} - {window_end} from the waveform cache")
+                    continue
+
+            spool = None
+            error = None
+            retry_after = None
+            nbytes = 0
+            tic = time.perf_counter()
+            self.controller.acquire()
+            METRICS.observe('http_slot_wait', time.perf_counter() - tic)
+            tic = time.perf_counter()
+            try:
+                with self.query(network, station, channel, window_start, window_end, stream=True) as response:
+                    status_code = response.status_code
+                    retry_after = retry_after_seconds(response.headers.get('Retry-After'))
+                    if status_code == 200:
+                        spool = self._spool(response)
+                        nbytes = spool.seek(0, 2)
+                        spool.seek(0)
+            except requests.exceptions.RequestException as e:
+                # Timeouts included: a network blip says nothing about the window size, so it is retried, not split
+                status_code = None
+                error = e
+            finally:
+                elapsed = time.perf_counter() - tic
+                self.controller.release()
+            self.controller.record(status_code, elapsed, nbytes, retry_after)
+            requests_made += 1
+            METRICS.observe('http_request', elapsed)
+            METRICS.inc(f"http_status_{status_code or 'error'}")
+            METRICS.inc('http_bytes_in', nbytes)
+
+            if error is not None or status_code in RETRY_STATUSES:
+                reason = error if error is not None else f"status {status_code}"
+                attempt = retries.get((window_start, window_end), 0)
+                if attempt >= MAX_RETRIES:
+                    print(f"❌ Error fetching data for {window_start}: {reason}, giving up after {attempt} retries")
+                    result = f"Error: {window_start} ({reason})"
+                    self._record(network, station, channel, window_start, window_end, result)
+                    return result
+                retries[(window_start, window_end)] = attempt + 1
+                # With Retry-After the controller already holds back every request to this host
+                delay = 0 if retry_after is not None else backoff_delay(attempt)
+                print(f"⚠️ {reason} for {window_start}, retrying in {retry_after or delay:.1f} s...")
+                time.sleep(delay)
+                pending.insert(0, (window_start, window_end))
+                continue
+
+            if status_code == 200:
+                try:
+                    if self.cache is not None:
+                        # put refuses a zip that fails its CRC check, so a corrupt body is never cached
+                        self.cache.put(network, station, channel, window_start, window_end, spool)
+                    self._deliver(network, station, channel, window_start, window_end, spool, handle_zip)
+                except zipfile.BadZipFile as e:
+                    print(f"❌ Error extracting data for {window_start}: {e}")
+                    result = f"Error: {window_start} ({e})"
+                    self._record(network, station, channel, window_start, window_end, result)
+                    return result
+                if planner is not None:
+                    planner.record_success(key, window_start, window_end, elapsed)
+                print(f"✅ Downloaded files for {window_start} - {window_end}")
+            elif status_code == 204:
+                print(f"⚠️ No data for {window_start} - {window_end}")
+                self._record(network, station, channel, window_start, window_end, "Success")
+            elif status_code == 413:
+                if planner is not None:
+                    planner.record_too_large(key, window_start, window_end)
+                if window_end - window_start <= min_window:
+                    print(f"❌ 413 error for {window_start} even at the minimum window, giving up")
+                    result = f"Failed: {window_start} (413 error at minimum window)"
+                    self._record(network, station, channel, window_start, window_end, result)
+                    return result
+                # Whole seconds, since the query parameters drop fractions
+                middle = window_start + timedelta(seconds=(window_end - window_start).total_seconds() // 2)
+                pending[0:0] = [(window_start, middle), (middle, window_end)]
+                print(f"⚠️ Splitting {window_start} - {window_end} due to 413 error...")
+            else:
+                print(f"❌ Failed to retrieve data for {window_start}. Status code: {status_code}")
+                result = f"Failed: {window_start} (Status {status_code})"
+                self._record(network, station, channel, window_start, window_end, result)
+                return result
+
+        return f"Success: {start_time} ({requests_made} requests)"
+
+    def download_and_extract(self, network, station, channel, start_time, end_time, out_dir, planner=None):
+        """Fetches a window and extracts its members into out_dir, returning a status string."""
+        return self.fetch(network, station, channel, start_time, end_time,
+                          lambda zip_ref: extract_all(zip_ref, out_dir), planner)
+
+    def fetch_members(self, network, station, channel, start_time, end_time, handle_member, planner=None):
+        """Fetches a window and calls handle_member(name, data) per SAC member without touching out_dir."""
+        def handle_zip(zip_ref):
+            for name, data in iter_sac_members(zip_ref):
+                handle_member(name, data)
+        return self.fetch(network, station, channel, start_time, end_time, handle_zip, planner)
+
+    def submit(self, func, *args):
+        """Runs func(*args) on the client's I/O threads and returns a Future."""
+        return self.executor.submit(func, *args)
+
+    def map(self, func, items):
+        """Like Pool.map, but on the client's I/O threads; results come back in order."""
+        return list(self.executor.map(func, items))
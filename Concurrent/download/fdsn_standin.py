@@ -0,0 +1,148 @@
+import sys
+import time
+import random
+import zipfile
+import threading
+from io import BytesIO
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import synthetic_sac
+
+# Local stand-in for an FDSN dataselect endpoint, used for benchmarking the downloaders offline.
+# Besides latency it can cap per-connection bandwidth, answer 413 for windows longer than max_window
+# seconds, inject 5xx errors at a given rate and serve synthetic SAC traces instead of zero-filled members.
+QUERY_PATH = "/fdsnws/dataselect/1/query"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+WRITE_CHUNK = 64 * 1024
+INJECTED_STATUSES = (500, 502, 503, 504)
+
+def make_sac_zip(name, payload_bytes):
+    """Builds a sac.zip body holding one member of the given size."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_ref:
+        zip_ref.writestr(name, b'\0' * payload_bytes)
+    return buffer.getvalue()
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, like the real services
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != QUERY_PATH:
+            self.send_error(404)
+            return
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        config = self.server.config
+
+        # Throttling like a busy data center: past max_concurrent open requests, answer 429 + Retry-After
+        with self.server.lock:
+            self.server.active += 1
+            throttled = config['max_concurrent'] is not None and self.server.active > config['max_concurrent']
+            if throttled:
+                self.server.throttled += 1
+        try:
+            if throttled:
+                self.send_empty(429, config['retry_after'])
+                return
+            self.send_body(params, config)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+
+    def send_empty(self, status, retry_after=None):
+        self.send_response(status)
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def send_body(self, params, config):
+        time.sleep(config['latency'])
+
+        start_time = datetime.strptime(params.get('starttime', '2022-01-01T00:00:00'), TIME_FORMAT)
+        end_time = datetime.strptime(params.get('endtime', '2022-01-01T01:00:00'), TIME_FORMAT)
+        if config['max_window'] is not None and (end_time - start_time).total_seconds() > config['max_window']:
+            with self.server.lock:
+                self.server.too_large += 1
+            self.send_empty(413)
+            return
+        with self.server.lock:
+            status = self.server.random.choice(INJECTED_STATUSES) \
+                if self.server.random.random() < config['error_rate'] else None
+            if status is not None:
+                self.server.errors_injected += 1
+        if status is not None:
+            self.send_empty(status)
+            return
+
+        network, station, channel = params.get('net', 'XX'), params.get('sta', 'STA'), params.get('cha', 'HHZ')
+        if config['synthetic']:
+            body = synthetic_sac.make_sac_zip(network, station, channel, start_time, end_time)
+        else:
+            name = "{}.{}.00.{}.M.{}.SAC".format(network, station, channel, params.get('starttime', '').replace(':', ''))
+            body = make_sac_zip(name, config['payload_bytes'])
+        with self.server.lock:
+            self.server.requests_served += 1
+            self.server.bytes_served += len(body)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/zip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if config['bandwidth'] is None:
+            self.wfile.write(body)
+            return
+        # Per-connection bandwidth cap: write in chunks, sleeping as long as each chunk "takes" on the wire
+        for offset in range(0, len(body), WRITE_CHUNK):
+            chunk = body[offset:offset + WRITE_CHUNK]
+            self.wfile.write(chunk)
+            time.sleep(len(chunk) / config['bandwidth'])
+
+def start_server(port=0, latency=0.05, payload_bytes=100 * 3600 * 4, max_concurrent=None, retry_after=None,
+                 bandwidth=None, max_window=None, error_rate=0.0, synthetic=False, seed=0):
+    """Starts the stand-in on a background thread and returns (server, base_url).
+
+    bandwidth is bytes/s per connection, max_window the longest window (seconds) served before 413,
+    error_rate the fraction of requests answered with a random 5xx, and synthetic serves real SAC traces.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StandinHandler)
+    server.daemon_threads = True
+    server.config = {'latency': latency, 'payload_bytes': payload_bytes,
+                     'max_concurrent': max_concurrent, 'retry_after': retry_after,
+                     'bandwidth': bandwidth, 'max_window': max_window, 'error_rate': error_rate,
+                     'synthetic': synthetic}
+    server.lock = threading.Lock()
+    server.random = random.Random(seed)
+    server.requests_served = 0
+    server.bytes_served = 0
+    server.active = 0
+    server.throttled = 0
+    server.too_large = 0
+    server.errors_injected = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}{QUERY_PATH}"
+
+if __name__ == "__main__":
+    # Usage: python fdsn_standin.py [port] [latency_seconds] [max_concurrent] [retry_after_seconds]
+    #                               [bandwidth_bytes_per_s] [max_window_seconds] [error_rate] [synthetic]
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    max_concurrent = int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] != "-" else None
+    retry_after = int(sys.argv[4]) if len(sys.argv) > 4 and sys.argv[4] != "-" else None
+    bandwidth = float(sys.argv[5]) if len(sys.argv) > 5 and sys.argv[5] != "-" else None
+    max_window = float(sys.argv[6]) if len(sys.argv) > 6 and sys.argv[6] != "-" else None
+    error_rate = float(sys.argv[7]) if len(sys.argv) > 7 else 0.0
+    synthetic = len(sys.argv) > 8 and sys.argv[8] == "synthetic"
+    server, base_url = start_server(port, latency, max_concurrent=max_concurrent, retry_after=retry_after,
+                                    bandwidth=bandwidth, max_window=max_window, error_rate=error_rate,
+                                    synthetic=synthetic)
+    print(f"Serving stand-in dataselect at {base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
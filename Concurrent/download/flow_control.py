@@ -0,0 +1,132 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Per-host adaptive concurrency for dataselect: additive increase while replies are fast and clean,
+# multiplicative decrease on 429/5xx/timeouts, and a shared pause whenever the server sends Retry-After
+HOST_MAX_IN_FLIGHT = {'service.iris.edu': 32, 'rtserve.beg.utexas.edu': 8}
+DEFAULT_MAX_IN_FLIGHT = 8
+INITIAL_IN_FLIGHT = 4
+LATENCY_TARGET = 60       # Seconds; slower successful replies stop the limit from growing
+DECREASE_FACTOR = 0.5
+BACKOFF_BASE = 1.0        # Seconds before the first retry, doubled per attempt (with full jitter)
+BACKOFF_CAP = 120.0
+MAX_RETRIES = 6
+
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+def host_of(url):
+    return urlparse(url).netloc
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2 ** attempt)]."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+def retry_after_seconds(value):
+    """Parses a Retry-After header (delta-seconds or an HTTP date) into seconds, or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class HostController:
+    """AIMD limit on concurrent requests to one host, shared by every thread talking to it.
+
+    A clean reply under LATENCY_TARGET grows the limit by 1/limit (about one slot per round of replies);
+    a 429, 5xx or timeout halves it, at most once per round so a burst of failures counts as one signal.
+    Retry-After pauses the whole host, not just the request that got it.
+    """
+
+    def __init__(self, host, max_limit=DEFAULT_MAX_IN_FLIGHT, initial=INITIAL_IN_FLIGHT, min_limit=1,
+                 latency_target=LATENCY_TARGET):
+        self.host = host
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.latency_target = latency_target
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.stats = {'requests': 0, 'ok': 0, 'throttled': 0, 'errors': 0, 'bytes': 0, 'seconds': 0.0}
+        self._started = time.time()
+
+    def acquire(self):
+        """Blocks until the host is not paused and a slot under the current limit is free."""
+        with self._cond:
+            while True:
+                wait = self.paused_until - time.time()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def _decrease(self):
+        now = time.time()
+        # One cut per round trip: replies to requests sent before the last cut don't cut again
+        if now - self._last_decrease < self.stats['seconds'] / max(self.stats['requests'], 1):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+
+    def record(self, status_code, elapsed, nbytes=0, retry_after=None):
+        """Feeds one reply (status None for a timeout or connection error) into the limit."""
+        with self._cond:
+            self.stats['requests'] += 1
+            self.stats['seconds'] += elapsed
+            self.stats['bytes'] += nbytes
+            if status_code in (200, 204, 413):
+                # 413 is about the window size (see windows.py), not about load on the host
+                self.stats['ok'] += 1
+                if status_code != 413 and elapsed <= self.latency_target:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            elif status_code in THROTTLE_STATUSES:
+                self.stats['throttled'] += 1
+                self._decrease()
+            else:
+                self.stats['errors'] += 1
+                self._decrease()
+            if retry_after is not None:
+                self.paused_until = max(self.paused_until, time.time() + retry_after)
+            self._cond.notify_all()
+
+    def summary(self):
+        with self._cond:
+            rate = self.stats['bytes'] / max(time.time() - self._started, 1e-9)
+            return (f"{self.host}: limit {int(self.limit)}/{self.max_limit}, {self.stats['requests']} requests, "
+                    f"{self.stats['throttled']} throttled, {self.stats['errors']} errors, {rate / 1024 ** 2:.1f} MB/s")
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def controller_for(url):
+    """Returns the process-wide HostController for a URL's host, so all clients of one host share a limit.
+
+    The ceiling comes only from HOST_MAX_IN_FLIGHT; a client's own max_in_flight caps its thread count,
+    so whichever client happens to be created first doesn't set the limit for the others.
+    """
+    host = host_of(url)
+    with _controllers_lock:
+        if host not in _controllers:
+            _controllers[host] = HostController(host, max_limit=HOST_MAX_IN_FLIGHT.get(host, DEFAULT_MAX_IN_FLIGHT))
+        return _controllers[host]
@@ -0,0 +1,163 @@
+import sys
+import json
+import time
+import struct
+import sqlite3
+import threading
+from datetime import datetime
+
+# Durable record of every requested window: status, bytes, member files and real sample coverage
+MANIFEST_FILE_NAME = "download_manifest.sqlite"
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+COMPLETE_FRACTION = 0.99  # A window whose samples cover less than this is recorded as 'partial'
+DONE_STATUSES = ('ok', 'nodata')  # Never re-queued by resume ('partial' only on request)
+
+def sac_coverage(data):
+    """Seconds of samples in a SAC file, from the binary header alone (delta * npts)."""
+    # nvhdr (int 6 of the header) is always 6, which tells the byte order
+    order = '<' if struct.unpack_from('<i', data, 280 + 6 * 4)[0] == 6 else '>'
+    delta = struct.unpack_from(order + 'f', data, 0)[0]
+    npts = struct.unpack_from(order + 'i', data, 280 + 9 * 4)[0]
+    return delta * npts
+
+def status_of(result):
+    """Maps a DataselectClient status string to a manifest status."""
+    if result.startswith("Success"):
+        return 'ok'
+    if result.startswith("Failed"):
+        return 'failed'
+    return 'error'
+
+class WindowTally:
+    """Wraps a handle_zip callback and counts members, bytes and sample coverage on the way through."""
+
+    def __init__(self, handle_zip):
+        self.handle_zip = handle_zip
+        self.members = []
+        self.bytes = 0
+        self.coverage = 0.0
+
+    def __call__(self, zip_ref):
+        for info in zip_ref.infolist():
+            if info.filename.upper().endswith(".SAC"):
+                self.members.append(info.filename)
+                self.bytes += info.file_size
+                with zip_ref.open(info) as member:
+                    self.coverage += sac_coverage(member.read(632))
+        self.handle_zip(zip_ref)
+
+class DownloadManifest:
+    """SQLite table of (net, sta, cha, start, end) windows with their outcome; safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS windows (network TEXT, station TEXT, channel TEXT, "
+                         "window_start TEXT, window_end TEXT, status TEXT, bytes INTEGER, members TEXT, coverage REAL, "
+                         "expected REAL, attempts INTEGER, message TEXT, updated REAL, "
+                         "PRIMARY KEY (network, station, channel, window_start, window_end))")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def record(self, network, station, channel, start_time, end_time, result, tally=None):
+        """Stores the outcome of one window; a successful window with too few samples becomes 'partial'."""
+        expected = (end_time - start_time).total_seconds()
+        status = status_of(result)
+        members = tally.members if tally is not None else []
+        coverage = min(tally.coverage, expected) if tally is not None else 0.0
+        if status == 'ok' and not members:
+            status = 'nodata'
+        elif status == 'ok' and coverage < expected * COMPLETE_FRACTION:
+            status = 'partial'
+        key = (network, station, channel, start_time.strftime(TIME_FORMAT), end_time.strftime(TIME_FORMAT))
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM windows WHERE network = ? AND station = ? AND channel = ? "
+                                   "AND window_start = ? AND window_end = ?", key).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            self._db.execute("INSERT OR REPLACE INTO windows VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             key + (status, tally.bytes if tally is not None else 0, json.dumps(members),
+                                    coverage, expected, attempts, result, time.time()))
+            self._db.commit()
+        return status
+
+    def windows(self, network, station, channel, start_time=None, end_time=None):
+        """Returns (start, end, status, bytes, coverage, expected) rows overlapping [start_time, end_time)."""
+        query = ("SELECT window_start, window_end, status, bytes, coverage, expected FROM windows "
+                 "WHERE network = ? AND station = ? AND channel = ?")
+        args = [network, station, channel]
+        if start_time is not None:
+            query += " AND window_end > ?"
+            args.append(start_time.strftime(TIME_FORMAT))
+        if end_time is not None:
+            query += " AND window_start < ?"
+            args.append(end_time.strftime(TIME_FORMAT))
+        with self._lock:
+            rows = self._db.execute(query + " ORDER BY window_start", args).fetchall()
+        return [(datetime.strptime(s, TIME_FORMAT), datetime.strptime(e, TIME_FORMAT), status, nbytes, cov, exp)
+                for s, e, status, nbytes, cov, exp in rows]
+
+    def missing(self, network, station, channel, start_time, end_time, retry_partial=False):
+        """Gaps in [start_time, end_time) not yet covered by a finished window, as (start, end) ranges.
+
+        Windows may have been requested at any size, so this works on time ranges rather than window keys:
+        re-plan the gaps with the WindowPlanner to get the requests to make.
+        """
+        done = DONE_STATUSES + (() if retry_partial else ('partial',))
+        gaps = []
+        current_time = start_time
+        for window_start, window_end, status, _, _, _ in self.windows(network, station, channel, start_time, end_time):
+            if status not in done:
+                continue
+            if window_start > current_time:
+                gaps.append((current_time, window_start))
+            current_time = max(current_time, window_end)
+        if current_time < end_time:
+            gaps.append((current_time, end_time))
+        return gaps
+
+    def report(self, network, station, channel, start_time=None, end_time=None):
+        """Per-month summary: {month: {'windows', 'bytes', 'coverage', 'expected', <status>: count}}."""
+        months = {}
+        for window_start, _, status, nbytes, coverage, expected in self.windows(network, station, channel,
+                                                                                start_time, end_time):
+            month = months.setdefault(window_start.strftime("%Y-%m"),
+                                      {'windows': 0, 'bytes': 0, 'coverage': 0.0, 'expected': 0.0})
+            month['windows'] += 1
+            month['bytes'] += nbytes
+            month['coverage'] += coverage
+            month['expected'] += expected
+            month[status] = month.get(status, 0) + 1
+        return months
+
+    def channels(self):
+        with self._lock:
+            return self._db.execute("SELECT DISTINCT network, station, channel FROM windows "
+                                    "ORDER BY network, station, channel").fetchall()
+
+if __name__ == "__main__":
+    # Usage: python manifest.py report <manifest.sqlite> [NET.STA.CHA]
+    #        python manifest.py missing <manifest.sqlite> <NET.STA.CHA> <start YYYY-MM-DD> <end YYYY-MM-DD>
+    command = sys.argv[1]
+    manifest = DownloadManifest(sys.argv[2])
+    if command == "report":
+        channels = [tuple(sys.argv[3].split('.'))] if len(sys.argv) > 3 else manifest.channels()
+        for network, station, channel in channels:
+            print(f"{network}.{station}.{channel}")
+            for month, row in sorted(manifest.report(network, station, channel).items()):
+                statuses = ", ".join(f"{row[s]} {s}" for s in ('ok', 'partial', 'nodata', 'failed', 'error') if s in row)
+                percent = 100 * row['coverage'] / row['expected'] if row['expected'] else 0
+                print(f"  {month}  {percent:6.2f}% covered  {row['bytes'] / 1024 ** 2:10.1f} MB  {statuses}")
+    elif command == "missing":
+        network, station, channel = sys.argv[3].split('.')
+        start_time = datetime.strptime(sys.argv[4], "%Y-%m-%d")
+        end_time = datetime.strptime(sys.argv[5], "%Y-%m-%d")
+        gaps = manifest.missing(network, station, channel, start_time, end_time)
+        for gap_start, gap_end in gaps:
+            print(f"{gap_start:%Y-%m-%dT%H:%M:%S}  {gap_end:%Y-%m-%dT%H:%M:%S}")
+        print(f"{len(gaps)} gaps, {sum((e - s).total_seconds() for s, e in gaps) / 86400:.2f} days missing")
+    else:
+        print(f"Unknown command: {command}")
@@ -0,0 +1,292 @@
+import os
+import re
+import sys
+import glob
+import json
+import time
+import bisect
+import fnmatch
+import resource
+import threading
+import multiprocessing
+import multiprocessing.util
+from collections import Counter
+from contextlib import contextmanager
+
+# Instrumentation shared by the downloaders and the detector: counters (bytes in and out, files, statuses), latency
+# histograms per stage and RSS, kept per process in METRICS. After enable(folder), which pool workers inherit
+# through METRICS_DIR_ENV, every process writes its own proc-<pid>.json at most once per WRITE_INTERVAL while
+# it is busy, and the main process merges them into metrics.json + metrics.prom (Prometheus text format) every
+# SNAPSHOT_INTERVAL. finish() writes the final snapshot and prints the end-of-run report. Workers write once more
+# when they exit normally, so close() + join() pools before finish(); terminated workers can miss their last
+# WRITE_INTERVAL of counts.
+METRICS_DIR_ENV = "SEISMIC_METRICS_DIR"
+PROFILE_ENV = "SEISMIC_PROFILE"    # fnmatch pattern of file names to run under the sampling profiler
+WRITE_INTERVAL = 1.0
+SNAPSHOT_INTERVAL = 10
+PROFILE_INTERVAL = 0.005           # seconds between stack samples
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def rss_bytes():
+    """Current resident set size (the peak where /proc is missing, e.g. on macOS)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss_bytes()
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # bytes on macOS, KiB on Linux
+
+def quantile(counts, q):
+    """Upper bucket bound below which a fraction q of the observations fall (inf past the last bucket)."""
+    total = sum(counts)
+    if total == 0:
+        return None
+    running = 0
+    for i, count in enumerate(counts):
+        running += count
+        if running >= q * total:
+            return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+
+class Metrics:
+    """Per-process counters, gauges and latency histograms (BUCKETS, in seconds); all methods are thread-safe."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.counters = Counter()
+        self.gauges = {}
+        self.histograms = {}  # name -> [counts per bucket + overflow, sum of seconds]
+        self.folder = None
+        self.main = False
+        self._last_write = 0.0
+        self._last_merge = 0.0
+        self._finalizer_pid = None
+
+    def inc(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+        if self.folder is not None:
+            self._maybe_write()
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+        if self.folder is not None:
+            self._maybe_write()
+
+    def observe(self, name, seconds):
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [[0] * (len(BUCKETS) + 1), 0.0]
+            histogram[0][i] += 1
+            histogram[1] += seconds
+        if self.folder is not None:
+            self._maybe_write()
+
+    @contextmanager
+    def timer(self, name):
+        """Times the block into histogram `name` (exceptions included)."""
+        tic = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - tic)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'pid': os.getpid(),
+                'role': multiprocessing.current_process().name,
+                'time': time.time(),
+                'rss_bytes': rss_bytes(),
+                'peak_rss_bytes': peak_rss_bytes(),
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'histograms': {name: {'counts': list(counts), 'sum': total}
+                               for name, (counts, total) in self.histograms.items()},
+            }
+
+    def attach(self, folder, main=False):
+        self.folder = folder
+        self.main = main
+
+    def write(self):
+        """Writes this process's snapshot to <folder>/proc-<pid>.json."""
+        self._last_write = time.time()
+        path = os.path.join(self.folder, f"proc-{os.getpid()}.json")
+        _write_json(path, self.snapshot())
+
+    def _maybe_write(self):
+        if self._finalizer_pid != os.getpid():
+            # Also write on a normal process exit; registered lazily because pool workers clear
+            # the finalizer registry when they start
+            self._finalizer_pid = os.getpid()
+            multiprocessing.util.Finalize(None, self.write, exitpriority=100)
+        now = time.time()
+        if now - self._last_write < WRITE_INTERVAL or not self._write_lock.acquire(blocking=False):
+            return  # Recently written, or another thread is writing right now
+        try:
+            self.write()
+            if self.main and now - self._last_merge >= SNAPSHOT_INTERVAL:
+                self._last_merge = now
+                write_merged(self.folder)
+        finally:
+            self._write_lock.release()
+
+METRICS = Metrics()
+if hasattr(os, 'register_at_fork'):
+    # A forked worker starts from zero (with a fresh lock) but keeps writing snapshots if they were enabled
+    def _after_fork():
+        folder = METRICS.folder
+        METRICS._reset()
+        METRICS.attach(folder)
+    os.register_at_fork(after_in_child=_after_fork)
+if os.environ.get(METRICS_DIR_ENV):
+    METRICS.attach(os.environ[METRICS_DIR_ENV])  # A spawned worker of a process that called enable()
+
+def _write_json(path, payload):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(payload, f)
+    os.replace(path + ".tmp", path)
+
+def enable(folder):
+    """Turns on snapshot files for this process and every worker started after this call."""
+    os.makedirs(folder, exist_ok=True)
+    for path in glob.glob(os.path.join(folder, "proc-*.json")):
+        os.remove(path)  # Left over from an earlier run
+    os.environ[METRICS_DIR_ENV] = folder
+    METRICS.attach(folder, main=True)
+
+def merge(folder):
+    """Sums counters and histograms over every process snapshot in folder; processes are listed separately."""
+    merged = {'time': time.time(), 'counters': Counter(), 'histograms': {}, 'processes': []}
+    for path in sorted(glob.glob(os.path.join(folder, "proc-*.json"))):
+        try:
+            with open(path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            continue
+        merged['counters'].update(snapshot['counters'])
+        for name, histogram in snapshot['histograms'].items():
+            total = merged['histograms'].setdefault(name, {'counts': [0] * (len(BUCKETS) + 1), 'sum': 0.0})
+            total['counts'] = [a + b for a, b in zip(total['counts'], histogram['counts'])]
+            total['sum'] += histogram['sum']
+        merged['processes'].append({key: snapshot[key] for key in ('pid', 'role', 'rss_bytes', 'peak_rss_bytes', 'gauges')})
+    merged['counters'] = dict(merged['counters'])
+    return merged
+
+def _metric_name(name):
+    return "seismic_" + re.sub(r'[^a-zA-Z0-9_]', '_', name)
+
+def to_prometheus(merged):
+    """Prometheus text exposition format of a merged snapshot."""
+    lines = []
+    for name, value in sorted(merged['counters'].items()):
+        metric = _metric_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, histogram in sorted(merged['histograms'].items()):
+        metric = _metric_name(name) + "_seconds"
+        lines.append(f"# TYPE {metric} histogram")
+        running = 0
+        for bound, count in zip(list(BUCKETS) + ["+Inf"], histogram['counts']):
+            running += count
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {running}')
+        lines += [f"{metric}_sum {histogram['sum']}", f"{metric}_count {running}"]
+    for key in ('rss_bytes', 'peak_rss_bytes'):
+        metric = _metric_name("process_" + key)
+        lines.append(f"# TYPE {metric} gauge")
+        lines += [f'{metric}{{pid="{p["pid"]}",role="{p["role"]}"}} {p[key]}' for p in merged['processes']]
+    return "\n".join(lines) + "\n"
+
+def write_merged(folder):
+    merged = merge(folder)
+    _write_json(os.path.join(folder, "metrics.json"), merged)
+    with open(os.path.join(folder, "metrics.prom.tmp"), 'w') as f:
+        f.write(to_prometheus(merged))
+    os.replace(os.path.join(folder, "metrics.prom.tmp"), os.path.join(folder, "metrics.prom"))
+    return merged
+
+def format_report(merged):
+    lines = [f"  {'stage':<20} {'count':>8} {'total s':>9} {'mean ms':>9} {'p50 ms':>8} {'p99 ms':>8}"]
+    for name, histogram in sorted(merged['histograms'].items(), key=lambda item: -item[1]['sum']):
+        count = sum(histogram['counts'])
+        p50, p99 = quantile(histogram['counts'], 0.5), quantile(histogram['counts'], 0.99)
+        lines.append(f"  {name:<20} {count:>8} {histogram['sum']:>9.2f} {histogram['sum'] / count * 1000:>9.2f} "
+                     f"{'≤' + format(p50 * 1000, 'g'):>8} {'≤' + format(p99 * 1000, 'g'):>8}")
+    for name, value in sorted(merged['counters'].items()):
+        lines.append(f"  {name:<20} {value:>8}")
+    for process in merged['processes']:
+        lines.append(f"  {process['role']:<20} pid {process['pid']}: RSS {process['rss_bytes'] / 2**20:.0f} MB "
+                     f"(peak {process['peak_rss_bytes'] / 2**20:.0f} MB)")
+    return "\n".join(lines)
+
+def finish():
+    """Writes the final merged snapshot and prints the end-of-run report; returns the merged metrics."""
+    if METRICS.folder is None:
+        snapshot = METRICS.snapshot()
+        merged = {'counters': snapshot['counters'], 'histograms': snapshot['histograms'], 'processes': [snapshot]}
+    else:
+        METRICS.write()
+        merged = write_merged(METRICS.folder)
+    print("📊 Metrics:\n" + format_report(merged))
+    return merged
+
+class SamplingProfiler:
+    """Samples one thread's Python stack every PROFILE_INTERVAL and counts folded stacks (flamegraph.pl input)."""
+
+    def __init__(self, thread_id=None, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_code.co_name} ({os.path.basename(frame.f_code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+@contextmanager
+def profile(name):
+    """Runs the block under the sampling profiler when name matches PROFILE_ENV (e.g. '*2022.061.00*').
+
+    The folded stacks go to <metrics folder or cwd>/profile-<name>.folded.
+    """
+    pattern = os.environ.get(PROFILE_ENV)
+    if not pattern or not fnmatch.fnmatch(os.path.basename(name), pattern):
+        yield
+        return
+    profiler = SamplingProfiler()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        path = os.path.join(METRICS.folder or os.getcwd(), f"profile-{os.path.basename(name)}.folded")
+        profiler.write(path)
+        print(f"🔬 {sum(profiler.stacks.values())} stack samples for {name} written to {path}")
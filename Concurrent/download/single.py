@@ -1,10 +1,12 @@
-from obspy import read
-from datetime import datetime, timedelta
-import requests
-from io import BytesIO
-import zipfile
+from datetime import datetime
 import time
 import os
+import sys
+from fdsn_client import DataselectClient
+from windows import WindowPlanner, window_key
+from waveform_cache import WaveformCache
+from manifest import DownloadManifest, MANIFEST_FILE_NAME
+from metrics import enable as enable_metrics, finish as finish_metrics
 
 # URL for seismic waveform data in SAC.zip format
 base_url = "http://rtserve.beg.utexas.edu/fdsnws/dataselect/1/query"
@@ -25,50 +27,35 @@ os.makedirs(marco_disk_path, exist_ok=True)
 start_date = datetime(2020,8, 20, 0, 0, 0)
 end_date = datetime(2023, 12, 31, 23, 59, 59)
 
-# Function to download and extract data for a given time
-def download_and_extract_data(current_time):
-    current_time_str = current_time.strftime("%Y-%m-%dT%H:%M:%S")
-    params = {
-        'net': network,
-        'sta': station,
-        'cha': channel,
-        'format': format_type,
-        'starttime': current_time_str,
-        'endtime': (current_time + timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S"),
-    }
+# Sequential: one request in flight, windows sized by the planner (halved on 413, remembered per channel)
+manifest = DownloadManifest(os.path.join(marco_disk_path, MANIFEST_FILE_NAME))
+client = DataselectClient(base_url, max_in_flight=1, cache=WaveformCache(os.path.join(marco_disk_path, 'waveform_cache')),
+                          manifest=manifest)
+planner = WindowPlanner(os.path.join(marco_disk_path, 'window_sizes.json'))
+key = window_key(network, station, channel)
 
-    max_retries = 3  # Number of retries for 413 error
-    retries = 0
+# Function to download and extract data for a given window
+def download_and_extract_data(current_time, next_time):
+    return client.download_and_extract(network, station, channel, current_time, next_time, marco_disk_path, planner)
 
-    while retries < max_retries:
-        response = requests.get(base_url, params=params)
 
-        if response.status_code == 200:
-            # Check if the content is a valid ZIP file
-            try:
-                with zipfile.ZipFile(BytesIO(response.content), 'r') as zip_ref:
-                    zip_ref.extractall(marco_disk_path)
-                print(f"Downloaded and extracted files for {current_time}")
-            except zipfile.BadZipFile:
-                print(f"Error: Response content is not a valid ZIP file.")
-            break
-        elif response.status_code == 413:
-            retries += 1
-            print(f"Retrying {current_time} (Retry {retries}) due to 413 error...")
-            time.sleep(5)  # Wait for a few seconds before retrying
-        else:
-            print(f"Failed to retrieve data for {current_time}. Status code: {response.status_code}")
-            break
-
-
-# Download and extract data for each hour in the time range
+# Download and extract data window by window over the time range
+# (python single.py resume: only the gaps the manifest has no finished window for)
+enable_metrics(os.path.join(marco_disk_path, 'metrics'))
 tic = time.time()
-time_interval = timedelta(hours=1)
-current_time = start_date
-
-while current_time <= end_date:
-    download_and_extract_data(current_time)
-    current_time += time_interval
-
+if len(sys.argv) > 1 and sys.argv[1] == "resume":
+    ranges = manifest.missing(network, station, channel, start_date, end_date)
+else:
+    ranges = [(start_date, end_date)]
+
+for range_start, range_end in ranges:
+    current_time = range_start
+    while current_time < range_end:
+        next_time = min(current_time + planner.window_for(key), range_end)
+        download_and_extract_data(current_time, next_time)
+        current_time = next_time
+
+client.close()
 toc = time.time()
 print('Done in {:.4f} seconds'.format(toc-tic))
+finish_metrics()
@@ -0,0 +1,96 @@
+import os
+import sys
+import zlib
+import zipfile
+from functools import lru_cache
+from io import BytesIO
+from datetime import datetime, timedelta
+import numpy as np
+
+# Synthetic SAC data for benchmarks: white noise plus decaying 10 Hz bursts (above the 5 Hz highpass)
+# at known times, so the detection path has real work to do and known events to find.
+SAMPLING_RATE = 100.0
+EVENT_FREQ = 10.0         # Hz
+EVENT_DECAY = 1.0         # seconds (e-folding)
+EVENT_AMPLITUDE = 30.0    # times the noise level
+EVENTS_PER_HOUR = 4
+CACHED_MEMBERS = 96       # Hourly members the stand-in keeps in memory (~1.4 MB each at 100 Hz)
+
+def event_times(start_time, seconds, events_per_hour=EVENTS_PER_HOUR, seed=0):
+    """Deterministic event onsets (seconds from start), at least a minute from the edges and from each other."""
+    count = int(round(events_per_hour * seconds / 3600))
+    if count == 0 or seconds < 180:
+        return []
+    rng = np.random.default_rng(seed)
+    slots = np.arange(60, seconds - 60, 60)
+    return sorted(float(t) for t in rng.choice(slots, size=min(count, len(slots)), replace=False))
+
+def make_samples(seconds, sampling_rate=SAMPLING_RATE, events=(), seed=0):
+    """Float32 noise with a burst starting at each event time (seconds from the first sample)."""
+    rng = np.random.default_rng(seed)
+    npts = int(seconds * sampling_rate)
+    data = rng.standard_normal(npts).astype(np.float32)
+    burst_t = np.arange(int(8 * EVENT_DECAY * sampling_rate)) / sampling_rate
+    burst = (EVENT_AMPLITUDE * np.exp(-burst_t / EVENT_DECAY) * np.sin(2 * np.pi * EVENT_FREQ * burst_t)).astype(np.float32)
+    for t in events:
+        i = int(t * sampling_rate)
+        n = min(len(burst), npts - i)
+        if n > 0:
+            data[i:i + n] += burst[:n]
+    return data
+
+def make_sac_bytes(network, station, channel, start_time, seconds, sampling_rate=SAMPLING_RATE,
+                   events_per_hour=EVENTS_PER_HOUR, seed=None):
+    """Returns (SAC bytes, event onset datetimes) for one synthetic trace; the same inputs give the same bytes."""
+    from obspy import Trace, UTCDateTime
+
+    if seed is None:
+        seed = int(start_time.timestamp()) ^ zlib.crc32(f"{network}.{station}.{channel}".encode())
+    events = event_times(start_time, seconds, events_per_hour, seed)
+    trace = Trace(make_samples(seconds, sampling_rate, events, seed))
+    trace.stats.network, trace.stats.station, trace.stats.location, trace.stats.channel = network, station, "00", channel
+    trace.stats.sampling_rate = sampling_rate
+    trace.stats.starttime = UTCDateTime(start_time)
+    buffer = BytesIO()
+    trace.write(buffer, format="SAC")
+    return buffer.getvalue(), [start_time + timedelta(seconds=t) for t in events]
+
+def sac_name(network, station, channel, start_time):
+    return "{}.{}.00.{}.M.{}.SAC".format(network, station, channel, start_time.strftime("%Y.%j.%H%M%S"))
+
+@lru_cache(maxsize=CACHED_MEMBERS)
+def cached_member(network, station, channel, start_time, seconds, sampling_rate=SAMPLING_RATE):
+    """SAC bytes of one member; generating and encoding a trace costs far more than serving it."""
+    return make_sac_bytes(network, station, channel, start_time, seconds, sampling_rate)[0]
+
+def make_sac_zip(network, station, channel, start_time, end_time, sampling_rate=SAMPLING_RATE):
+    """A sac.zip body like dataselect returns: one member per hour of the window."""
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as zip_ref:
+        current_time = start_time
+        while current_time < end_time:
+            next_time = min(current_time + timedelta(hours=1), end_time)
+            data = cached_member(network, station, channel, current_time,
+                                 (next_time - current_time).total_seconds(), sampling_rate)
+            zip_ref.writestr(sac_name(network, station, channel, current_time), data)
+            current_time = next_time
+    return buffer.getvalue()
+
+def write_folder(folder, start_time, hours, network="TX", station="PB28", channel="HHZ", seconds=3600):
+    """Writes `hours` consecutive synthetic SAC files into folder and returns every injected event time."""
+    os.makedirs(folder, exist_ok=True)
+    events = []
+    for i in range(hours):
+        current_time = start_time + timedelta(seconds=i * seconds)
+        data, file_events = make_sac_bytes(network, station, channel, current_time, seconds)
+        with open(os.path.join(folder, sac_name(network, station, channel, current_time)), 'wb') as f:
+            f.write(data)
+        events += file_events
+    return events
+
+if __name__ == "__main__":
+    # Usage: python synthetic_sac.py <folder> [hours] [start YYYY-MM-DD]
+    hours = int(sys.argv[2]) if len(sys.argv) > 2 else 24
+    start_time = datetime.strptime(sys.argv[3], "%Y-%m-%d") if len(sys.argv) > 3 else datetime(2022, 3, 1)
+    events = write_folder(sys.argv[1], start_time, hours)
+    print(f"✅ Wrote {hours} hourly SAC files with {len(events)} injected events to {sys.argv[1]}")
@@ -0,0 +1,318 @@
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import hashlib
+import zipfile
+import tempfile
+import threading
+from datetime import datetime
+
+# Local cache of dataselect responses, so reprocessing reads from disk instead of the WAN
+DEFAULT_MAX_BYTES = 200 * 1024 ** 3  # 200 GB, evicted least-recently-used first
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"  # Sorts like the times it encodes, so coverage lookups are string comparisons
+COVERAGE_COLUMNS = ('network', 'station', 'channel', 'start_time', 'end_time')
+
+def cache_key(network, station, channel, start_time, end_time):
+    """Content address of a request window: sha1 of net.sta.cha and the start/end times."""
+    text = "{}.{}.{}.{}.{}".format(network, station, channel, start_time.strftime(TIME_FORMAT), end_time.strftime(TIME_FORMAT))
+    return hashlib.sha1(text.encode()).hexdigest()
+
+def test_zip(source):
+    """Raises zipfile.BadZipFile unless source (a path, or a file object that is rewound) opens and every member passes its CRC."""
+    with zipfile.ZipFile(source, 'r') as zip_ref:
+        bad_member = zip_ref.testzip()
+    if not isinstance(source, str):
+        source.seek(0)
+    if bad_member is not None:
+        raise zipfile.BadZipFile(f"bad CRC in {bad_member}")
+
+def zip_to_mseed(zip_file, mseed_path):
+    """Re-encodes the SAC members of a sac.zip as one miniSEED file (STEIM2 when samples are integer counts)."""
+    import numpy as np
+    from io import BytesIO
+    from obspy import read, Stream
+
+    stream = Stream()
+    with zipfile.ZipFile(zip_file, 'r') as zip_ref:
+        for name in zip_ref.namelist():
+            if name.upper().endswith(".SAC"):
+                stream += read(BytesIO(zip_ref.read(name)), format="SAC")
+    for tr in stream:
+        if np.array_equal(tr.data, np.round(tr.data)):
+            tr.data = tr.data.astype(np.int32)
+    encoding = "STEIM2" if all(tr.data.dtype == np.int32 for tr in stream) else "FLOAT32"
+    stream.write(mseed_path, format="MSEED", encoding=encoding)
+
+def mseed_to_zip(mseed_path):
+    """Rebuilds a sac.zip (in a spool file) from a cached miniSEED file. Only the basic SAC headers survive."""
+    from io import BytesIO
+    from obspy import read
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    with zipfile.ZipFile(spool, 'w', zipfile.ZIP_STORED) as zip_ref:
+        for tr in read(mseed_path, format="MSEED"):
+            tr.data = tr.data.astype('float32')
+            member = BytesIO()
+            tr.write(member, format="SAC")
+            name = "{}.{}.{}.{}.M.{}.SAC".format(tr.stats.network, tr.stats.station, tr.stats.location,
+                                                 tr.stats.channel, tr.stats.starttime.strftime("%Y.%j.%H%M%S"))
+            zip_ref.writestr(name, member.getvalue())
+    spool.seek(0)
+    return spool
+
+def clip_zip(zip_file, start_time, end_time):
+    """Rebuilds a sac.zip (in a spool file) with only the samples in [start_time, end_time), for a cache entry
+    that reaches past the window asked for. Members already inside the window are copied unchanged."""
+    from io import BytesIO
+    from obspy import read, UTCDateTime
+
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    with zipfile.ZipFile(zip_file, 'r') as source, zipfile.ZipFile(spool, 'w', zipfile.ZIP_STORED) as zip_ref:
+        for name in source.namelist():
+            if not name.upper().endswith(".SAC"):
+                continue
+            data = source.read(name)
+            tr = read(BytesIO(data), format="SAC")[0]
+            npts = tr.stats.npts
+            # trim keeps both ends, so stop half a sample early and leave end_time to the next window
+            tr.trim(UTCDateTime(start_time), UTCDateTime(end_time) - tr.stats.delta / 2, nearest_sample=False)
+            if tr.stats.npts == npts:
+                zip_ref.writestr(name, data)
+            elif tr.stats.npts > 0:
+                member = BytesIO()
+                tr.write(member, format="SAC")
+                name = "{}.{}.{}.{}.M.{}.SAC".format(tr.stats.network, tr.stats.station, tr.stats.location,
+                                                     tr.stats.channel, tr.stats.starttime.strftime("%Y.%j.%H%M%S"))
+                zip_ref.writestr(name, member.getvalue())
+    spool.seek(0)
+    return spool
+
+class WaveformCache:
+    """Size-capped, LRU-evicted cache of sac.zip responses keyed by net/sta/cha/time window.
+
+    Entries live under <root>/<ab>/<sha1>.zip (or .mseed with compress="mseed"); a small SQLite
+    index tracks sizes, last access and the window each entry covers, so `covering` finds entries
+    overlapping a range whatever window sizes they were fetched with. Only zips that pass test_zip are
+    stored, and an entry that fails to open is evicted. Safe to share between threads of one process.
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES, compress=None):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.compress = compress
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite"), check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries "
+                         "(key TEXT PRIMARY KEY, path TEXT, size INTEGER, last_access REAL)")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(entries)")]
+        for column in COVERAGE_COLUMNS:
+            if column not in columns:
+                # Entries from before coverage was tracked are still found by their exact window
+                try:
+                    self._db.execute(f"ALTER TABLE entries ADD COLUMN {column} TEXT")
+                except sqlite3.OperationalError as e:
+                    if "duplicate column" not in str(e):
+                        raise  # Otherwise another thread or process opening the cache added it first
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_coverage ON entries (network, station, channel, start_time)")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, network, station, channel, start_time, end_time):
+        """Returns the cached file path for a window (marking it recently used), or None.
+
+        An entry from before coverage was tracked gets its window filled in, so `covering` finds it from then on.
+        """
+        key = cache_key(network, station, channel, start_time, end_time)
+        with self._lock:
+            row = self._db.execute("SELECT path, start_time FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            path = os.path.join(self.root, row[0])
+            if not os.path.exists(path):
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            if row[1] is None:
+                self._db.execute("UPDATE entries SET network = ?, station = ?, channel = ?, start_time = ?, end_time = ? "
+                                 "WHERE key = ?", (network, station, channel, start_time.strftime(TIME_FORMAT),
+                                                   end_time.strftime(TIME_FORMAT), key))
+            self._db.commit()
+        return path
+
+    def covering(self, network, station, channel, start_time, end_time):
+        """Returns [(start, end, path)] of cached windows overlapping [start_time, end_time], in time order.
+
+        Each entry adds time the earlier ones did not cover, but the first and last may reach past the range
+        and neighbours may overlap, so callers clip them (see clip_zip). Entries from before coverage was
+        tracked are only found by `lookup` on their exact window.
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT key, path, start_time, end_time FROM entries WHERE network = ? AND station = ? AND channel = ? "
+                "AND end_time > ? AND start_time < ? ORDER BY start_time, end_time DESC",
+                (network, station, channel, start_time.strftime(TIME_FORMAT), end_time.strftime(TIME_FORMAT))).fetchall()
+            entries = []
+            covered_until = start_time.strftime(TIME_FORMAT)
+            now = time.time()
+            for key, relative, start, end in rows:
+                if end <= covered_until:
+                    continue
+                if not os.path.exists(os.path.join(self.root, relative)):
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    continue
+                self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+                entries.append((datetime.strptime(start, TIME_FORMAT), datetime.strptime(end, TIME_FORMAT),
+                                os.path.join(self.root, relative)))
+                covered_until = end
+            self._db.commit()
+        return entries
+
+    def open_path(self, path):
+        """Returns a readable, checked sac.zip file object for a cached entry; a corrupt entry is evicted and None returned."""
+        try:
+            cached = mseed_to_zip(path) if path.endswith(".mseed") else open(path, 'rb')
+            test_zip(cached)
+        except Exception as e:
+            print(f"⚠️ Evicting unreadable cache entry {path}: {e}")
+            self.remove(path)
+            return None
+        return cached
+
+    def open(self, network, station, channel, start_time, end_time):
+        """Returns a readable sac.zip file object for a cached window, or None on a miss (or a corrupt entry)."""
+        path = self.lookup(network, station, channel, start_time, end_time)
+        if path is None:
+            return None
+        return self.open_path(path)
+
+    def remove(self, path):
+        """Deletes one entry, given the path lookup/covering returned."""
+        with self._lock:
+            self._db.execute("DELETE FROM entries WHERE path = ?", (os.path.relpath(path, self.root),))
+            self._db.commit()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def put(self, network, station, channel, start_time, end_time, source):
+        """Stores a sac.zip given as a path or a readable file object, then evicts down to max_bytes.
+
+        Raises zipfile.BadZipFile, storing nothing, if the zip fails test_zip.
+        """
+        test_zip(source)
+        key = cache_key(network, station, channel, start_time, end_time)
+        folder = os.path.join(self.root, key[:2])
+        os.makedirs(folder, exist_ok=True)
+        suffix = ".mseed" if self.compress == "mseed" else ".zip"
+        relative = os.path.join(key[:2], key + suffix)
+        tmp_path = os.path.join(folder, f"{key}.{threading.get_ident()}.tmp")
+
+        if self.compress == "mseed":
+            zip_to_mseed(source, tmp_path)
+        elif isinstance(source, str):
+            shutil.copyfile(source, tmp_path)
+        else:
+            with open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(source, f)
+        if not isinstance(source, str):
+            source.seek(0)
+        os.replace(tmp_path, os.path.join(self.root, relative))
+
+        size = os.path.getsize(os.path.join(self.root, relative))
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries (key, path, size, last_access, network, station, channel, start_time, end_time) "
+                             "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, relative, size, time.time(), network, station, channel,
+                              start_time.strftime(TIME_FORMAT), end_time.strftime(TIME_FORMAT)))
+            self._db.commit()
+        self.evict()
+        return os.path.join(self.root, relative)
+
+    def total_bytes(self):
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def evict(self):
+        """Deletes least-recently-used entries until the cache fits in max_bytes."""
+        with self._lock:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return 0
+            removed = 0
+            for key, relative, size in self._db.execute(
+                    "SELECT key, path, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, relative))
+                except FileNotFoundError:
+                    pass
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+            self._db.commit()
+        return removed
+
+def check_legacy_index(folder):
+    """Builds an index in the format from before coverage was tracked, holding 2022-03-01, then fetches that day
+    and 2022-03-01 12:30 - 2022-03-02 12:00 through a DataselectClient on a stand-in server; True if the cached
+    day is never requested again and the samples served are exactly those of each window."""
+    from datetime import timedelta
+    from io import BytesIO
+    from obspy import read, UTCDateTime
+    from fdsn_client import DataselectClient
+    from fdsn_standin import start_server
+    from synthetic_sac import make_sac_zip
+
+    root = os.path.join(folder, "cache")
+    day = datetime(2022, 3, 1)
+    key = cache_key("TX", "PB28", "HHZ", day, day + timedelta(days=1))
+    os.makedirs(os.path.join(root, key[:2]))
+    with open(os.path.join(root, key[:2], key + ".zip"), 'wb') as f:
+        f.write(make_sac_zip("TX", "PB28", "HHZ", day, day + timedelta(days=1)))
+    db = sqlite3.connect(os.path.join(root, "index.sqlite"))
+    db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, path TEXT, size INTEGER, last_access REAL)")
+    db.execute("INSERT INTO entries VALUES (?, ?, ?, ?)", (key, os.path.join(key[:2], key + ".zip"), 1, time.time()))
+    db.commit()
+    db.close()
+
+    server, url = start_server(latency=0.0, synthetic=True)
+    ok = True
+    try:
+        with DataselectClient(url, cache=WaveformCache(root)) as client:
+            for start_time, end_time, requests in [(day, day + timedelta(days=1), 0),
+                                                   (day + timedelta(hours=12.5), day + timedelta(days=1.5), 1)]:
+                traces = []
+                status = client.fetch_members("TX", "PB28", "HHZ", start_time, end_time,
+                                              lambda name, data: traces.append(read(BytesIO(data), format="SAC")[0]))
+                npts = sum(tr.stats.npts for tr in traces)
+                inside = all(tr.stats.starttime >= UTCDateTime(start_time) and tr.stats.endtime < UTCDateTime(end_time)
+                             for tr in traces)
+                expected = (end_time - start_time).total_seconds() * 100
+                passed = status.endswith(f"({requests} requests)") and npts == expected and inside
+                print(f"{'✅' if passed else '❌'} {start_time} - {end_time}: {status}, {npts} of {expected:.0f} samples")
+                ok = ok and passed
+    finally:
+        server.shutdown()
+    return ok
+
+if __name__ == "__main__":
+    # Usage: python waveform_cache.py <cache_dir> [max_gb]   (prints usage and evicts down to max_gb)
+    #        python waveform_cache.py check                  (an index from before coverage was tracked is still read)
+    if sys.argv[1] == "check":
+        with tempfile.TemporaryDirectory() as folder:
+            sys.exit(0 if check_legacy_index(folder) else 1)
+    max_bytes = float(sys.argv[2]) * 1024 ** 3 if len(sys.argv) > 2 else DEFAULT_MAX_BYTES
+    cache = WaveformCache(sys.argv[1], max_bytes=max_bytes)
+    removed = cache.evict()
+    print(f"Cache {cache.root}: {cache.total_bytes() / 1024 ** 3:.2f} GB, evicted {removed} entries")
@@ -0,0 +1,91 @@
+import os
+import json
+import threading
+from datetime import timedelta
+
+# Nominal sample rate by SEED band code, so e.g. HHZ and BHZ learn separate window sizes
+BAND_RATES = {'F': 1000, 'G': 1000, 'D': 250, 'C': 250, 'E': 100, 'H': 100, 'S': 50, 'B': 40, 'M': 10, 'L': 1}
+
+INITIAL_WINDOW = timedelta(days=1)
+MIN_WINDOW = timedelta(minutes=10)  # Below this a 413 is treated as permanent instead of splitting again
+MAX_WINDOW = timedelta(days=7)
+SLOW_SECONDS = 120                  # A request slower than this counts like a 413 for sizing
+GROW_AFTER = 20                     # Fast successes in a row before trying a window twice as long
+
+def window_key(network, station, channel):
+    """Keys remembered window sizes by net.sta.cha and nominal sample rate."""
+    rate = BAND_RATES.get(channel[:1].upper(), 0)
+    return f"{network}.{station}.{channel}@{rate}Hz"
+
+def split_range(start_time, end_time, window):
+    """Cuts [start_time, end_time) into consecutive windows of the given length."""
+    windows = []
+    current_time = start_time
+    while current_time < end_time:
+        next_time = min(current_time + window, end_time)
+        windows.append((current_time, next_time))
+        current_time = next_time
+    return windows
+
+class WindowPlanner:
+    """Chooses request windows per station/channel: start large, halve on 413 or slow replies, remember what worked."""
+
+    def __init__(self, state_path=None, initial=INITIAL_WINDOW, min_window=MIN_WINDOW, max_window=MAX_WINDOW,
+                 slow_seconds=SLOW_SECONDS):
+        self.state_path = state_path
+        self.initial = initial
+        self.min_window = min_window
+        self.max_window = max_window
+        self.slow_seconds = slow_seconds
+        self._lock = threading.Lock()
+        self._seconds = {}
+        self._streak = {}
+        if state_path and os.path.exists(state_path):
+            with open(state_path) as f:
+                self._seconds = json.load(f)
+
+    def window_for(self, key):
+        with self._lock:
+            return timedelta(seconds=self._seconds.get(key, self.initial.total_seconds()))
+
+    def plan(self, key, start_time, end_time):
+        """Returns the windows to request for a range, using the best known size for this key."""
+        return split_range(start_time, end_time, self.window_for(key))
+
+    def record_success(self, key, start_time, end_time, elapsed):
+        """Notes a completed request; slow replies shrink the window, runs of fast ones grow it."""
+        if elapsed > self.slow_seconds:
+            self.record_too_large(key, start_time, end_time)
+            return
+        seconds = (end_time - start_time).total_seconds()
+        with self._lock:
+            best = self._seconds.get(key, self.initial.total_seconds())
+            if seconds < best:
+                return  # Tail window of a range, says nothing about the best size
+            streak = self._streak.get(key, 0) + 1
+            self._streak[key] = streak
+            if streak < GROW_AFTER or best >= self.max_window.total_seconds():
+                return
+            self._streak[key] = 0
+            self._seconds[key] = min(best * 2, self.max_window.total_seconds())
+        self.save()
+
+    def record_too_large(self, key, start_time, end_time):
+        """Notes a 413 (or too-slow reply): the best size becomes at most half this window."""
+        half = max((end_time - start_time).total_seconds() / 2, self.min_window.total_seconds())
+        with self._lock:
+            self._streak[key] = 0
+            if half >= self._seconds.get(key, self.initial.total_seconds()):
+                return
+            self._seconds[key] = half
+        self.save()
+
+    def save(self):
+        if not self.state_path:
+            return
+        with self._lock:
+            state = dict(self._seconds)
+        tmp_path = f"{self.state_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
@@ -0,0 +1,49 @@
+import sys
+import time
+import numpy as np
+from obspy import read
+from detection import list_sac_files, detect_file, detect_stream
+from sac_reader import read_sac
+
+# Files/sec of obspy.read vs the memmap SAC reader on the same directory, for reading alone and for full detection
+REPEAT = 3
+
+def time_files(func, file_paths, repeat=REPEAT):
+    """Best of `repeat` passes over the files, in files per second."""
+    best = float('inf')
+    for _ in range(repeat):
+        tic = time.perf_counter()
+        for file_path in file_paths:
+            func(file_path)
+        best = min(best, time.perf_counter() - tic)
+    return len(file_paths) / best
+
+def obspy_read(file_path):
+    return float(read(file_path)[0].data.sum())
+
+def fast_read(file_path):
+    # Touch the samples so the memmap is really paged in
+    return float(read_sac(file_path)['data'].sum())
+
+if __name__ == "__main__":
+    # Usage: python bench_sac_reader.py <folder with .SAC files> [max_files]
+    file_paths = list_sac_files(sys.argv[1])
+    if len(sys.argv) > 2:
+        file_paths = file_paths[:int(sys.argv[2])]
+    fallbacks = sum(read_sac(file_path) is None for file_path in file_paths)
+    print(f"{len(file_paths)} files, {fallbacks} need the obspy fallback")
+
+    # Both paths have to agree before their speed means anything
+    for file_path in file_paths:
+        fast, slow = detect_file(file_path), detect_stream(read(file_path), file_path)
+        assert np.array_equal(np.asarray(fast['onsets']), np.asarray(slow['onsets'])), file_path
+        assert fast['starttime'] == slow['starttime'] and fast['sampling_rate'] == slow['sampling_rate'], file_path
+
+    results = [
+        ("obspy.read", time_files(obspy_read, file_paths)),
+        ("read_sac (memmap)", time_files(fast_read, file_paths)),
+        ("detect via obspy.read", time_files(lambda p: detect_stream(read(p), p), file_paths)),
+        ("detect via read_sac", time_files(detect_file, file_paths)),
+    ]
+    for label, rate in results:
+        print(f"  {label:<24} {rate:10.1f} files/s")
@@ -0,0 +1,283 @@
+import os
+import sys
+import json
+import math
+import zlib
+import bisect
+from datetime import datetime, timezone
+from multiprocessing import Pool
+import numpy as np
+from obspy import UTCDateTime
+from sac_reader import read_trace, trace_id, list_sac_files
+
+# Compaction of hourly SAC fragments into one volume per channel per UTC day: <NET.STA.LOC.CHA>.<YYYY-MM-DD>.npy
+# holds the day's samples back to back (float32, overlaps dropped), and the .json next to it is the time index,
+# one [start epoch, offset, npts, sampling_rate] entry per contiguous segment plus the gaps between them. A reader
+# memory-maps the .npy and binary-searches the segments, so any sub-window is a slice, not a scan.
+VOLUMES_DIR_NAME = "volumes"
+VOLUME_SUFFIX = ".npy"
+INDEX_SUFFIX = ".json"
+DAY_SECONDS = 86400
+COMPACT_PROCESSES = 4  # Compaction is mostly file I/O; a few processes keep the disk busy
+
+def day_of(epoch):
+    return math.floor(epoch / DAY_SECONDS) * DAY_SECONDS
+
+def volume_base(out_dir, volume_id, day):
+    return os.path.join(out_dir, f"{volume_id}.{datetime.fromtimestamp(day, timezone.utc):%Y-%m-%d}")
+
+def is_volume(path):
+    return path.endswith(VOLUME_SUFFIX) and os.path.exists(path[:-len(VOLUME_SUFFIX)] + INDEX_SUFFIX)
+
+def list_volumes(folder):
+    """Returns the day volumes in a folder in name (i.e. channel, then day) order."""
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if is_volume(os.path.join(folder, f))]
+
+def _first_sample(epoch, start, df):
+    """Index of the first sample at or after epoch, for samples start + i / df."""
+    return max(0, math.ceil((epoch - start) * df - 1e-6))
+
+class DayVolume:
+    """One compacted channel-day: the samples memory-mapped from the .npy, and its segment index."""
+
+    def __init__(self, path):
+        base = path[:-len(VOLUME_SUFFIX)] if path.endswith(VOLUME_SUFFIX) else path
+        with open(base + INDEX_SUFFIX) as f:
+            self.index = json.load(f)
+        self.path = base + VOLUME_SUFFIX
+        self.data = np.load(self.path, mmap_mode='r')
+        if len(self.data) != self.index['npts']:
+            raise ValueError(f"{self.path} has {len(self.data)} samples, its index says {self.index['npts']}")
+        self.segments = self.index['segments']
+        self._starts = [segment[0] for segment in self.segments]
+
+    def _trace(self, starttime, df, data):
+        starttime = UTCDateTime(starttime)
+        return {
+            'data': np.asarray(data, dtype=np.float32),
+            'network': self.index['network'],
+            'station': self.index['station'],
+            'location': self.index['location'],
+            'channel': self.index['channel'],
+            'sampling_rate': df,
+            'starttime': starttime,
+            'endtime': starttime + (len(data) - 1) / df,
+            'npts': len(data),
+        }
+
+    def read(self, start=None, end=None):
+        """Traces (read_sac dicts, data viewed from the memmap) with start <= time < end, one per contiguous segment.
+
+        start and end are epoch seconds or UTCDateTimes; None means the edge of the day.
+        """
+        start = float(start) if start is not None else None
+        end = float(end) if end is not None else None
+        first = max(0, bisect.bisect_right(self._starts, start) - 1) if start is not None else 0
+        traces = []
+        for seg_start, offset, npts, df in self.segments[first:]:
+            if end is not None and seg_start >= end:
+                break
+            lo = _first_sample(start, seg_start, df) if start is not None else 0
+            hi = min(npts, _first_sample(end, seg_start, df)) if end is not None else npts
+            if lo < hi:
+                traces.append(self._trace(seg_start + lo / df, df, self.data[offset + lo:offset + hi]))
+        return traces
+
+def plan(file_paths):
+    """{(trace id, day epoch): [paths]} for every channel-day the fragments touch (a fragment may cross midnight)."""
+    days = {}
+    for file_path in file_paths:
+        try:
+            trace = read_trace(file_path)
+        except Exception as e:
+            print(f"⚠️ Skipping {file_path}: {e}")
+            continue
+        if trace is None:
+            continue
+        start = float(trace['starttime'])
+        end = start + trace['npts'] / trace['sampling_rate']
+        day = day_of(start)
+        while day < end:
+            days.setdefault((trace_id(trace), day), []).append(file_path)
+            day += DAY_SECONDS
+    return days
+
+def merge_pieces(pieces, day):
+    """Clips (start, sampling_rate, data) pieces to the day and drops samples an earlier piece already covers.
+
+    Returns (segments, chunks, duplicate samples dropped). A piece that starts within half a sample of where
+    the previous one ended extends its segment; anything else (a gap, a new sampling rate) starts a new one.
+    """
+    segments = []  # [start epoch, offset, npts, sampling_rate]
+    chunks = []
+    dropped = 0
+    offset = 0
+    for start, df, data in sorted(pieces, key=lambda piece: piece[0]):
+        lo = _first_sample(day, start, df)
+        hi = min(len(data), _first_sample(day + DAY_SECONDS, start, df))
+        last = segments[-1] if segments and segments[-1][3] == df else None
+        if last is not None:
+            covered = int(round((last[0] + last[2] / df - start) * df))
+            if covered > lo:
+                dropped += min(hi, covered) - lo
+                lo = covered
+        if lo >= hi:
+            continue
+        piece_start = start + lo / df
+        if last is not None and abs(piece_start - (last[0] + last[2] / df)) < 0.5 / df:
+            last[2] += hi - lo
+        else:
+            segments.append([piece_start, offset, hi - lo, df])
+        chunks.append(np.asarray(data[lo:hi], dtype=np.float32))
+        offset += hi - lo
+    return segments, chunks, dropped
+
+def gaps_of(segments, day):
+    """[start, end] epochs of the day not covered by any segment."""
+    gaps = []
+    covered_until = day
+    for start, _, npts, df in segments:
+        if start - covered_until >= 0.5 / df:
+            gaps.append([covered_until, start])
+        covered_until = max(covered_until, start + npts / df)
+    if day + DAY_SECONDS - covered_until > 1e-6:
+        gaps.append([covered_until, day + DAY_SECONDS])
+    return gaps
+
+def checksum(data):
+    return zlib.crc32(np.ascontiguousarray(data).view(np.uint8))
+
+def open_existing(base):
+    """Opens the day volume already at base, finishing a swap a crash interrupted.
+
+    The index is swapped in after the data, so a crash in between leaves the new data next to the old
+    index, with the matching index still in .json.tmp; it is used if its npts and checksum fit the data.
+    Anything else raises: rebuilding from this run's fragments would drop those an earlier run removed.
+    """
+    try:
+        return DayVolume(base)
+    except (OSError, ValueError) as e:
+        error = e
+    tmp_path = base + INDEX_SUFFIX + ".tmp"
+    if os.path.exists(tmp_path) and os.path.exists(base + VOLUME_SUFFIX):
+        with open(tmp_path) as f:
+            index = json.load(f)
+        data = np.load(base + VOLUME_SUFFIX, mmap_mode='r')
+        if len(data) == index['npts'] and checksum(data) == index.get('crc32'):
+            os.replace(tmp_path, base + INDEX_SUFFIX)
+            print(f"⚠️ Finished the interrupted write of {base}")
+            return DayVolume(base)
+    raise RuntimeError(f"existing volume is unreadable ({error}); not rebuilding it from this run's fragments "
+                       f"alone. Restore it, or move it away to rebuild it from all of its fragments")
+
+def compact_day(task):
+    """Writes (or extends) one day volume from its fragments; returns a summary dict, or None if already up to date."""
+    volume_id, day, file_paths, out_dir = task
+    base = volume_base(out_dir, volume_id, day)
+    pieces = []
+    sources = set()
+    dropped_before = 0
+    if os.path.exists(base + INDEX_SUFFIX) or os.path.exists(base + VOLUME_SUFFIX):
+        volume = open_existing(base)
+        sources = set(volume.index['sources'])
+        dropped_before = volume.index['duplicates_dropped']
+        pieces += [(start, df, volume.data[offset:offset + npts]) for start, offset, npts, df in volume.segments]
+    new_paths = [file_path for file_path in file_paths if os.path.basename(file_path) not in sources]
+    if not new_paths:
+        return None
+
+    for file_path in new_paths:
+        trace = read_trace(file_path)
+        pieces.append((float(trace['starttime']), trace['sampling_rate'], trace['data']))
+        sources.add(os.path.basename(file_path))
+    segments, chunks, dropped = merge_pieces(pieces, day)
+    data = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.float32)
+    network, station, location, channel = volume_id.split('.')
+    index = {
+        'id': volume_id, 'network': network, 'station': station, 'location': location, 'channel': channel,
+        'day': f"{datetime.fromtimestamp(day, timezone.utc):%Y-%m-%d}", 'start': day, 'end': day + DAY_SECONDS,
+        'dtype': 'float32', 'npts': len(data), 'segments': segments, 'gaps': gaps_of(segments, day),
+        'duplicates_dropped': dropped_before + dropped,
+        'sources': sorted(sources),
+        'crc32': checksum(data),
+    }
+
+    # Both files are written in full before either is swapped in, the index last; a crash in between is
+    # finished by open_existing on the next run
+    with open(base + VOLUME_SUFFIX + ".tmp", 'wb') as f:
+        np.save(f, data)
+    with open(base + INDEX_SUFFIX + ".tmp", 'w') as f:
+        json.dump(index, f)
+    os.replace(base + VOLUME_SUFFIX + ".tmp", base + VOLUME_SUFFIX)
+    os.replace(base + INDEX_SUFFIX + ".tmp", base + INDEX_SUFFIX)
+    return {'volume': base + VOLUME_SUFFIX, 'fragments': len(new_paths), 'segments': len(segments),
+            'gaps': len(index['gaps']), 'duplicates_dropped': dropped}
+
+def compact(file_paths, out_dir, workers=COMPACT_PROCESSES, remove=False):
+    """Compacts SAC fragments into day volumes under out_dir; with remove, deletes each fragment once all its days are written."""
+    os.makedirs(out_dir, exist_ok=True)
+    days = plan(file_paths)
+    tasks = [(volume_id, day, paths, out_dir) for (volume_id, day), paths in sorted(days.items())]
+    print(f"📦 {len(file_paths)} fragments -> {len(tasks)} day volumes")
+
+    failed = set()
+    counts = {'written': 0, 'up to date': 0, 'failed': 0}
+    pool = Pool(workers) if workers > 1 else None
+    results = pool.imap(_compact_day_safe, tasks) if pool is not None else map(_compact_day_safe, tasks)
+    try:
+        for task, result in zip(tasks, results):
+            if isinstance(result, Exception):
+                print(f"❌ {volume_base(out_dir, task[0], task[1])}: {result}")
+                failed.update(task[2])
+                counts['failed'] += 1
+            elif result is None:
+                counts['up to date'] += 1
+            else:
+                counts['written'] += 1
+                print(f"✅ {os.path.basename(result['volume'])}: {result['fragments']} fragments, {result['segments']} "
+                      f"segments, {result['gaps']} gaps, {result['duplicates_dropped']} duplicate samples dropped")
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if remove:
+        # A fragment crossing midnight goes only once both of its days are written
+        removed = {file_path for paths in days.values() for file_path in paths} - failed
+        for file_path in removed:
+            os.remove(file_path)
+        print(f"🗑️ Removed {len(removed)} compacted fragments")
+    print(f"📊 Day volumes in {out_dir}: " + ", ".join(f"{count} {name}" for name, count in counts.items()))
+    return counts
+
+def _compact_day_safe(task):
+    try:
+        return compact_day(task)
+    except Exception as e:
+        return e
+
+if __name__ == "__main__":
+    # Usage: python day_volumes.py compact <folder of SAC files> [out_dir, default <folder>/volumes] [workers] [remove]
+    #        python day_volumes.py info <volume.npy>
+    #        python day_volumes.py read <volume.npy> <start> <end>   (ISO times, e.g. 2022-03-01T05:00:00)
+    command = sys.argv[1]
+    if command == "compact":
+        folder = sys.argv[2]
+        out_dir = sys.argv[3] if len(sys.argv) > 3 else os.path.join(folder, VOLUMES_DIR_NAME)
+        workers = int(sys.argv[4]) if len(sys.argv) > 4 else COMPACT_PROCESSES
+        compact(list_sac_files(folder), out_dir, workers, remove=len(sys.argv) > 5 and sys.argv[5] == "remove")
+    elif command == "info":
+        volume = DayVolume(sys.argv[2])
+        print(f"{volume.index['id']} {volume.index['day']}: {volume.index['npts']} samples in "
+              f"{len(volume.segments)} segments from {len(volume.index['sources'])} fragments, "
+              f"{volume.index['duplicates_dropped']} duplicate samples dropped")
+        for start, end in volume.index['gaps']:
+            print(f"  gap {UTCDateTime(start)} - {UTCDateTime(end)} ({end - start:.2f} s)")
+    elif command == "read":
+        for trace in DayVolume(sys.argv[2]).read(UTCDateTime(sys.argv[3]), UTCDateTime(sys.argv[4])):
+            print(f"{trace['starttime']} - {trace['endtime']}  {trace['npts']} samples, "
+                  f"max |amplitude| {float(np.abs(trace['data']).max()):.1f}")
+    else:
+        print(f"Unknown command: {command}")
@@ -0,0 +1,245 @@
+import os
+import sys
+from io import BytesIO
+from multiprocessing import Pool
+import numpy as np
+from sac_reader import read_sac, read_trace, trace_from_stream, list_sac_files
+from preprocess import worker_preprocessor, trigger_onset
+from day_volumes import DayVolume, is_volume
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+from metrics import METRICS, profile
+
+# Detector settings shared by seismicPipeline.py and test_part2.py
+HIGHPASS_FREQ = 5      # Hz
+FILTER_CORNERS = 2
+STA_SECONDS = 1
+LTA_SECONDS = 10
+ONSET_TRIGGER = 8
+END_TRIGGER = 0.5
+
+def read_stream(data):
+    """obspy.read of in-memory SAC bytes; obspy's readers load only here, for the odd file read_sac can't map."""
+    from obspy import read
+
+    return read(BytesIO(data), format="SAC")
+
+def detect_trace(trace, path, cft=None):
+    """Runs highpass + STA/LTA + trigger_onset on one trace (a read_sac dict) and returns a compact result record."""
+    df = trace['sampling_rate']
+    if cft is None:
+        # Apply high-pass filter at 5 Hz; the worker's buffers are reused from file to file
+        pre = worker_preprocessor()
+        with METRICS.timer('highpass'):
+            data = pre.highpass(trace['data'], df, HIGHPASS_FREQ, FILTER_CORNERS)
+        with METRICS.timer('sta_lta'):
+            cft = pre.sta_lta(data, int(STA_SECONDS * df), int(LTA_SECONDS * df))
+    with METRICS.timer('trigger_onset'):
+        onsets = trigger_onset(cft, ONSET_TRIGGER, END_TRIGGER)
+        peaks = [float(cft[on:off + 1].max()) for on, off in onsets]
+    METRICS.inc('files_detected')
+    METRICS.inc('samples_detected', trace['npts'])
+
+    return {
+        'path': path,
+        'network': trace['network'],
+        'station': trace['station'],
+        'channel': trace['channel'],
+        'starttime': trace['starttime'],
+        'endtime': trace['endtime'],
+        'sampling_rate': df,
+        'npts': trace['npts'],
+        'onsets': onsets,
+        'peaks': peaks,
+    }
+
+def detect_stream(stream, path):
+    """Runs the detector on the first trace of an obspy Stream."""
+    if len(stream) == 0:
+        return {'path': path, 'error': "no traces"}
+    return detect_trace(trace_from_stream(stream), path)
+
+def detect_file(file_path):
+    """Runs the detector on one SAC file on disk (fast header + memmap path, obspy.read for anything unusual)."""
+    with profile(file_path):
+        with METRICS.timer('read'):
+            trace = read_trace(file_path)
+        if trace is None:
+            return {'path': file_path, 'error': "no traces"}
+        return detect_trace(trace, file_path)
+
+def detect_volume(path, start=None, end=None):
+    """Runs the detector on each contiguous segment of a day volume (or of its start..end window); one record per segment.
+
+    Segments shorter than the LTA window are reported and skipped, and a segment that fails gives an error
+    record of its own, so the rest of the day is still detected.
+    """
+    with profile(path):
+        with METRICS.timer('read'):
+            traces = DayVolume(path).read(start, end)
+        records = []
+        for trace in traces:
+            if trace['npts'] < int(LTA_SECONDS * trace['sampling_rate']):
+                METRICS.inc('segments_too_short')
+                print(f"⚠️ Skipping {trace['npts']}-sample segment at {trace['starttime']} in {path}: "
+                      f"shorter than the {LTA_SECONDS} s LTA window")
+                continue
+            try:
+                records.append(detect_trace(trace, path))
+            except Exception as e:
+                records.append({'path': path, 'error': f"segment at {trace['starttime']}: {e}"})
+        return records
+
+def detect_sac_bytes(name, data):
+    """Runs the detector on a SAC member held in memory (e.g. straight out of a sac.zip)."""
+    with profile(name):
+        with METRICS.timer('read'):
+            trace = read_sac(data)
+            stream = read_stream(data) if trace is None else None
+        if trace is None:
+            return detect_stream(stream, name)
+        return detect_trace(trace, name)
+
+def read_item(item):
+    """Reads a path or a (name, bytes) SAC member into (path, trace dict or None)."""
+    if isinstance(item, tuple):
+        name, data = item
+        trace = read_sac(data)
+        if trace is None:
+            stream = read_stream(data)
+            trace = trace_from_stream(stream) if len(stream) else None
+        return name, trace
+    return item, read_trace(item)
+
+def detect_batch(items):
+    """Detects on a list of paths/(name, bytes) members, preprocessing same-rate, same-length traces as one 2-D array."""
+    records = [None] * len(items)
+    groups = {}
+    for i, item in enumerate(items):
+        path = item[0] if isinstance(item, tuple) else item
+        if not isinstance(item, tuple) and is_volume(item):
+            records[i] = _detect_file_safe(item)  # A whole day is already one big array
+            continue
+        try:
+            with METRICS.timer('read'):
+                path, trace = read_item(item)
+        except Exception as e:
+            records[i] = {'path': path, 'error': str(e)}
+            continue
+        if trace is None:
+            records[i] = {'path': path, 'error': "no traces"}
+        else:
+            groups.setdefault((trace['sampling_rate'], trace['npts']), []).append((i, path, trace))
+
+    pre = worker_preprocessor()
+    for (df, _), group in groups.items():
+        try:
+            batch = np.stack([trace['data'] for _, _, trace in group])
+            with METRICS.timer('highpass'):
+                filtered = pre.highpass(batch, df, HIGHPASS_FREQ, FILTER_CORNERS)
+            with METRICS.timer('sta_lta'):
+                cft = pre.sta_lta(filtered, int(STA_SECONDS * df), int(LTA_SECONDS * df))
+            for row, (i, path, trace) in enumerate(group):
+                records[i] = detect_trace(trace, path, cft[row])
+        except Exception as e:
+            for i, path, _ in group:
+                records[i] = {'path': path, 'error': str(e)}
+    return [r for record in records for r in (record if isinstance(record, list) else [record])]
+
+def _detect_file_safe(item):
+    """Pool wrapper for a path, a (name, bytes) member or a day volume (a list of records, one per segment);
+    exceptions come back as records so one bad file never kills the map."""
+    path = item[0] if isinstance(item, tuple) else item
+    try:
+        if isinstance(item, tuple):
+            return detect_sac_bytes(*item)
+        if is_volume(item):
+            return detect_volume(item)
+        return detect_file(item)
+    except Exception as e:
+        return {'path': path, 'error': str(e)}
+
+def to_csv_row(record, sac_file=None):
+    """Formats a result record as a trigger_info.csv row."""
+    onsets = record['onsets']
+    return {
+        'SAC_file': sac_file if sac_file is not None else os.path.basename(record['path']),
+        'Station': record['station'],
+        'Start_Time': record['starttime'],
+        'End_Time': record['endtime'],
+        'Number_of_Triggers': len(onsets),
+        'Trigger_Times': ', '.join(str(time) for time in onsets)
+    }
+
+def _detect_chunks(file_paths, batch_size):
+    chunk = []
+    for item in file_paths:
+        chunk.append(item)
+        if len(chunk) == batch_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def detect_files(file_paths, workers=1, pool=None, chunksize=4, batch_size=None):
+    """Yields result records in input order, fanning files out to a process pool when workers > 1.
+
+    Items are file paths, (name, bytes) SAC members or day volumes (see day_volumes.py), which yield one
+    record per contiguous segment. Pass an existing `pool` to reuse its
+    workers across calls. The caller stays the only writer, so CSV rows never interleave.
+    With batch_size, each task is a detect_batch over that many files (helps for short files).
+    """
+    func, items = _detect_file_safe, file_paths
+    if batch_size:
+        func, items, chunksize = detect_batch, _detect_chunks(file_paths, batch_size), 1
+
+    own_pool = Pool(workers) if pool is None and (workers is None or workers > 1) else None
+    active_pool = pool if pool is not None else own_pool
+    results = active_pool.imap(func, items, chunksize=chunksize) if active_pool is not None else map(func, items)
+    try:
+        for result in results:
+            if isinstance(result, list):
+                yield from result
+            else:
+                yield result
+        if own_pool is not None:
+            own_pool.close()  # Workers exit normally, so their final metrics snapshot is written
+            own_pool.join()
+    finally:
+        if own_pool is not None:
+            own_pool.terminate()
+
+def check_short_segment(folder):
+    """Compacts an hour of synthetic data plus a 5 s tail (shorter than the LTA window) into a day volume in
+    folder; True if detecting the volume finds the same triggers as detecting the two files."""
+    from datetime import datetime, timedelta
+    from day_volumes import compact, list_volumes
+    from synthetic_sac import make_sac_bytes, sac_name
+
+    start_time = datetime(2022, 3, 1)
+    fragments = os.path.join(folder, "fragments")
+    os.makedirs(fragments, exist_ok=True)
+    for file_start, seconds in [(start_time, 3600), (start_time + timedelta(seconds=3630), 5)]:
+        with open(os.path.join(fragments, sac_name("TX", "PB28", "HHZ", file_start)), 'wb') as f:
+            f.write(make_sac_bytes("TX", "PB28", "HHZ", file_start, seconds)[0])
+    compact(list_sac_files(fragments), os.path.join(folder, "volumes"), workers=1)
+
+    def on_times(records):
+        errors = [record['error'] for record in records if 'error' in record]
+        return errors, sorted(round(float(record['starttime']) + on / record['sampling_rate'], 2)
+                              for record in records if 'error' not in record for on, _ in record['onsets'])
+
+    file_errors, expected = on_times(list(detect_files(list_sac_files(fragments))))
+    volume_errors, found = on_times(list(detect_files(list_volumes(os.path.join(folder, "volumes")))))
+    ok = not file_errors and not volume_errors and found == expected and len(found) > 0
+    print(f"{'✅' if ok else '❌'} day volume: {len(found)} triggers, {volume_errors or 'no errors'}; "
+          f"files: {len(expected)} triggers, {file_errors or 'no errors'}")
+    return ok
+
+if __name__ == "__main__":
+    # Usage: python detection.py check   (a volume with a segment shorter than the LTA window must still be detected)
+    import tempfile
+
+    if sys.argv[1] == "check":
+        with tempfile.TemporaryDirectory() as folder:
+            sys.exit(0 if check_short_segment(folder) else 1)
+    print(f"Unknown command: {sys.argv[1]}")
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import socket
+import threading
+
+# Coordinator-free work leases on a shared (NFS) volume:
+#   <root>/leases/<shard>.lease   O_EXCL-created claim, mtime refreshed as a heartbeat
+#   <root>/done/<shard>.done      O_EXCL-created commit marker naming the node whose results count
+# A lease whose mtime is older than LEASE_SECONDS belongs to a dead node and can be taken over.
+# Keep LEASE_SECONDS well above the clock skew between nodes and the NFS attribute cache time.
+LEASE_SECONDS = 30 * 60
+HEARTBEATS_PER_LEASE = 6
+
+def node_name():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def _create_exclusive(path, payload):
+    """Creates path with the payload only if it does not exist yet; returns False if another node got there first."""
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w') as f:
+        json.dump(payload, f)
+        f.flush()
+        os.fsync(f.fileno())
+    return True
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+class LeaseDir:
+    """Claims, renews and commits shards for one node; a background thread keeps held leases fresh."""
+
+    def __init__(self, root, node=None, lease_seconds=LEASE_SECONDS):
+        self.root = root
+        self.node = node or node_name()
+        self.lease_seconds = lease_seconds
+        self.lease_dir = os.path.join(root, "leases")
+        self.done_dir = os.path.join(root, "done")
+        os.makedirs(self.lease_dir, exist_ok=True)
+        os.makedirs(self.done_dir, exist_ok=True)
+        self._held = {}  # shard -> token written into its lease
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew_loop, name="lease-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def _lease_path(self, shard):
+        return os.path.join(self.lease_dir, shard + ".lease")
+
+    def _done_path(self, shard):
+        return os.path.join(self.done_dir, shard + ".done")
+
+    def is_done(self, shard):
+        return os.path.exists(self._done_path(shard))
+
+    def done_shards(self):
+        """{shard: commit marker} for every committed shard."""
+        markers = {}
+        for name in os.listdir(self.done_dir):
+            if name.endswith(".done"):
+                marker = _read_json(os.path.join(self.done_dir, name))
+                if marker is not None:
+                    markers[name[:-len(".done")]] = marker
+        return markers
+
+    def claim(self, shard):
+        """Tries to take the shard's lease; returns True if this node now holds it."""
+        if self.is_done(shard):
+            return False
+        path = self._lease_path(shard)
+        token = f"{self.node}-{time.time_ns()}"
+        if not _create_exclusive(path, {'node': self.node, 'token': token, 'claimed': time.time()}):
+            try:
+                age = time.time() - os.stat(path).st_mtime
+            except FileNotFoundError:
+                return self.claim(shard)
+            if age < self.lease_seconds:
+                return False
+            # Expired: rename is atomic, so exactly one node moves the stale lease aside and retries
+            stale = f"{path}.stale-{token}"
+            try:
+                os.rename(path, stale)
+            except FileNotFoundError:
+                return False
+            if time.time() - os.stat(stale).st_mtime < self.lease_seconds:
+                # Another node replaced the stale lease between our stat and rename: put its lease back
+                try:
+                    os.link(stale, path)
+                except FileExistsError:
+                    pass
+                os.remove(stale)
+                return False
+            os.remove(stale)
+            print(f"♻️ Took over expired lease {shard} ({age / 60:.0f} min old)")
+            if not _create_exclusive(path, {'node': self.node, 'token': token, 'claimed': time.time()}):
+                return False
+        if self.is_done(shard):  # Finished by the previous holder just before its lease looked stale
+            self._drop(path, token)
+            return False
+        with self._lock:
+            self._held[shard] = token
+        return True
+
+    def holds(self, shard):
+        """True if the lease file is still ours (a node that stalled past expiry may have lost it)."""
+        with self._lock:
+            token = self._held.get(shard)
+        lease = _read_json(self._lease_path(shard))
+        return token is not None and lease is not None and lease.get('token') == token
+
+    def commit(self, shard, result):
+        """Marks the shard done with this node's result (a dict of file names); False if it was lost or already done.
+
+        The O_EXCL done marker is the single commit point, so a shard counts exactly once even if two
+        nodes both finished it (e.g. one stalled past its lease and then woke up).
+        """
+        if not self.holds(shard):
+            return False
+        committed = _create_exclusive(self._done_path(shard), {'node': self.node, 'result': result,
+                                                               'committed': time.time()})
+        self.release(shard)
+        return committed
+
+    def _drop(self, path, token):
+        lease = _read_json(path)
+        if lease is not None and lease.get('token') == token:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def release(self, shard):
+        """Gives the lease up (after a commit, or when processing failed and someone else should retry)."""
+        with self._lock:
+            token = self._held.pop(shard, None)
+        if token is not None:
+            self._drop(self._lease_path(shard), token)
+
+    def _renew_loop(self):
+        while not self._stop.wait(self.lease_seconds / HEARTBEATS_PER_LEASE):
+            with self._lock:
+                held = list(self._held)
+            for shard in held:
+                try:
+                    os.utime(self._lease_path(shard))
+                except FileNotFoundError:
+                    print(f"⚠️ Lost lease {shard}")
+
+    def close(self):
+        self._stop.set()
+        for shard in list(self._held):
+            self.release(shard)
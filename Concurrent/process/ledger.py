@@ -0,0 +1,82 @@
+import os
+import csv
+import sys
+
+# One key per line, e.g. "TX.PB28.HHZ.2022-03-01" (day) or "TX.PB28.HHZ.2022-03-01T05" (hour)
+LEDGER_FILE_NAME = "processed_ledger.txt"
+
+def ledger_key(network, station, channel, when, unit="day"):
+    """Builds the ledger key for a network/station/channel and a day or hour."""
+    if unit == "hour":
+        stamp = when.strftime("%Y-%m-%dT%H")
+    else:
+        stamp = when.strftime("%Y-%m-%d")
+    return f"{network}.{station}.{channel}.{stamp}"
+
+class ProcessedLedger:
+    """Append-only on-disk set of finished work units, loaded once and queried in O(1)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._keys = set()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'rb+') as f:
+            content = f.read()
+            # A crash mid-append can leave a partial last line; cut it off so the next append starts clean
+            if content and not content.endswith(b'\n'):
+                content = content[:content.rfind(b'\n') + 1]
+                f.truncate(len(content))
+        self._keys = set(line for line in content.decode().splitlines() if line)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __len__(self):
+        return len(self._keys)
+
+    def mark(self, key):
+        """Records a finished unit; the line is fsync'd before it counts as done."""
+        if key in self._keys:
+            return
+        with open(self.path, 'a') as f:
+            f.write(key + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._keys.add(key)
+
+    def rebuild_from_csv(self, csv_path, network, channel, unit="day"):
+        """Rebuilds the ledger from an existing trigger_info.csv and swaps it in atomically."""
+        keys = set()
+        if os.path.exists(csv_path):
+            with open(csv_path, newline='') as csvfile:
+                for row in csv.DictReader(csvfile):
+                    start = row.get('Start_Time') or ''
+                    if len(start) < 13:
+                        continue
+                    # Start_Time is written as e.g. 2022-03-01T00:00:00.000000Z
+                    stamp = start[:13] if unit == "hour" else start[:10]
+                    keys.add(f"{network}.{row['Station']}.{channel}.{stamp}")
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            for key in sorted(keys):
+                f.write(key + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._keys = keys
+        return len(keys)
+
+if __name__ == "__main__":
+    # Usage: python ledger.py <trigger_info.csv> [network] [channel] [day|hour]
+    csv_path = sys.argv[1]
+    network = sys.argv[2] if len(sys.argv) > 2 else "TX"
+    channel = sys.argv[3] if len(sys.argv) > 3 else "HHZ"
+    unit = sys.argv[4] if len(sys.argv) > 4 else "day"
+    ledger = ProcessedLedger(os.path.join(os.path.dirname(os.path.abspath(csv_path)), LEDGER_FILE_NAME))
+    count = ledger.rebuild_from_csv(csv_path, network, channel, unit)
+    print(f"✅ Rebuilt {ledger.path} with {count} entries")
@@ -0,0 +1,189 @@
+import sys
+import time
+import ctypes
+import functools
+import threading
+import numpy as np
+from scipy.signal import iirfilter, zpk2sos, sosfilt
+
+# Preprocessing for the hot loop over SAC files: filter designs are cached per (freq, df, corners),
+# and filtering and STA/LTA run in place in float64 buffers each worker allocates once and reuses.
+# Same kernels as obspy's highpass (sosfilt, forward-backward) and classic_sta_lta (C stalta),
+# so results are identical.
+# Two of the fast paths are private APIs (tested with the versions in requirements.txt); each is checked
+# when this module loads, and anything missing or behaving differently falls back to the public route.
+try:
+    from scipy.signal._sosfilt import _sosfilt  # In-place kernel behind scipy.signal.sosfilt
+except ImportError:
+    _sosfilt = None
+
+def _check_sosfilt():
+    """True if the private in-place _sosfilt still gives what scipy.signal.sosfilt gives."""
+    sos = np.ascontiguousarray(zpk2sos(*iirfilter(2, 0.1, btype='highpass', ftype='butter', output='zpk')))
+    x = np.random.default_rng(0).standard_normal((2, 64))
+    y = x.copy()
+    try:
+        _sosfilt(sos, y, np.zeros((2, sos.shape[0], 2)))
+    except Exception:
+        return False
+    return np.allclose(y, sosfilt(sos, x, axis=-1))
+
+if _sosfilt is not None and not _check_sosfilt():
+    _sosfilt = None
+
+# obspy's C STA/LTA, loaded with the prototype from obspy.signal.headers. Importing obspy.signal itself would
+# pull in matplotlib (through its spectral estimation module) in every worker, so that is only the fallback.
+try:
+    from obspy.core.util.libnames import _load_cdll
+    clibsignal = _load_cdll("signal")
+except (ImportError, OSError):
+    from obspy.signal.headers import clibsignal
+head_stalta_t = np.dtype([('N', np.uint32), ('nsta', np.uint32), ('nlta', np.uint32)], align=True)
+clibsignal.stalta.argtypes = [
+    np.ctypeslib.ndpointer(dtype=head_stalta_t, ndim=1, flags='C_CONTIGUOUS'),
+    np.ctypeslib.ndpointer(dtype=np.float64, ndim=1, flags='C_CONTIGUOUS'),
+    np.ctypeslib.ndpointer(dtype=np.float64, ndim=1, flags='C_CONTIGUOUS'),
+]
+clibsignal.stalta.restype = ctypes.c_int
+
+def design_highpass(freq, df, corners):
+    """Butterworth highpass as second-order sections, designed exactly like obspy's highpass."""
+    fe = 0.5 * df
+    z, p, k = iirfilter(corners, freq / fe, btype='highpass', ftype='butter', output='zpk')
+    return zpk2sos(z, p, k)
+
+@functools.lru_cache(maxsize=64)
+def highpass_sos(freq, df, corners):
+    """Cached design_highpass; the returned array is shared, so never modify it."""
+    return np.ascontiguousarray(design_highpass(freq, df, corners), dtype=np.float64)
+
+class Preprocessor:
+    """Highpass + classic STA/LTA into reusable buffers, for one trace (1-D) or a batch of same-rate traces (2-D).
+
+    Returned arrays are views of the buffers and are overwritten by the next call; copy anything that
+    has to outlive it. Not thread-safe: use one per thread or process (see worker_preprocessor).
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self._head = np.empty(1, dtype=head_stalta_t)
+
+    def _buffer(self, name, shape):
+        """A C-contiguous float64 view of the named buffer, grown only when a larger shape comes along."""
+        size = int(np.prod(shape))
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=np.float64)
+            self._buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+    def _filter_rows(self, sos, x):
+        zi = self._buffer('zi', (x.shape[0], sos.shape[0], 2))
+        zi[...] = 0
+        if _sosfilt is not None:
+            _sosfilt(sos, x, zi)
+        else:
+            x[...] = sosfilt(sos, x, axis=-1)
+
+    def highpass(self, data, df, freq, corners, zerophase=True):
+        """Butterworth highpass of data (npts,) or (ntraces, npts), as obspy.signal.filter.highpass."""
+        rows = np.atleast_2d(data)
+        x = self._buffer('x', rows.shape)
+        np.copyto(x, rows)
+        sos = highpass_sos(float(freq), float(df), int(corners))
+        self._filter_rows(sos, x)
+        if zerophase:
+            y = self._buffer('y', rows.shape)
+            np.copyto(y, x[:, ::-1])
+            self._filter_rows(sos, y)
+            np.copyto(x, y[:, ::-1])
+        return x if np.ndim(data) == 2 else x[0]
+
+    def sta_lta(self, data, nsta, nlta):
+        """classic_sta_lta of data (npts,) or (ntraces, npts) into the 'cft' buffer.
+
+        Traces shorter than the LTA window get an all-zero cft (so no triggers) where obspy's C routine raises.
+        """
+        rows = np.atleast_2d(data)
+        if rows.shape[1] < nlta:
+            cft = self._buffer('cft', rows.shape)
+            cft[...] = 0
+            return cft if np.ndim(data) == 2 else cft[0]
+        if rows.dtype != np.float64 or not rows.flags.c_contiguous:
+            x = self._buffer('x', rows.shape)
+            np.copyto(x, rows)
+            rows = x
+        cft = self._buffer('cft', rows.shape)
+        self._head[:] = (rows.shape[1], nsta, nlta)
+        for row, out in zip(rows, cft):
+            errcode = clibsignal.stalta(self._head, row, out)
+            if errcode != 0:
+                raise Exception('ERROR %d stalta: len(data) < nlta' % errcode)
+        return cft if np.ndim(data) == 2 else cft[0]
+
+def trigger_onset(cft, thres1, thres2):
+    """[[on, off], ...] sample indices, the same as obspy.signal.trigger.trigger_onset (without max_len).
+
+    A trigger turns on at the start of a run with cft >= thres1 and off at the last sample of the run
+    with cft >= thres2 that contains it; the next trigger can only start after that.
+    """
+    above_on = np.flatnonzero(cft >= thres1)
+    if len(above_on) == 0:
+        return []
+    above_off = np.flatnonzero(cft >= thres2)
+    starts = above_on[np.concatenate(([True], np.diff(above_on) > 1))]
+    ends = np.append(above_off[np.append(np.diff(above_off) > 1, True)] if len(above_off) else [], len(cft))
+    picks = []
+    i = 0
+    while i < len(starts):
+        on = starts[i]
+        off = ends[np.searchsorted(ends, on)]
+        picks.append([on, off])
+        i = np.searchsorted(starts, off, side='right')
+    return np.array(picks, dtype=np.int64)
+
+_local = threading.local()
+
+def worker_preprocessor():
+    """The calling thread's (and so each Pool worker's) Preprocessor, created on first use."""
+    if not hasattr(_local, 'preprocessor'):
+        _local.preprocessor = Preprocessor()
+    return _local.preprocessor
+
+if __name__ == "__main__":
+    # Usage: python preprocess.py <folder with .SAC files> [batch_size]
+    # Benchmarks obspy highpass + classic_sta_lta against the buffered engine, per trace and in 2-D batches
+    from obspy.signal.filter import highpass
+    from obspy.signal.trigger import classic_sta_lta
+    from detection import list_sac_files, HIGHPASS_FREQ, FILTER_CORNERS, STA_SECONDS, LTA_SECONDS
+    from sac_reader import read_trace
+
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    traces = [read_trace(file_path) for file_path in list_sac_files(sys.argv[1])]
+    traces = [trace for trace in traces if trace is not None and trace['npts'] == traces[0]['npts']
+              and trace['sampling_rate'] == traces[0]['sampling_rate']]
+    df = traces[0]['sampling_rate']
+    nsta, nlta = int(STA_SECONDS * df), int(LTA_SECONDS * df)
+    pre = Preprocessor()
+
+    tic = time.perf_counter()
+    expected = [classic_sta_lta(highpass(t['data'], freq=HIGHPASS_FREQ, df=df, corners=FILTER_CORNERS, zerophase=True),
+                                nsta, nlta) for t in traces]
+    obspy_seconds = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    for t, cft in zip(traces, expected):
+        assert np.array_equal(pre.sta_lta(pre.highpass(t['data'], df, HIGHPASS_FREQ, FILTER_CORNERS), nsta, nlta), cft)
+    single_seconds = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    for i in range(0, len(traces), batch_size):
+        batch = np.stack([t['data'] for t in traces[i:i + batch_size]])
+        cft = pre.sta_lta(pre.highpass(batch, df, HIGHPASS_FREQ, FILTER_CORNERS), nsta, nlta)
+        assert np.array_equal(cft, np.stack(expected[i:i + batch_size]))
+    batch_seconds = time.perf_counter() - tic
+
+    print(f"{len(traces)} traces of {traces[0]['npts']} samples (results identical):")
+    for label, seconds in [("obspy highpass + classic_sta_lta", obspy_seconds), ("Preprocessor, per trace", single_seconds),
+                           (f"Preprocessor, batches of {batch_size}", batch_seconds)]:
+        print(f"  {label:<34} {len(traces) / seconds:10.1f} traces/s")
@@ -0,0 +1,291 @@
+import os
+import csv
+import sys
+import time
+import heapq
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from obspy import UTCDateTime
+from streaming import StreamingDetector
+from sac_reader import read_trace, trace_id
+from detection import list_sac_files, read_item
+
+# Near-real-time detection: a packet source (SeedLink, dataselect polling, or a replay of SAC files) feeds
+# a queue, and one loop pushes each packet through a per-channel StreamingDetector. A trigger is announced
+# as soon as it opens (the 5 s zerophase pad plus the STA window after its onset) and written to the CSV
+# when it closes. Packets are dicts: id, starttime (epoch), sampling_rate, data.
+OUTPUT_PATH = 'realtime_triggers.csv'
+PACKET_SECONDS = 1.0   # Replay packet length; SeedLink records carry a few seconds each
+QUEUE_SIZE = 10000     # Packets buffered between source and detector
+POLL_SECONDS = 10      # How often the dataselect poller asks for new data
+POLL_DELAY = 60        # Data centers need a while to make fresh data available over dataselect
+POLL_LOOKBACK = 600    # On start, the poller fetches this much history so the LTA is warm
+REPORT_INTERVAL = 30
+CSV_FIELDNAMES = ['Trace_ID', 'On_Time', 'Off_Time', 'Peak_CFT']
+
+def make_packet(packet_id, starttime, sampling_rate, data):
+    return {'id': packet_id, 'starttime': float(starttime), 'sampling_rate': float(sampling_rate), 'data': data}
+
+def utc_now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+class ReplayFeed:
+    """Offline stand-in for a live feed: replays SAC files as packets, paced at `speed` times real time (0 = flat out).
+
+    Channels are interleaved by packet time, as a real feed would deliver them.
+    """
+
+    def __init__(self, file_paths, speed=1.0, packet_seconds=PACKET_SECONDS):
+        self.speed = speed
+        self.packet_seconds = packet_seconds
+        self.channels = {}
+        for file_path in file_paths:
+            trace = read_trace(file_path)
+            if trace is not None:
+                self.channels.setdefault(trace_id(trace), []).append((float(trace['starttime']), file_path))
+        self._stop = threading.Event()
+        self._data_t0 = None
+        self._wall_t0 = None
+
+    def _channel_packets(self, files):
+        for _, file_path in sorted(files):
+            trace = read_trace(file_path)
+            df = trace['sampling_rate']
+            step = max(1, int(round(self.packet_seconds * df)))
+            starttime = float(trace['starttime'])
+            for i in range(0, trace['npts'], step):
+                yield make_packet(trace_id(trace), starttime + i / df, df, trace['data'][i:i + step])
+
+    def _run(self, packets):
+        merged = heapq.merge(*(self._channel_packets(files) for files in self.channels.values()),
+                             key=lambda packet: packet['starttime'])
+        for packet in merged:
+            if self._stop.is_set():
+                break
+            if self._data_t0 is None:
+                self._data_t0, self._wall_t0 = packet['starttime'], time.time()
+            if self.speed:
+                # A packet goes out once its last sample would have been recorded
+                end = packet['starttime'] + len(packet['data']) / packet['sampling_rate']
+                delay = self._wall_t0 + (end - self._data_t0) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            packets.put(packet)
+        packets.put(None)
+
+    def start(self, packets):
+        threading.Thread(target=self._run, args=(packets,), name="replay-feed", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def now(self):
+        """The data time being replayed right now (None when running flat out), so latencies are in data seconds."""
+        if not self.speed or self._data_t0 is None:
+            return None
+        return self._data_t0 + (time.time() - self._wall_t0) * self.speed
+
+class SeedLinkSource:
+    """Live packets from a SeedLink server (e.g. rtserve.iris.washington.edu:18000) for NET.STA.CHA streams."""
+
+    def __init__(self, server, streams):
+        from obspy.clients.seedlink.easyseedlink import create_client
+
+        self.packets = None
+        self.client = create_client(server, on_data=self._on_data)
+        for stream in streams:
+            network, station, channel = stream.split('.')
+            self.client.select_stream(network, station, channel)
+
+    def _on_data(self, trace):
+        self.packets.put(make_packet(trace.id, trace.stats.starttime, trace.stats.sampling_rate,
+                                     trace.data.astype(np.float64)))
+
+    def _run(self):
+        try:
+            self.client.run()
+        except Exception as e:
+            print(f"❌ SeedLink connection ended: {e}")
+        self.packets.put(None)
+
+    def start(self, packets):
+        self.packets = packets
+        threading.Thread(target=self._run, name="seedlink", daemon=True).start()
+
+    def stop(self):
+        self.client.close()
+
+    def now(self):
+        return time.time()  # Live data: sample times are UTC, so latency includes the network's own delay
+
+class DataselectPoller:
+    """Polls dataselect every POLL_SECONDS for new data of each NET.STA.CHA, for stations without a SeedLink feed."""
+
+    def __init__(self, client, streams, poll_seconds=POLL_SECONDS, delay=POLL_DELAY, lookback=POLL_LOOKBACK):
+        self.client = client
+        self.streams = [stream.split('.') for stream in streams]
+        self.poll_seconds = poll_seconds
+        self.delay = delay
+        self.lookback = lookback
+        self.next_sample = {}  # NET.STA.CHA -> epoch of the first sample not yet delivered
+        self._stop = threading.Event()
+
+    def _poll(self, packets, network, station, channel):
+        key = f"{network}.{station}.{channel}"
+        end_time = utc_now().replace(microsecond=0) - timedelta(seconds=self.delay)
+        if key in self.next_sample:
+            # Whole seconds only (the query drops fractions); the overlap is trimmed below
+            start_time = datetime(1970, 1, 1) + timedelta(seconds=int(self.next_sample[key]))
+        else:
+            start_time = end_time - timedelta(seconds=self.lookback)
+        if end_time <= start_time:
+            return
+
+        members = []
+        self.client.fetch_members(network, station, channel, start_time, end_time,
+                                  lambda name, data: members.append(read_item((name, data))[1]))
+        for trace in sorted((trace for trace in members if trace is not None), key=lambda trace: trace['starttime']):
+            starttime, df = float(trace['starttime']), trace['sampling_rate']
+            skip = 0
+            if key in self.next_sample:
+                skip = max(0, int(round((self.next_sample[key] - starttime) * df)))
+            if skip >= trace['npts']:
+                continue
+            packets.put(make_packet(trace_id(trace), starttime + skip / df, df, trace['data'][skip:]))
+            self.next_sample[key] = starttime + trace['npts'] / df
+
+    def _run(self, packets):
+        while not self._stop.is_set():
+            for network, station, channel in self.streams:
+                try:
+                    self._poll(packets, network, station, channel)
+                except Exception as e:
+                    print(f"⚠️ Polling {network}.{station}.{channel} failed: {e}")
+            self._stop.wait(self.poll_seconds)
+        packets.put(None)
+
+    def start(self, packets):
+        threading.Thread(target=self._run, args=(packets,), name="dataselect-poller", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def now(self):
+        return time.time()
+
+def run_realtime(source, out_path=OUTPUT_PATH, report_interval=REPORT_INTERVAL, **detector_kwargs):
+    """Detects on packets from `source` until it ends (or Ctrl-C); returns packet rate and alert latency stats.
+
+    Latency is the time from a trigger's onset sample being recorded to its alert (in data seconds for a replay).
+    """
+    packets = queue.Queue(maxsize=QUEUE_SIZE)
+    detectors = {}
+    alerted = {}  # trace id -> on_time of the last trigger announced
+    latencies = []
+    counts = {'packets': 0, 'samples': 0, 'triggers': 0}
+    csv_exists = os.path.exists(out_path)
+
+    def alert(packet_id, trigger):
+        if alerted.get(packet_id) == trigger['on_time']:
+            return
+        alerted[packet_id] = trigger['on_time']
+        now = source.now()
+        latency = ""
+        if now is not None:
+            latencies.append(now - trigger['on_time'])
+            latency = f" ({latencies[-1]:.1f} s after onset)"
+        print(f"🚨 {packet_id} trigger at {UTCDateTime(trigger['on_time'])}{latency}")
+
+    def write(packet_id, triggers):
+        for trigger in triggers:
+            alert(packet_id, trigger)
+            csv_writer.writerow({
+                'Trace_ID': packet_id,
+                'On_Time': UTCDateTime(trigger['on_time']),
+                'Off_Time': UTCDateTime(trigger['off_time']),
+                'Peak_CFT': f"{trigger['peak_cft']:.3f}",
+            })
+            counts['triggers'] += 1
+        if triggers:
+            csvfile.flush()  # Downstream readers see each trigger as soon as it closes
+
+    with open(out_path, 'a', newline='') as csvfile:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        if not csv_exists:
+            csv_writer.writeheader()
+        source.start(packets)
+        tic = last_report = time.time()
+        try:
+            while True:
+                try:
+                    packet = packets.get(timeout=1)
+                except queue.Empty:
+                    packet = False
+                if packet is None:
+                    break
+                if packet is not False:
+                    packet_id = packet['id']
+                    detector = detectors.get(packet_id)
+                    if detector is None or detector.df != packet['sampling_rate']:
+                        if detector is not None:
+                            write(packet_id, detector.flush())
+                        detector = detectors[packet_id] = StreamingDetector(packet['sampling_rate'], **detector_kwargs)
+                    write(packet_id, detector.push(packet['data'], packet['starttime']))
+                    opened = detector.open_trigger()
+                    if opened is not None:
+                        alert(packet_id, opened)
+                    counts['packets'] += 1
+                    counts['samples'] += len(packet['data'])
+
+                now = time.time()
+                if now - last_report >= report_interval:
+                    last_report = now
+                    print(format_summary(summarize(counts, now - tic, latencies), packets.qsize()))
+        except KeyboardInterrupt:
+            print("⏹️ Stopping...")
+        finally:
+            source.stop()
+            for packet_id, detector in detectors.items():
+                write(packet_id, detector.flush())
+
+    summary = summarize(counts, time.time() - tic, latencies)
+    print(format_summary(summary, packets.qsize()))
+    return summary
+
+def summarize(counts, elapsed, latencies):
+    summary = dict(counts, seconds=elapsed,
+                   packets_per_s=counts['packets'] / elapsed if elapsed > 0 else 0.0,
+                   samples_per_s=counts['samples'] / elapsed if elapsed > 0 else 0.0)
+    if latencies:
+        summary['latency_p50'] = float(np.percentile(latencies, 50))
+        summary['latency_p99'] = float(np.percentile(latencies, 99))
+    return summary
+
+def format_summary(summary, queued):
+    line = (f"📈 {summary['packets']} packets ({summary['packets_per_s']:.0f}/s, "
+            f"{summary['samples_per_s'] / 1e6:.2f} M samples/s), {summary['triggers']} triggers, queue {queued}")
+    if 'latency_p50' in summary:
+        line += f", alert latency p50 {summary['latency_p50']:.2f} s / p99 {summary['latency_p99']:.2f} s"
+    return line
+
+if __name__ == "__main__":
+    # Usage: python realtime.py replay <folder of SAC files> [speed, 0 = flat out] [out.csv]
+    #        python realtime.py seedlink <host:port> <NET.STA.CHA> [...]
+    #        python realtime.py poll <IRIS|TEXNET|base_url> <NET.STA.CHA> [...]
+    command = sys.argv[1]
+    if command == "replay":
+        speed = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+        run_realtime(ReplayFeed(list_sac_files(sys.argv[2]), speed), sys.argv[4] if len(sys.argv) > 4 else OUTPUT_PATH)
+    elif command == "seedlink":
+        run_realtime(SeedLinkSource(sys.argv[2], sys.argv[3:]))
+    elif command == "poll":
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+        from fdsn_client import DataselectClient
+        from scheduler import DATA_CENTERS
+
+        with DataselectClient(DATA_CENTERS.get(sys.argv[2], sys.argv[2]), max_in_flight=2) as client:
+            run_realtime(DataselectPoller(client, sys.argv[3:]))
+    else:
+        print(f"Unknown command: {command}")
@@ -0,0 +1,117 @@
+import os
+import numpy as np
+from obspy import UTCDateTime
+
+# Lean SAC reader for the detector: parses the fixed 632-byte header and maps the data block
+# as a NumPy view, instead of building a full obspy Stream. Anything unusual returns None so the
+# caller falls back to obspy.read.
+HEADER_BYTES = 632
+FLOAT_FIELDS = {'delta': 0, 'b': 5}
+INT_FIELDS = {'nzyear': 0, 'nzjday': 1, 'nzhour': 2, 'nzmin': 3, 'nzsec': 4, 'nzmsec': 5,
+              'nvhdr': 6, 'npts': 9, 'iftype': 15, 'leven': 35}
+STRING_FIELDS = {'kstnm': (0, 8), 'khole': (24, 8), 'kcmpnm': (160, 8), 'knetwk': (168, 8)}
+FNULL = -12345.0
+INULL = -12345
+ITIME = 1  # iftype of an evenly sampled time series
+
+def _clean(raw):
+    text = raw.split(b'\0')[0].decode('ascii', 'replace').strip()
+    return '' if text == '-12345' else text
+
+def read_sac_header(header):
+    """Parses the fields the detector needs from a 632-byte SAC header, or returns None if it isn't one."""
+    if len(header) < HEADER_BYTES:
+        return None
+    for order in '<>':
+        ints = np.frombuffer(header, dtype=order + 'i4', count=40, offset=280)
+        if ints[6] == 6:
+            break
+    else:
+        return None
+    floats = np.frombuffer(header, dtype=order + 'f4', count=70)
+    strings = bytes(header[440:HEADER_BYTES])
+    fields = {'byteorder': order}
+    fields.update({name: float(floats[i]) for name, i in FLOAT_FIELDS.items()})
+    fields.update({name: int(ints[i]) for name, i in INT_FIELDS.items()})
+    fields.update({name: _clean(strings[i:i + n]) for name, (i, n) in STRING_FIELDS.items()})
+    return fields
+
+def _is_plain(fields, size):
+    """True for the files IRIS/TexNet serve: v6, evenly sampled, one component, full reference time."""
+    return (fields['nvhdr'] == 6 and fields['iftype'] == ITIME and fields['leven'] == 1
+            and fields['npts'] > 0 and fields['delta'] > 0
+            and size == HEADER_BYTES + 4 * fields['npts']
+            and 100 <= fields['nzyear'] and INULL not in (fields['nzjday'], fields['nzhour'], fields['nzmin'],
+                                                          fields['nzsec'], fields['nzmsec']))
+
+def read_sac(source):
+    """Reads a SAC file (path) or SAC bytes into a dict with a float32 `data` view and the detector's header values.
+
+    The data block is memory-mapped (or viewed in place for bytes), so nothing is copied for native
+    byte order. Returns None when the file needs obspy (other header versions, uneven sampling,
+    spectral files, missing reference time...).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        fields = read_sac_header(source[:HEADER_BYTES])
+        if fields is None or not _is_plain(fields, len(source)):
+            return None
+        data = np.frombuffer(source, dtype=fields['byteorder'] + 'f4', count=fields['npts'], offset=HEADER_BYTES)
+    else:
+        with open(source, 'rb') as f:
+            fields = read_sac_header(f.read(HEADER_BYTES))
+            f.seek(0, 2)
+            size = f.tell()
+        if fields is None or not _is_plain(fields, size):
+            return None
+        data = np.memmap(source, dtype=fields['byteorder'] + 'f4', mode='r', offset=HEADER_BYTES,
+                         shape=(fields['npts'],))
+
+    # Same conventions as obspy's SAC plugin: sample spacing rounded to microseconds, start = reference time + b
+    sampling_rate = 1.0 / round(np.float64(fields['delta']), 6)
+    b = fields['b'] if fields['b'] != FNULL else 0.0
+    starttime = UTCDateTime(year=fields['nzyear'], julday=fields['nzjday'], hour=fields['nzhour'],
+                            minute=fields['nzmin'], second=fields['nzsec'], microsecond=fields['nzmsec'] * 1000) + b
+    return {
+        'data': np.asarray(data, dtype=np.float32),
+        'network': fields['knetwk'],
+        'station': fields['kstnm'],
+        'location': fields['khole'],
+        'channel': fields['kcmpnm'],
+        'sampling_rate': sampling_rate,
+        'starttime': starttime,
+        'endtime': starttime + (fields['npts'] - 1) * (1.0 / sampling_rate),
+        'npts': fields['npts'],
+    }
+
+def trace_from_stream(stream):
+    """Same dict as read_sac, from the first trace of an obspy Stream (the fallback path)."""
+    stats = stream[0].stats
+    return {
+        'data': stream[0].data,
+        'network': stats.network,
+        'station': stats.station,
+        'location': stats.location,
+        'channel': stats.channel,
+        'sampling_rate': stats.sampling_rate,
+        'starttime': stats.starttime,
+        'endtime': stats.endtime,
+        'npts': stats.npts,
+    }
+
+def read_trace(file_path):
+    """read_sac for plain SAC files, obspy.read for everything else; None if the file has no traces."""
+    trace = read_sac(file_path) if file_path.upper().endswith(".SAC") else None
+    if trace is None:
+        from obspy import read
+        stream = read(file_path)
+        if len(stream) == 0:
+            return None
+        trace = trace_from_stream(stream)
+    return trace
+
+def trace_id(trace):
+    return f"{trace['network']}.{trace['station']}.{trace['location']}.{trace['channel']}"
+
+def list_sac_files(folder):
+    """Returns the SAC files in a folder in name (i.e. time) order."""
+    return [os.path.join(folder, f) for f in sorted(os.listdir(folder)) if f.endswith(".SAC")]
@@ -0,0 +1,197 @@
+import os
+import sys
+import csv
+import time
+import queue
+import threading
+import xml.etree.ElementTree as ET
+from collections import namedtuple, Counter
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from ledger import ProcessedLedger, ledger_key, LEDGER_FILE_NAME
+from detection import detect_files, to_csv_row
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+from trigger_store import TriggerStore, records_to_columns
+from aggregates import AggregateCache, AGGREGATES_DIR_NAME
+from fdsn_client import DataselectClient, DATA_CENTERS
+from windows import WindowPlanner
+from waveform_cache import WaveformCache
+from manifest import DownloadManifest, MANIFEST_FILE_NAME
+from metrics import METRICS, enable as enable_metrics, finish as finish_metrics
+
+# How many requests each data center (fdsn_client.DATA_CENTERS) may have in flight at once
+HOST_LIMITS = {'IRIS': 8, 'TEXNET': 2}
+DEFAULT_SOURCE = 'IRIS'
+
+OUTPUT_DIR = os.path.join('/', 'Volumes', 'Marc', '2025_Marco', 'network')
+DETECT_PROCESSES = os.cpu_count()
+MEMBER_BATCH = 4 * DETECT_PROCESSES  # SAC members of a job held in memory at a time, as in seismicPipeline.py
+RESULT_QUEUE_SIZE = 16  # Finished jobs waiting for the writer; bounds memory if writing falls behind
+CSV_FIELDNAMES = ['SAC_file', 'Station', 'Start_Time', 'End_Time', 'Number_of_Triggers', 'Trigger_Times']
+
+STATIONXML_NS = '{http://www.fdsn.org/xml/station/1}'
+
+Job = namedtuple('Job', ['source', 'network', 'station', 'channel', 'start', 'end'])
+
+def read_inventory(path, default_source=DEFAULT_SOURCE):
+    """Reads (source, net, sta, cha) entries from StationXML or a text list of "[SOURCE] NET STA CHA" lines."""
+    if path.lower().endswith('.xml'):
+        entries = []
+        root = ET.parse(path).getroot()
+        for network in root.iter(STATIONXML_NS + 'Network'):
+            for station in network.iter(STATIONXML_NS + 'Station'):
+                channels = sorted(set(ch.get('code') for ch in station.iter(STATIONXML_NS + 'Channel')))
+                for channel in channels:
+                    entries.append((default_source, network.get('code'), station.get('code'), channel))
+        return entries
+
+    entries = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split('#')[0].split()
+            if len(fields) == 3:
+                entries.append((default_source, *fields))
+            elif len(fields) == 4:
+                entries.append((fields[0].upper(), *fields[1:]))
+    return entries
+
+def build_jobs(channels, start_date, end_date, ledger):
+    """Builds one job per channel per day, grouped by data center and interleaved so every station advances together."""
+    jobs = {}
+    current_time = start_date
+    while current_time < end_date:
+        next_time = current_time + timedelta(days=1)
+        for source, network, station, channel in channels:
+            if ledger_key(network, station, channel, current_time) in ledger:
+                continue
+            jobs.setdefault(source, []).append(Job(source, network, station, channel, current_time, next_time))
+        current_time = next_time
+    return jobs
+
+def run_schedule(channels, start_date, end_date, output_dir=OUTPUT_DIR):
+    """Downloads and detects every (channel, day) job, each data center capped at its HOST_LIMITS."""
+    os.makedirs(output_dir, exist_ok=True)
+    ledger = ProcessedLedger(os.path.join(output_dir, LEDGER_FILE_NAME))
+    store = TriggerStore(os.path.join(output_dir, 'trigger_store'))
+    aggregates = AggregateCache(os.path.join(output_dir, AGGREGATES_DIR_NAME))
+    planner = WindowPlanner(os.path.join(output_dir, 'window_sizes.json'))
+    cache = WaveformCache(os.path.join(output_dir, 'waveform_cache'))
+    manifest = DownloadManifest(os.path.join(output_dir, MANIFEST_FILE_NAME))
+
+    jobs = build_jobs(channels, start_date, end_date, ledger)
+    for source, source_jobs in jobs.items():
+        print(f"📋 {source}: {len(source_jobs)} jobs, at most {HOST_LIMITS.get(source, 1)} in flight")
+
+    results = queue.Queue(maxsize=RESULT_QUEUE_SIZE)
+    done = Counter()
+
+    def writer():
+        csv_path = os.path.join(output_dir, 'trigger_info.csv')
+        csv_exists = os.path.exists(csv_path)
+        with open(csv_path, 'a', newline='') as csvfile:
+            csv_writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+            if not csv_exists:
+                csv_writer.writeheader()
+            for job, status, records in iter(results.get, None):
+                # Only finished jobs are written: anything else is not in the ledger, so the next run redoes it
+                if not status.startswith("Success"):
+                    print(f"❌ {job.network}.{job.station}.{job.channel} {job.start:%Y-%m-%d}: {status}")
+                    continue
+                job_key = ledger_key(job.network, job.station, job.channel, job.start)
+                try:
+                    # Store and counts before the CSV, so a job that fails here leaves no rows the next run writes again.
+                    # Both are keyed by the job, so a rerun after a crash before ledger.mark replaces them.
+                    with METRICS.timer('store_append'):
+                        columns = records_to_columns(records)
+                        written = store.bytes_written
+                        store.append(columns, name=job_key)
+                        METRICS.inc('store_bytes_out', store.bytes_written - written)
+                        aggregates.add(columns, name=job_key)
+                    csv_bytes = csvfile.tell()
+                    with METRICS.timer('csv_write'):
+                        csv_writer.writerows(to_csv_row(record) for record in records)
+                        csvfile.flush()
+                    METRICS.inc('csv_rows', len(records))
+                    METRICS.inc('csv_bytes_out', csvfile.tell() - csv_bytes)
+                    ledger.mark(job_key)
+                    done[job.source] += 1
+                except Exception as e:
+                    # Keep draining the queue, or every fetch thread blocks on a full one
+                    print(f"❌ Writing {job.network}.{job.station}.{job.channel} {job.start:%Y-%m-%d} failed: {e}")
+
+    def run_job(client, job):
+        # Members go to detection MEMBER_BATCH at a time as they are read, so a job never holds a whole day of SAC
+        batch = []
+        records = []
+
+        def detect_batch():
+            with METRICS.timer('detect_job'):
+                for record in detect_files(batch, pool=pool):
+                    if 'error' in record:
+                        print(f"Error processing {record['path']}: {record['error']}")
+                    else:
+                        records.append(record)
+            batch.clear()
+
+        def handle_member(name, data):
+            batch.append((name, data))
+            if len(batch) >= MEMBER_BATCH:
+                detect_batch()
+
+        status = client.fetch_members(job.network, job.station, job.channel, job.start, job.end, handle_member, planner)
+        if batch:
+            detect_batch()
+        with METRICS.timer('result_queue_wait'):
+            hand_off((job, status, records))
+
+    def hand_off(item):
+        """Queues an item for the writer, raising instead of blocking forever if the writer thread has died."""
+        while True:
+            try:
+                results.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not writer_thread.is_alive():
+                    raise RuntimeError("the writer thread died, results can no longer be written")
+
+    tic = time.time()
+    # Before the pool forks, so every worker writes its own metrics snapshot
+    enable_metrics(os.path.join(output_dir, 'metrics'))
+    # The detection pool is forked before any thread starts
+    with Pool(DETECT_PROCESSES) as pool:
+        writer_thread = threading.Thread(target=writer, name="writer")
+        writer_thread.start()
+        clients = {source: DataselectClient(DATA_CENTERS[source], max_in_flight=HOST_LIMITS.get(source, 1),
+                                            cache=cache, manifest=manifest)
+                   for source in jobs}
+        try:
+            # Each data center has its own capped thread pool, so a slow host never starves the others
+            futures = [clients[source].submit(run_job, clients[source], job)
+                       for source, source_jobs in jobs.items() for job in source_jobs]
+            for future in futures:
+                future.result()
+        finally:
+            for client in clients.values():
+                client.close()
+            if writer_thread.is_alive():
+                hand_off(None)
+            writer_thread.join()
+        pool.close()
+        pool.join()
+
+    toc = time.time()
+    finish_metrics()
+    print(f"\n✅ Done in {toc - tic:.1f} s")
+    for source, source_jobs in jobs.items():
+        print(f"  {source}: {done[source]} of {len(source_jobs)} jobs finished")
+        print(f"    {clients[source].controller.summary()}")
+
+if __name__ == "__main__":
+    # Usage: python scheduler.py <inventory.txt|stations.xml> <start YYYY-MM-DD> <end YYYY-MM-DD> [default source]
+    default_source = sys.argv[4].upper() if len(sys.argv) > 4 else DEFAULT_SOURCE
+    channels = read_inventory(sys.argv[1], default_source)
+    start_date = datetime.strptime(sys.argv[2], "%Y-%m-%d")
+    end_date = datetime.strptime(sys.argv[3], "%Y-%m-%d")
+    print(f"Scheduling {len(channels)} channels from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}")
+    run_schedule(channels, start_date, end_date)
@@ -1,15 +1,22 @@
 import os
+import sys
 import csv
 import shutil
-import requests
+import threading
 import zipfile
-from io import BytesIO
 from datetime import datetime, timedelta
-import pandas as pd
-import matplotlib.pyplot as plt
-from obspy import read
-from obspy.signal.filter import highpass
-from obspy.signal.trigger import classic_sta_lta, trigger_onset
+from multiprocessing import Pool
+from ledger import ProcessedLedger, ledger_key, LEDGER_FILE_NAME
+from stages import Stage, run_stages
+from detection import detect_file, detect_files, list_sac_files, to_csv_row
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+from trigger_store import TriggerStore, records_to_columns
+from aggregates import AggregateCache, AGGREGATES_DIR_NAME
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+from waveform_cache import WaveformCache
+from fdsn_client import DataselectClient, extract_all
+from windows import WindowPlanner
+from metrics import METRICS, enable as enable_metrics, finish as finish_metrics
 
 # Constants
 BASE_URL = "http://service.iris.edu/fdsnws/dataselect/1/query"
@@ -18,104 +25,298 @@ STATION = "PB28"
 CHANNEL = "HHZ"
 FORMAT_TYPE = "sac.zip"
 DATA_DIR = "./seismic_data"
+WAVEFORM_CACHE_DIR = os.path.join(DATA_DIR, "waveform_cache")  # None disables the cache
+WAVEFORM_CACHE_MAX_BYTES = 500 * 1024 ** 3
+WAVEFORM_CACHE_COMPRESS = None  # "mseed" re-encodes cached days as STEIM2 miniSEED
 CSV_FILE_PATH = "/Volumes/Marc/2025_Marco/PB28/trigger_info.csv"
+LEDGER_PATH = os.path.join(os.path.dirname(CSV_FILE_PATH), LEDGER_FILE_NAME)
+TRIGGER_STORE_DIR = os.path.join(os.path.dirname(CSV_FILE_PATH), "trigger_store")  # One row per trigger, see trigger_store.py
+AGGREGATES_PATH = os.path.join(os.path.dirname(CSV_FILE_PATH), AGGREGATES_DIR_NAME)   # Per-month/day/hour counts for plots
+CSV_FIELDNAMES = ['SAC_file', 'Station', 'Start_Time', 'End_Time', 'Number_of_Triggers', 'Trigger_Times']
+
+# Staged pipeline sizing: queues are bounded so at most a few days sit on scratch disk at once
+FETCH_WORKERS = 2
+DETECT_WORKERS = 1
+DETECT_PROCESSES = os.cpu_count()  # SAC files are independent, so detection fans out to this many processes
+PREFETCH_DAYS = 2
+REPORT_INTERVAL = 60  # seconds between stage throughput/queue reports
+EXTRACT_TO_DISK = True  # False hands SAC members from the zip straight to the detector
+MEMBER_BATCH = 4 * DETECT_PROCESSES  # Without EXTRACT_TO_DISK, SAC members read from a day's zip at a time
+WINDOW_SIZES_FILE_NAME = "window_sizes.json"  # Learned request window per channel, kept in DATA_DIR
+METRICS_DIR = os.path.join(DATA_DIR, "metrics")  # metrics.json / metrics.prom snapshots while the pipeline runs
+
+_ledger = None
+_waveform_cache = None
+_client = None
+_planner = None
+_open_lock = threading.Lock()  # Fetch workers open the cache and client lazily, from several threads
 
 def get_monthly_folder(date):
     """Returns the folder path for a given month."""
     return os.path.join(DATA_DIR, date.strftime("%Y-%m"))
 
+def get_ledger():
+    """Loads the processed-day ledger once, rebuilding it from the CSV if it is missing."""
+    global _ledger
+    if _ledger is None:
+        _ledger = ProcessedLedger(LEDGER_PATH)
+        if len(_ledger) == 0 and os.path.exists(CSV_FILE_PATH):
+            print(f"Rebuilding ledger from {CSV_FILE_PATH}...")
+            _ledger.rebuild_from_csv(CSV_FILE_PATH, NETWORK, CHANNEL)
+    return _ledger
+
+def get_waveform_cache():
+    """Opens the local waveform cache once (None if WAVEFORM_CACHE_DIR is None)."""
+    global _waveform_cache
+    with _open_lock:
+        if _waveform_cache is None and WAVEFORM_CACHE_DIR is not None:
+            _waveform_cache = WaveformCache(WAVEFORM_CACHE_DIR, WAVEFORM_CACHE_MAX_BYTES, WAVEFORM_CACHE_COMPRESS)
+    return _waveform_cache
+
 def check_if_already_processed(start_time):
-    """Checks if data for a specific day is already in the CSV."""
-    if not os.path.exists(CSV_FILE_PATH):
-        return False  # No CSV yet, so nothing is processed
-    
-    df = pd.read_csv(CSV_FILE_PATH)
-    df['Start_Time'] = pd.to_datetime(df['Start_Time'])
-    
-    return any(df['Start_Time'].dt.date == start_time.date())
+    """Checks if data for a specific day is already in the ledger."""
+    return ledger_key(NETWORK, STATION, CHANNEL, start_time) in get_ledger()
+
+def get_client():
+    """Opens the shared DataselectClient and WindowPlanner once; fetch workers share its session and host limits."""
+    global _client, _planner
+    cache = get_waveform_cache()
+    with _open_lock:
+        if _client is None:
+            _planner = WindowPlanner(os.path.join(DATA_DIR, WINDOW_SIZES_FILE_NAME))
+            _client = DataselectClient(BASE_URL, max_in_flight=FETCH_WORKERS, cache=cache)
+    return _client, _planner
+
+def fetch_day(current_time, zip_path):
+    """Fetches one day through the DataselectClient into zip_path and returns True on success.
+
+    The WindowPlanner splits a day that draws a 413 or a slow reply, so a day may arrive as several
+    sac.zips (some read from the cache); their SAC members are copied into the one zip, a member at a time.
+    """
+    client, planner = get_client()
+    with zipfile.ZipFile(zip_path, 'w') as day_zip:
+        def handle_zip(zip_ref):
+            for name in zip_ref.namelist():
+                if name.upper().endswith(".SAC"):
+                    with zip_ref.open(name) as member, day_zip.open(name, 'w') as out:
+                        shutil.copyfileobj(member, out)
+                    METRICS.inc('sac_bytes_out', zip_ref.getinfo(name).file_size)
+        result = client.fetch(NETWORK, STATION, CHANNEL, current_time, current_time + timedelta(days=1),
+                              handle_zip, planner)
+    if result.startswith("Success"):
+        return True
+    os.remove(zip_path)
+    return False
+
+def open_day_zip(current_time, zip_path):
+    """Returns one day's sac.zip: a file object from the waveform cache, or zip_path after downloading (None on failure).
+
+    A cache entry that fails its check is evicted by cache.open, and the day is downloaded again. Downloads
+    are stored in the cache by the client, which never caches a zip that fails its CRC check.
+    """
+    cache = get_waveform_cache()
+    if cache is not None:
+        cached = cache.open(NETWORK, STATION, CHANNEL, current_time, current_time + timedelta(days=1))
+        if cached is not None:
+            METRICS.inc('cache_hits')
+            return cached
+    if not fetch_day(current_time, zip_path):
+        return None
+    return zip_path
+
+def release_zip(source):
+    """Deletes a downloaded scratch zip, or closes a file object served from the cache."""
+    if isinstance(source, str):
+        os.remove(source)
+    else:
+        source.close()
 
 def download_monthly_data(start_time, end_time, month_folder):
     """Downloads seismic data for a whole month."""
+    zip_path = os.path.join(month_folder, "download.zip")
     current_time = start_time
     while current_time < end_time:
         if check_if_already_processed(current_time):
             print(f"✅ Skipping {current_time.strftime('%Y-%m-%d')} (Already Processed)")
         else:
-            next_time = current_time + timedelta(days=1)
-
-            params = {
-                'net': NETWORK,
-                'sta': STATION,
-                'cha': CHANNEL,
-                'format': FORMAT_TYPE,
-                'starttime': current_time.strftime("%Y-%m-%dT%H:%M:%S"),
-                'endtime': next_time.strftime("%Y-%m-%dT%H:%M:%S"),
-            }
-
-            try:
-                response = requests.get(BASE_URL, params=params, timeout=30)
-                if response.status_code == 200:
-                    with zipfile.ZipFile(BytesIO(response.content), 'r') as zip_ref:
-                        zip_ref.extractall(month_folder)
-                else:
-                    print(f"Failed to retrieve data for {current_time}. Status code: {response.status_code}")
-            except requests.exceptions.RequestException as e:
-                print(f"Error fetching data for {current_time}: {e}")
+            source = open_day_zip(current_time, zip_path)
+            if source is not None:
+                with zipfile.ZipFile(source, 'r') as zip_ref:
+                    extract_all(zip_ref, month_folder)
+                release_zip(source)
 
         current_time += timedelta(days=1)  # Move to next day
 
-def process_seismic_data(month_folder):
-    """Processes all seismic data from a month and appends results to CSV."""
+def detect_sac_file(file_path):
+    """Runs the 5 Hz highpass + STA/LTA detector on one SAC file and returns its CSV row (None if empty)."""
+    record = detect_file(file_path)
+    if 'error' in record:
+        return None
+    return to_csv_row(record)
+
+def open_csv_writer():
+    """Opens the trigger CSV for appending and writes the header if the file is new."""
     csv_exists = os.path.exists(CSV_FILE_PATH)
+    csvfile = open(CSV_FILE_PATH, 'a', newline='')
+    csv_writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+    if not csv_exists:
+        csv_writer.writeheader()
+    return csvfile, csv_writer
+
+def append_triggers(store, aggregates, records, day_key):
+    """Adds one day's detection records to the trigger store and the aggregate counts.
+
+    Both are keyed by the day's ledger key, so a day re-detected after a crash before ledger.mark
+    replaces its earlier rows and counts instead of adding them twice.
+    """
+    with METRICS.timer('store_append'):
+        columns = records_to_columns(records)
+        written = store.bytes_written
+        store.append(columns, name=day_key)
+        METRICS.inc('store_bytes_out', store.bytes_written - written)
+        aggregates.add(columns, name=day_key)
+
+def process_seismic_data(month_folder, workers=DETECT_PROCESSES):
+    """Processes all seismic data from a month and appends results to CSV."""
+    ledger = get_ledger()
+    pending_day = None
+
+    store = TriggerStore(TRIGGER_STORE_DIR)
+    aggregates = AggregateCache(AGGREGATES_PATH)
+    day_records = []
+
+    csvfile, csv_writer = open_csv_writer()
+    with csvfile:
+        csv_bytes = csvfile.tell()
+        # SAC names carry year.julday.time, so sorted order walks the month day by day.
+        # Workers only detect; this process is the single CSV writer.
+        for record in detect_files(list_sac_files(month_folder), workers=workers):
+            if 'error' in record:
+                print(f"Error processing {record['path']}: {record['error']}")
+                continue
+
+            # Append to CSV
+            row = to_csv_row(record)
+            csv_writer.writerow(row)
 
-    with open(CSV_FILE_PATH, 'a', newline='') as csvfile:
-        fieldnames = ['SAC_file', 'Station', 'Start_Time', 'End_Time', 'Number_of_Triggers', 'Trigger_Times']
-        csv_writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        if not csv_exists:
-            csv_writer.writeheader()
-
-        for filename in os.listdir(month_folder):
-            if filename.endswith(".SAC"):
-                file_path = os.path.join(month_folder, filename)
-                try:
-                    stream = read(file_path)
-                    if len(stream) == 0:
-                        continue
-                    trace = stream[0]
-                    start_time = trace.stats.starttime
-                    end_time = trace.stats.endtime
-
-                    # Apply high-pass filter
-                    for tr in stream:
-                        tr.data = highpass(tr.data, freq=5, df=tr.stats.sampling_rate, corners=2, zerophase=True)
-
-                    # STA/LTA trigger detection
-                    cft = classic_sta_lta(trace.data, int(1 * trace.stats.sampling_rate), int(10 * trace.stats.sampling_rate))
-                    onset_times = trigger_onset(cft, 8, 0.5)
-                    num_triggers = len(onset_times)
-                    trigger_times_str = ', '.join(str(time) for time in onset_times)
-
-                    # Append to CSV
-                    csv_writer.writerow({
-                        'SAC_file': filename,
-                        'Station': trace.stats.station,
-                        'Start_Time': start_time,
-                        'End_Time': end_time,
-                        'Number_of_Triggers': num_triggers,
-                        'Trigger_Times': trigger_times_str
-                    })
-                except Exception as e:
-                    print(f"Error processing {file_path}: {e}")
+            # A day is only marked once all of its files are in the CSV and the trigger store
+            day_key = ledger_key(NETWORK, row['Station'], CHANNEL, row['Start_Time'].datetime)
+            if pending_day is not None and day_key != pending_day:
+                csvfile.flush()
+                METRICS.inc('csv_bytes_out', csvfile.tell() - csv_bytes)
+                csv_bytes = csvfile.tell()
+                append_triggers(store, aggregates, day_records, pending_day)
+                day_records = []
+                ledger.mark(pending_day)
+            pending_day = day_key
+            day_records.append(record)
+
+        if pending_day is not None:
+            csvfile.flush()
+            METRICS.inc('csv_bytes_out', csvfile.tell() - csv_bytes)
+            append_triggers(store, aggregates, day_records, pending_day)
+            ledger.mark(pending_day)
+
+def run_staged_pipeline(start_date, end_date):
+    """Runs fetch, extract, detect and CSV-write concurrently, one day per work item."""
+    ledger = get_ledger()
+    store = TriggerStore(TRIGGER_STORE_DIR)
+    aggregates = AggregateCache(AGGREGATES_PATH)
+    zip_dir = os.path.join(DATA_DIR, "zips")
+    os.makedirs(zip_dir, exist_ok=True)
+
+    def days():
+        current_time = start_date
+        while current_time < end_date:
+            if check_if_already_processed(current_time):
+                print(f"✅ Skipping {current_time.strftime('%Y-%m-%d')} (Already Processed)")
+            else:
+                yield current_time
+            current_time += timedelta(days=1)
+
+    def fetch(day):
+        # Cached days are read from local disk; only misses go to the network
+        source = open_day_zip(day, os.path.join(zip_dir, day.strftime("%Y-%m-%d") + ".zip"))
+        if source is not None:
+            yield day, source
+
+    def extract(item):
+        day, source = item
+        day_folder = os.path.join(DATA_DIR, day.strftime("%Y-%m-%d"))
+        if os.path.exists(day_folder):
+            shutil.rmtree(day_folder)
+        with zipfile.ZipFile(source, 'r') as zip_ref, METRICS.timer('zip_extract'):
+            extract_all(zip_ref, day_folder)
+        release_zip(source)
+        yield day, day_folder
+
+    def member_batches(source):
+        # Only MEMBER_BATCH members are in memory at a time; queued days are still just zips on disk
+        try:
+            with zipfile.ZipFile(source, 'r') as zip_ref:
+                names = sorted(name for name in zip_ref.namelist() if name.upper().endswith(".SAC"))
+                for i in range(0, len(names), MEMBER_BATCH):
+                    with METRICS.timer('zip_extract'):
+                        batch = [(name, zip_ref.read(name)) for name in names[i:i + MEMBER_BATCH]]
+                    yield batch
+        finally:
+            release_zip(source)
+
+    def detect(item):
+        day, source = item
+        # source is an extracted day folder, or (without EXTRACT_TO_DISK) the day's sac.zip
+        if EXTRACT_TO_DISK:
+            day_folder, batches = source, [list_sac_files(source)]
+        else:
+            day_folder, batches = None, member_batches(source)
+        records = []
+        for batch in batches:
+            for record in detect_files(batch, pool=pool):
+                if 'error' in record:
+                    print(f"Error processing {record['path']}: {record['error']}")
+                else:
+                    records.append(record)
+        yield day, day_folder, records
+
+    csvfile, csv_writer = open_csv_writer()
+
+    def write(item):
+        day, day_folder, records = item
+        rows = [to_csv_row(record) for record in records]
+        csv_bytes = csvfile.tell()
+        with METRICS.timer('csv_write'):
+            csv_writer.writerows(rows)
+            csvfile.flush()
+        METRICS.inc('csv_rows', len(rows))
+        METRICS.inc('csv_bytes_out', csvfile.tell() - csv_bytes)
+        day_key = ledger_key(NETWORK, STATION, CHANNEL, day)
+        append_triggers(store, aggregates, records, day_key)
+        ledger.mark(day_key)
+        if day_folder is not None:
+            shutil.rmtree(day_folder)  # Delete the processed data
+        print(f"✅ {day.strftime('%Y-%m-%d')}: {len(rows)} files, {sum(r['Number_of_Triggers'] for r in rows)} triggers")
+
+    stages = [Stage("fetch", fetch, workers=FETCH_WORKERS, queue_size=FETCH_WORKERS)]
+    if EXTRACT_TO_DISK:
+        stages.append(Stage("extract", extract, queue_size=PREFETCH_DAYS))
+    stages += [
+        Stage("detect", detect, workers=DETECT_WORKERS, queue_size=PREFETCH_DAYS),
+        Stage("write", write, queue_size=PREFETCH_DAYS),
+    ]
+    with csvfile, Pool(DETECT_PROCESSES) as pool:
+        final = run_stages(days(), stages, report_interval=REPORT_INTERVAL)
+        pool.close()  # Workers exit normally and write their last metrics snapshot
+        pool.join()
+        return final
 
 def generate_monthly_plot():
-    """Generates a plot of total triggers per month."""
-    df = pd.read_csv(CSV_FILE_PATH)
-    df['Start_Time'] = pd.to_datetime(df['Start_Time'], format='%Y-%m-%dT%H:%M:%S.%fZ')
-    df['Month'] = df['Start_Time'].dt.to_period('M')
-    monthly_totals = df.groupby('Month')['Number_of_Triggers'].sum()
+    """Generates a plot of total triggers per month from the aggregate cache."""
+    import matplotlib.pyplot as plt
+
+    months, monthly_totals = AggregateCache(AGGREGATES_PATH).series(STATION, 'month')
 
     plt.figure(figsize=(12, 6))
-    plt.bar(monthly_totals.index.astype(str), monthly_totals, color='skyblue')
+    plt.bar(months, monthly_totals, color='skyblue')
     plt.xlabel('Month')
     plt.ylabel('Total Number of Triggers')
     plt.title('Total Number of Triggers Each Month')
@@ -123,30 +324,57 @@ def generate_monthly_plot():
     plt.tight_layout()
     plt.show()
 
-if __name__ == "__main__":
-    start_date = datetime(2021,9, 1)
-    end_date = datetime(2025, 2, 25)
-    current_month = start_date.replace(day=1)  # Start at the beginning of the month
+def check_crash_rerun(folder):
+    """Detects two synthetic days with process_seismic_data, crashing at the first ledger.mark, then runs again;
+    True if the trigger store and the aggregate counts hold every trigger exactly once."""
+    global _ledger, CSV_FILE_PATH, LEDGER_PATH, TRIGGER_STORE_DIR, AGGREGATES_PATH
+    from synthetic_sac import write_folder
+
+    month_folder = os.path.join(folder, "2022-03")
+    write_folder(month_folder, datetime(2022, 3, 1), 48)
+    CSV_FILE_PATH = os.path.join(folder, "trigger_info.csv")
+    LEDGER_PATH = os.path.join(folder, LEDGER_FILE_NAME)
+    TRIGGER_STORE_DIR = os.path.join(folder, "trigger_store")
+    AGGREGATES_PATH = os.path.join(folder, AGGREGATES_DIR_NAME)
 
-    while current_month <= end_date:
-        next_month = (current_month + timedelta(days=32)).replace(day=1)  # Move to next month
-        month_folder = get_monthly_folder(current_month)
+    class CrashingLedger(ProcessedLedger):
+        def mark(self, key):
+            raise RuntimeError(f"simulated crash before marking {key}")
 
-        # Ensure the directory is clean for the new month
-        if os.path.exists(month_folder):
-            shutil.rmtree(month_folder)
-        os.makedirs(month_folder, exist_ok=True)
+    _ledger = CrashingLedger(LEDGER_PATH)
+    try:
+        process_seismic_data(month_folder, workers=2)
+    except RuntimeError as e:
+        print(f"💥 {e}")
+    _ledger = None
+    process_seismic_data(month_folder, workers=2)
 
-        print(f"\n Downloading data for {current_month.strftime('%Y-%m')}...")
-        download_monthly_data(current_month, next_month, month_folder)
+    expected = sum(len(record['onsets']) for record in detect_files(list_sac_files(month_folder), workers=2)
+                   if 'error' not in record)
+    stored = len(TriggerStore(TRIGGER_STORE_DIR).read(stations=[STATION])['on_time'])
+    counted = sum(AggregateCache(AGGREGATES_PATH).series(STATION, 'day')[1])
+    ok = expected > 0 and expected == stored == counted
+    print(f"{'✅' if ok else '❌'} {expected} triggers detected, {stored} in the store, {counted} in the aggregates")
+    return ok
 
-        print(f"\nProcessing data for {current_month.strftime('%Y-%m')}...")
-        process_seismic_data(month_folder)
+if __name__ == "__main__":
+    # Usage: python seismicPipeline.py          (runs the staged pipeline over the dates below)
+    #        python seismicPipeline.py check    (a crash before ledger.mark, then a rerun, must count every trigger once)
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        import tempfile
+        with tempfile.TemporaryDirectory() as folder:
+            sys.exit(0 if check_crash_rerun(folder) else 1)
 
-        print(f"\n Deleting data for {current_month.strftime('%Y-%m')}...")
-        shutil.rmtree(month_folder)  # Delete the processed data
+    start_date = datetime(2021,9, 1)
+    end_date = datetime(2025, 2, 25)
 
-        current_month = next_month  # Move to next month
+    # Day N is detected while day N+1 downloads; see FETCH_WORKERS / PREFETCH_DAYS for sizing
+    print(f"\n Running staged pipeline from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}...")
+    last_month_end = (end_date.replace(day=1) + timedelta(days=32)).replace(day=1)
+    # Before the pool starts, so its workers write snapshots too
+    enable_metrics(METRICS_DIR)
+    run_staged_pipeline(start_date, last_month_end)
+    finish_metrics()
 
     print("\nGenerating final plot...")
     generate_monthly_plot()
@@ -0,0 +1,226 @@
+import os
+import csv
+import sys
+import json
+import time
+import random
+from datetime import datetime
+from collections import Counter
+from multiprocessing import Pool
+import numpy as np
+from ledger import ProcessedLedger, LEDGER_FILE_NAME
+from detection import detect_files, to_csv_row
+from leases import LeaseDir
+from scheduler import read_inventory, build_jobs, DATA_CENTERS, HOST_LIMITS, DETECT_PROCESSES, CSV_FIELDNAMES
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+from trigger_store import TriggerStore, records_to_columns, COLUMNS
+from aggregates import AggregateCache, AGGREGATES_DIR_NAME
+from fdsn_client import DataselectClient
+from windows import WindowPlanner
+from waveform_cache import WaveformCache
+from flow_control import backoff_delay
+from metrics import METRICS
+
+# Several machines share one volume: each claims (channel, day) shards through lease files, writes its results
+# to <shared>/results/<node>/, and `merge` folds committed shards into trigger_info.csv, the store and the ledger.
+SHARED_DIR = os.path.join('/', 'Volumes', 'Marc', '2025_Marco', 'network')
+IDLE_SECONDS = 60  # How long a node waits before re-checking shards leased by other nodes
+SHARD_ATTEMPTS = 3     # Tries a node gives a failing shard before reporting it and leaving it to other nodes or a rerun
+SHARD_BACKOFF_BASE = 10.0  # Seconds before retrying a failed shard, doubled per attempt (with full jitter)
+MERGE_JOURNAL_NAME = "merge_journal.json"  # The shard a merge is writing, so a crashed merge can be rolled back
+
+def shard_name(job):
+    return f"{job.network}.{job.station}.{job.channel}.{job.start:%Y-%m-%d}"
+
+def process_shard(client, job, planner, pool, result_dir, shard):
+    """Downloads and detects one shard and writes <shard>.csv + <shard>.npz; returns their names, or None on failure."""
+    members = []
+    status = client.fetch_members(job.network, job.station, job.channel, job.start, job.end,
+                                  lambda name, data: members.append((name, data)), planner)
+    if not status.startswith("Success"):
+        print(f"❌ {shard}: {status}")
+        return None
+    records = [record for record in detect_files(members, pool=pool) if 'error' not in record]
+
+    # Written under temporary names first, so a node dying mid-write never leaves a complete-looking file
+    csv_name, npz_name = shard + ".csv", shard + ".npz"
+    with open(os.path.join(result_dir, csv_name + ".tmp"), 'w', newline='') as csvfile:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        csv_writer.writerows(to_csv_row(record) for record in records)
+    with open(os.path.join(result_dir, npz_name + ".tmp"), 'wb') as f:
+        np.savez(f, **records_to_columns(records))
+    for name in (csv_name, npz_name):
+        os.replace(os.path.join(result_dir, name + ".tmp"), os.path.join(result_dir, name))
+    METRICS.inc('csv_bytes_out', os.path.getsize(os.path.join(result_dir, csv_name)))
+    METRICS.inc('store_bytes_out', os.path.getsize(os.path.join(result_dir, npz_name)))
+    return {'csv': csv_name, 'npz': npz_name}
+
+def run_node(channels, start_date, end_date, shared_dir=SHARED_DIR, node=None):
+    """Works through every unfinished shard, claiming one at a time, until all are committed by some node.
+
+    A shard that fails is released and retried after a backoff, up to SHARD_ATTEMPTS times; returns the
+    shards that still failed, which stay uncommitted for another node or the next run.
+    """
+    leases = LeaseDir(os.path.join(shared_dir, "shards"), node)
+    result_dir = os.path.join(shared_dir, "results", leases.node)
+    os.makedirs(result_dir, exist_ok=True)
+    ledger = ProcessedLedger(os.path.join(shared_dir, LEDGER_FILE_NAME))
+    # Learned window sizes and the (SQLite) waveform cache index are per node; neither is safe to share over NFS
+    planner = WindowPlanner(os.path.join(result_dir, 'window_sizes.json'))
+    cache = WaveformCache(os.path.join(result_dir, 'waveform_cache'))
+    jobs = [job for source_jobs in build_jobs(channels, start_date, end_date, ledger).values() for job in source_jobs]
+    # Nodes walk the shards in different orders, so they rarely contend for the same lease
+    random.shuffle(jobs)
+    print(f"🖥️ Node {leases.node}: {len(jobs)} shards not yet merged")
+
+    clients = {}
+    processed = 0
+    attempts = Counter()
+    retry_at = {}  # Failed shard -> time it may be claimed again
+    failed = []
+    with Pool(DETECT_PROCESSES) as pool:
+        try:
+            pending = jobs
+            while pending:
+                waiting = []
+                for job in pending:
+                    shard = shard_name(job)
+                    if leases.is_done(shard):
+                        continue
+                    if retry_at.get(shard, 0) > time.time() or not leases.claim(shard):
+                        waiting.append(job)  # Backing off, or held by a live node; re-checked later in case it dies
+                        continue
+                    if job.source not in clients:
+                        clients[job.source] = DataselectClient(DATA_CENTERS[job.source],
+                                                               max_in_flight=HOST_LIMITS.get(job.source, 1), cache=cache)
+                    try:
+                        result = process_shard(clients[job.source], job, planner, pool, result_dir, shard)
+                    except Exception as e:
+                        print(f"❌ {shard}: {e}")
+                        result = None
+                    if result is not None and leases.commit(shard, result):
+                        processed += 1
+                        print(f"✅ {shard} committed by {leases.node}")
+                        continue
+                    leases.release(shard)
+                    if result is not None:
+                        print(f"⚠️ {shard} was committed by another node, discarding ours")
+                        for name in result.values():
+                            os.remove(os.path.join(result_dir, name))
+                        continue
+                    attempts[shard] += 1
+                    if attempts[shard] >= SHARD_ATTEMPTS:
+                        print(f"❌ {shard}: giving up after {attempts[shard]} attempts")
+                        failed.append(shard)
+                        continue
+                    delay = backoff_delay(attempts[shard] - 1, base=SHARD_BACKOFF_BASE, cap=IDLE_SECONDS)
+                    retry_at[shard] = time.time() + delay
+                    print(f"⚠️ {shard}: attempt {attempts[shard]} of {SHARD_ATTEMPTS} failed, retrying in {delay:.1f} s")
+                    waiting.append(job)
+                pending = waiting
+                if pending:
+                    backing_off = [retry_at[shard_name(job)] for job in pending if shard_name(job) in retry_at]
+                    if len(backing_off) == len(pending):
+                        delay = max(0, min(backing_off) - time.time())
+                        print(f"⏳ {len(pending)} shards backing off after failures, retrying in {delay:.1f} s")
+                    else:
+                        delay = IDLE_SECONDS
+                        print(f"⏳ {len(pending)} shards leased by other nodes or backing off, checking again in {delay} s")
+                    time.sleep(delay)
+        finally:
+            for client in clients.values():
+                client.close()
+            leases.close()
+    print(f"✅ Node {leases.node} committed {processed} shards")
+    if failed:
+        print(f"🚨 {len(failed)} shards failed on every attempt and are not committed: {', '.join(sorted(failed))}")
+    return failed
+
+def write_journal(path, entry):
+    with open(path + ".tmp", 'w') as f:
+        json.dump(entry, f)
+    os.replace(path + ".tmp", path)
+
+def recover_merge(journal_path, csv_path, ledger, store, aggregates):
+    """Undoes the half-merged shard a crashed merge left behind (its journal entry is not in the ledger).
+
+    The CSV is cut back to its length before the shard, the shard's store parts are deleted and the
+    station's counts rebuilt from the store, so merging the shard again adds it exactly once.
+    """
+    if not os.path.exists(journal_path):
+        return
+    with open(journal_path) as f:
+        entry = json.load(f)
+    if entry['shard'] not in ledger:
+        print(f"⚠️ Rolling back the unfinished merge of {entry['shard']}")
+        if os.path.exists(csv_path) and os.path.getsize(csv_path) > entry['csv_bytes']:
+            os.truncate(csv_path, entry['csv_bytes'])
+        station = entry['shard'].split('.')[1]
+        for _, _, folder in store.partitions(stations=[station]):
+            part_path = os.path.join(folder, f"part-{entry['shard']}.npz")
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        aggregates.rebuild(store, stations=[station])
+    os.remove(journal_path)
+
+def merge(shared_dir=SHARED_DIR):
+    """Folds every committed, not yet merged shard into trigger_info.csv, the trigger store, aggregates and ledger.
+
+    Each shard is journaled (with the CSV length) before anything is written, and its store parts are named
+    after it, so a merge that dies between the writes and the ledger mark is rolled back by the next one.
+    """
+    leases = LeaseDir(os.path.join(shared_dir, "shards"), node="merge")
+    ledger = ProcessedLedger(os.path.join(shared_dir, LEDGER_FILE_NAME))
+    store = TriggerStore(os.path.join(shared_dir, 'trigger_store'))
+    aggregates = AggregateCache(os.path.join(shared_dir, AGGREGATES_DIR_NAME))
+    csv_path = os.path.join(shared_dir, 'trigger_info.csv')
+    journal_path = os.path.join(shared_dir, MERGE_JOURNAL_NAME)
+    recover_merge(journal_path, csv_path, ledger, store, aggregates)
+    csv_exists = os.path.exists(csv_path)
+
+    merged = 0
+    with open(csv_path, 'a', newline='') as csvfile:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        if not csv_exists:
+            csv_writer.writeheader()
+        csvfile.flush()
+        for shard, marker in sorted(leases.done_shards().items()):
+            if shard in ledger:
+                continue
+            journal = {'shard': shard, 'csv_bytes': csvfile.tell()}
+            write_journal(journal_path, journal)
+            result_dir = os.path.join(shared_dir, "results", marker['node'])
+            with open(os.path.join(result_dir, marker['result']['csv']), newline='') as f:
+                csv_writer.writerows(csv.DictReader(f, fieldnames=CSV_FIELDNAMES))
+            csvfile.flush()
+            METRICS.inc('csv_bytes_out', csvfile.tell() - journal['csv_bytes'])
+            with np.load(os.path.join(result_dir, marker['result']['npz'])) as part:
+                columns = {name: part[name] for name in COLUMNS}
+            store.append(columns, name=shard)
+            aggregates.add(columns, name=shard)
+            # Shard names are ledger keys (NET.STA.CHA.YYYY-MM-DD), so a re-run merge skips what is already in
+            ledger.mark(shard)
+            merged += 1
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+    leases.close()
+    store.compact(partitions=store.touched)
+    METRICS.inc('store_bytes_out', store.bytes_written)
+    print(f"✅ Merged {merged} shards into {csv_path}")
+
+if __name__ == "__main__":
+    # Usage: python sharded.py run <inventory> <start YYYY-MM-DD> <end YYYY-MM-DD> [shared_dir] [node]
+    #        python sharded.py merge [shared_dir]
+    command = sys.argv[1]
+    if command == "run":
+        channels = read_inventory(sys.argv[2])
+        start_date = datetime.strptime(sys.argv[3], "%Y-%m-%d")
+        end_date = datetime.strptime(sys.argv[4], "%Y-%m-%d")
+        shared_dir = sys.argv[5] if len(sys.argv) > 5 else SHARED_DIR
+        failed = run_node(channels, start_date, end_date, shared_dir, sys.argv[6] if len(sys.argv) > 6 else None)
+        sys.exit(1 if failed else 0)
+    elif command == "merge":
+        merge(sys.argv[2] if len(sys.argv) > 2 else SHARED_DIR)
+    else:
+        print(f"Unknown command: {command}")
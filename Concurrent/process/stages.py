@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import queue
+import threading
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+from metrics import METRICS
+
+_DONE = object()  # End-of-stream marker passed down the queues
+
+class Stage:
+    """One step of a staged pipeline: `func(item)` returns an iterable of items for the next stage (or None)."""
+
+    def __init__(self, name, func, workers=1, queue_size=2):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.inbox = queue.Queue(maxsize=queue_size)  # Bounded, so upstream blocks instead of piling up
+        self.items_in = 0
+        self.items_out = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._lock = threading.Lock()
+        self._alive = workers
+
+    def _worker(self, outbox):
+        while True:
+            t0 = time.perf_counter()
+            item = self.inbox.get()
+            t1 = time.perf_counter()
+            if item is _DONE:
+                self.inbox.put(_DONE)  # Let sibling workers see it too
+                break
+
+            produced = 0
+            try:
+                for out in self.func(item) or ():
+                    if outbox is not None:
+                        outbox.put(out)
+                    produced += 1
+            except Exception as e:
+                print(f"❌ [{self.name}] failed on {item}: {e}")
+                with self._lock:
+                    self.errors += 1
+            t2 = time.perf_counter()
+
+            with self._lock:
+                self.items_in += 1
+                self.items_out += produced
+                self.wait_seconds += t1 - t0
+                self.busy_seconds += t2 - t1
+            METRICS.observe(f"{self.name}_queue_wait", t1 - t0)
+            METRICS.observe(f"stage_{self.name}", t2 - t1)
+
+        with self._lock:
+            self._alive -= 1
+            last = self._alive == 0
+        if last and outbox is not None:
+            outbox.put(_DONE)
+
+    def stats(self, elapsed):
+        """Returns a snapshot of this stage's counters."""
+        with self._lock:
+            return {
+                'stage': self.name,
+                'workers': self.workers,
+                'in': self.items_in,
+                'out': self.items_out,
+                'errors': self.errors,
+                'queue': self.inbox.qsize(),
+                'queue_max': self.inbox.maxsize,
+                'items_per_s': self.items_in / elapsed if elapsed > 0 else 0.0,
+                'utilization': self.busy_seconds / (elapsed * self.workers) if elapsed > 0 else 0.0,
+                'wait_s': self.wait_seconds,
+            }
+
+def format_stats(stats):
+    """Formats stage snapshots as one line per stage."""
+    return '\n'.join(
+        f"  {s['stage']:<8} in={s['in']:<6} out={s['out']:<6} err={s['errors']:<3} "
+        f"queue={s['queue']}/{s['queue_max']} {s['items_per_s']:.3f}/s busy={s['utilization']:.0%}"
+        for s in stats
+    )
+
+def run_stages(items, stages, report_interval=30):
+    """Feeds `items` through `stages` concurrently and returns the final per-stage stats."""
+    tic = time.perf_counter()
+    threads = []
+    for i, stage in enumerate(stages):
+        outbox = stages[i + 1].inbox if i + 1 < len(stages) else None
+        for n in range(stage.workers):
+            t = threading.Thread(target=stage._worker, args=(outbox,), name=f"{stage.name}-{n}", daemon=True)
+            t.start()
+            threads.append(t)
+
+    stop = threading.Event()
+
+    def report():
+        while not stop.wait(report_interval):
+            elapsed = time.perf_counter() - tic
+            print(f"\n📊 Pipeline after {elapsed:.0f} s:\n{format_stats([s.stats(elapsed) for s in stages])}")
+
+    reporter = threading.Thread(target=report, name="reporter", daemon=True)
+    reporter.start()
+
+    for item in items:
+        stages[0].inbox.put(item)
+    stages[0].inbox.put(_DONE)
+
+    for t in threads:
+        t.join()
+    stop.set()
+
+    elapsed = time.perf_counter() - tic
+    final = [s.stats(elapsed) for s in stages]
+    print(f"\n📊 Pipeline finished in {elapsed:.1f} s:\n{format_stats(final)}")
+    return final
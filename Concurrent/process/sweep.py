@@ -0,0 +1,102 @@
+import os
+import csv
+import sys
+import itertools
+from multiprocessing import Pool
+import numpy as np
+from detection import HIGHPASS_FREQ, FILTER_CORNERS, list_sac_files
+from sac_reader import read_trace
+from preprocess import worker_preprocessor
+
+# Parameter grid: 2 x 2 x 7 x 2 = 56 settings evaluated from one read + filter per file
+STA_GRID = (0.5, 1)            # seconds
+LTA_GRID = (10, 30)            # seconds
+ON_GRID = (4, 5, 6, 7, 8, 10, 12)
+OFF_GRID = (0.5, 1.0)
+
+SWEEP_FIELDNAMES = ['SAC_file', 'Station', 'Start_Time', 'STA', 'LTA', 'On', 'Off', 'Number_of_Triggers']
+
+def sta_lta_from_cumsum(csum, nsta, nlta):
+    """classic_sta_lta from a precomputed cumulative sum of squares, so several window pairs share one pass."""
+    sta = np.empty_like(csum)
+    lta = np.empty_like(csum)
+    sta[:nsta] = csum[:nsta]
+    sta[nsta:] = csum[nsta:] - csum[:-nsta]
+    sta /= nsta
+    lta[:nlta] = csum[:nlta]
+    lta[nlta:] = csum[nlta:] - csum[:-nlta]
+    lta /= nlta
+    sta[:nlta - 1] = 0
+    np.maximum(lta, np.finfo(0.0).tiny, out=lta)
+    return np.divide(sta, lta, out=sta)
+
+def count_triggers_grid(cft, ons, off):
+    """Number of trigger_onset triggers for every on-threshold at once, for one off-threshold.
+
+    Each run of cft > off yields exactly one trigger if its peak exceeds `on` (for on > off),
+    so the counts for all on-levels are one reduceat plus one searchsorted.
+    """
+    above = cft > off
+    if not above.any():
+        return np.zeros(len(ons), dtype=np.int64)
+    starts = np.flatnonzero(np.diff(above.astype(np.int8)) == 1) + 1
+    if above[0]:
+        starts = np.r_[0, starts]
+    # Stretches between runs stay below off < on, so they never change the comparison
+    peaks = np.sort(np.maximum.reduceat(cft, starts))
+    return len(peaks) - np.searchsorted(peaks, np.asarray(ons, dtype=np.float64), side='right')
+
+def sweep_file(file_path, sta_grid=STA_GRID, lta_grid=LTA_GRID, on_grid=ON_GRID, off_grid=OFF_GRID):
+    """Reads and filters a SAC file once, then counts triggers for the whole parameter grid."""
+    trace = read_trace(file_path)
+    if trace is None:
+        return []
+    df = trace['sampling_rate']
+    data = worker_preprocessor().highpass(trace['data'], df, HIGHPASS_FREQ, FILTER_CORNERS)
+    csum = np.cumsum(np.square(data, dtype=np.float64))
+
+    rows = []
+    for sta, lta in itertools.product(sta_grid, lta_grid):
+        cft = sta_lta_from_cumsum(csum, int(sta * df), int(lta * df))
+        for off in off_grid:
+            ons = [on for on in on_grid if on > off]
+            for on, count in zip(ons, count_triggers_grid(cft, ons, off)):
+                rows.append({
+                    'SAC_file': os.path.basename(file_path),
+                    'Station': trace['station'],
+                    'Start_Time': trace['starttime'],
+                    'STA': sta,
+                    'LTA': lta,
+                    'On': on,
+                    'Off': off,
+                    'Number_of_Triggers': int(count),
+                })
+    return rows
+
+def _sweep_file_safe(file_path):
+    try:
+        return sweep_file(file_path)
+    except Exception as e:
+        print(f"Skipping {file_path} due to exception: {e}")
+        return []
+
+if __name__ == "__main__":
+    # Usage: python sweep.py <folder of SAC files> [output.csv] [num_processes]
+    folder = sys.argv[1]
+    out_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(folder, 'sweep_counts.csv')
+    num_processes = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    totals = {}
+    with open(out_path, 'w', newline='') as csvfile, Pool(num_processes) as pool:
+        csv_writer = csv.DictWriter(csvfile, fieldnames=SWEEP_FIELDNAMES)
+        csv_writer.writeheader()
+        for rows in pool.imap(_sweep_file_safe, list_sac_files(folder), chunksize=4):
+            csv_writer.writerows(rows)
+            for row in rows:
+                key = (row['STA'], row['LTA'], row['On'], row['Off'])
+                totals[key] = totals.get(key, 0) + row['Number_of_Triggers']
+
+    print("STA   LTA   On    Off   Total_Triggers")
+    for (sta, lta, on, off), total in sorted(totals.items()):
+        print(f"{sta:<5} {lta:<5} {on:<5} {off:<5} {total}")
+    print(f"✅ Per-file counts written to {out_path}")
@@ -1,83 +1,81 @@
 import os
 import csv
-from obspy import read
-from obspy.signal.filter import highpass
-from obspy.signal.trigger import classic_sta_lta, trigger_onset
+import sys
+from detection import detect_files, list_sac_files, to_csv_row
+from day_volumes import list_volumes
+from ledger import ledger_key
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'analysis'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'download'))
+from trigger_store import TriggerStore, records_to_columns
+from aggregates import AggregateCache, AGGREGATES_DIR_NAME
+from metrics import METRICS, enable as enable_metrics, finish as finish_metrics
 
 # Specify the directory on the ejectable disk located at /Volumes/Marco/SeismicData
 marco_disk_path = os.path.join('/', 'Volumes', 'Marc', '2025_Marco', 'PB28', 'NewPorcessConcurrent')
 
-# Create a CSV file for storing the trigger information or open an existing file for appending
-csv_file_path = os.path.join(marco_disk_path, 'trigger_info.csv')
-
-# Check if the CSV file already exists
-csv_exists = os.path.exists(csv_file_path)
-
-# Open the CSV file in append mode
-with open(csv_file_path, 'a', newline='') as csvfile:
-    # Define the CSV header if the file is newly created
-    fieldnames = ['SAC_file', 'Station', 'Start_Time', 'End_Time', 'Number_of_Triggers', 'Trigger_Times']
-
-    # Create a CSV writer
-    csv_writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-    # Write the header to the CSV file if it's a new file
-    if not csv_exists:
-        csv_writer.writeheader()
-
-    # Loop through each file in the directory
-    for filename in os.listdir(marco_disk_path):
-        if filename.endswith(".SAC"):
-            sac_file_path = os.path.join(marco_disk_path, filename)
-
-            try:
-                # Load the SAC file
-                stream = read(sac_file_path)
-
-                # Verify that the stream contains at least one trace
-                if len(stream) == 0:
-                    print(f"Skipping {sac_file_path} as it does not contain any traces.")
-                    continue
-
-                # Extract relevant information
-                trace = stream[0]
-                start_time = trace.stats.starttime
-                end_time = trace.stats.endtime
-
-                # Apply high-pass filter at 5 Hz to each trace in the stream
-                for tr in stream:
-                    tr.data = highpass(tr.data, freq=5, df=tr.stats.sampling_rate, corners=2, zerophase=True)
-
-                # Earthquake detection on the high-pass filtered data
-                cft = classic_sta_lta(trace.data, int(1 * trace.stats.sampling_rate), int(10 * trace.stats.sampling_rate))
-
-                # Set trigger levels
-                onset_trigger = 8
-                end_trigger = 0.5
-
-                # Get trigger onsets
-                onset_times = trigger_onset(cft, onset_trigger, end_trigger)
-
-                # Count of triggers
-                num_triggers = len(onset_times)
-
-                # Convert trigger times to string for CSV
-                trigger_times_str = ', '.join(str(time) for time in onset_times)
-
-                # Write the information to the CSV file
-                csv_writer.writerow({
-                    'SAC_file': sac_file_path,
-                    'Station': trace.stats.station,
-                    'Start_Time': start_time,
-                    'End_Time': end_time,
-                    'Number_of_Triggers': num_triggers,
-                    'Trigger_Times': trigger_times_str
-                })
-
-            except Exception as e:
-                print(f"Skipping {sac_file_path} due to exception: {e}")
-                print(f"Data length: {len(trace.data)}")
-                print(f"Sampling rate: {trace.stats.sampling_rate}")
-
-# Print a message indicating completion
-print(f"Trigger information appended to: {csv_file_path}")
\ No newline at end of file
+def detect_folder(folder, output_dir, num_processes=None):
+    """Detects on every SAC file in folder and appends to output_dir's trigger_info.csv, trigger store and aggregates."""
+    csv_file_path = os.path.join(output_dir, 'trigger_info.csv')
+    trigger_store_path = os.path.join(output_dir, 'trigger_store')
+
+    # Check if the CSV file already exists
+    csv_exists = os.path.exists(csv_file_path)
+
+    # Open the CSV file in append mode
+    with open(csv_file_path, 'a', newline='') as csvfile:
+        # Define the CSV header if the file is newly created
+        fieldnames = ['SAC_file', 'Station', 'Start_Time', 'End_Time', 'Number_of_Triggers', 'Trigger_Times']
+
+        # Create a CSV writer
+        csv_writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+
+        # Write the header to the CSV file if it's a new file
+        if not csv_exists:
+            csv_writer.writeheader()
+
+        # Workers read, filter and run STA/LTA; only this process writes to the CSV
+        csv_bytes = csvfile.tell()
+        records = []
+        # Compacted day volumes (day_volumes.py) are detected like files, one record per contiguous segment
+        file_paths = list_sac_files(folder) + list_volumes(folder)
+        for record in detect_files(file_paths, workers=num_processes or os.cpu_count()):
+            if 'error' in record:
+                print(f"Skipping {record['path']} due to exception: {record['error']}")
+                continue
+
+            # Write the information to the CSV file
+            with METRICS.timer('csv_write'):
+                csv_writer.writerow(to_csv_row(record, sac_file=record['path']))
+            records.append(record)
+        csvfile.flush()
+        METRICS.inc('csv_bytes_out', csvfile.tell() - csv_bytes)
+
+    # Append the triggers to the columnar store and the per-month/day/hour counts, one batch per day named by its
+    # ledger key, so running the same folder again replaces those days instead of counting them twice
+    days = {}
+    for record in records:
+        days.setdefault(ledger_key(record['network'], record['station'], record['channel'], record['starttime']), []).append(record)
+    with METRICS.timer('store_append'):
+        store = TriggerStore(trigger_store_path)
+        aggregates = AggregateCache(os.path.join(output_dir, AGGREGATES_DIR_NAME))
+        for day_key, day_records in sorted(days.items()):
+            columns = records_to_columns(day_records)
+            store.append(columns, name=day_key)
+            aggregates.add(columns, save=False, name=day_key)
+        aggregates.save()
+        store.compact(partitions=store.touched)
+        METRICS.inc('store_bytes_out', store.bytes_written)
+
+    # Print a message indicating completion
+    print(f"Trigger information appended to: {csv_file_path} and {trigger_store_path}")
+
+if __name__ == "__main__":
+    # Number of detection processes (defaults to all cores): python test_part2.py [num_processes]
+    num_processes = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+
+    # Per-stage timings, counters and worker RSS in <disk>/metrics/metrics.json and metrics.prom
+    enable_metrics(os.path.join(marco_disk_path, 'metrics'))
+    # trigger_info.csv, the typed one-row-per-trigger store (see analysis/trigger_store.py) and the
+    # per-month/day/hour counts all live next to the SAC files
+    detect_folder(marco_disk_path, marco_disk_path, num_processes)
+    finish_metrics()
@@ -0,0 +1,151 @@
+import os
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'download'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'process'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis'))
+
+# One command for the whole workflow, built from the existing modules. Each subcommand imports only what
+# it needs when it runs, so `status` and `help` answer without loading obspy or scipy, and matplotlib
+# loads only for `plot`. check_importtime.py measures this with `python -X importtime`.
+MAX_IN_FLIGHT = 64
+
+USAGE = """Usage: python seismic.py <command> [args]
+
+  download <NET.STA.CHA> <start YYYY-MM-DD> <end YYYY-MM-DD> <out_dir> [IRIS|TEXNET|base_url] [resume|resume-partial]
+  compact  <folder of SAC files> [out_dir, default <folder>/volumes] [workers] [remove]
+  detect   <folder of SAC files or day volumes> [workers] [out_dir]
+  pipeline <inventory.txt|stations.xml> <start YYYY-MM-DD> <end YYYY-MM-DD> [output_dir]
+  plot     <trigger_store dir> <station> [month|day|hour] [start] [end]
+  status   <output_dir> [NET.STA.CHA] [YYYY-MM-DD]"""
+
+def parse_date(text):
+    from datetime import datetime
+
+    return datetime.strptime(text, "%Y-%m-%d")
+
+def download(args):
+    """Downloads one channel into out_dir as downloader2.py does, with the cache, manifest and learned windows."""
+    from fdsn_client import DataselectClient, DATA_CENTERS
+    from windows import WindowPlanner, window_key
+    from waveform_cache import WaveformCache
+    from manifest import DownloadManifest, MANIFEST_FILE_NAME
+    from metrics import enable as enable_metrics, finish as finish_metrics
+
+    network, station, channel = args[0].split('.')
+    start_date, end_date, out_dir = parse_date(args[1]), parse_date(args[2]), args[3]
+    base_url = DATA_CENTERS.get(args[4].upper(), args[4]) if len(args) > 4 else DATA_CENTERS['IRIS']
+    # resume fetches what the manifest has no finished window for; resume-partial also refetches short windows
+    resume = args[5] if len(args) > 5 and args[5] in ("resume", "resume-partial") else None
+    os.makedirs(out_dir, exist_ok=True)
+    enable_metrics(os.path.join(out_dir, 'metrics'))
+
+    manifest = DownloadManifest(os.path.join(out_dir, MANIFEST_FILE_NAME))
+    planner = WindowPlanner(os.path.join(out_dir, 'window_sizes.json'))
+    key = window_key(network, station, channel)
+    if resume:
+        gaps = manifest.missing(network, station, channel, start_date, end_date, retry_partial=resume == "resume-partial")
+        windows = [window for gap in gaps for window in planner.plan(key, *gap)]
+    else:
+        windows = planner.plan(key, start_date, end_date)
+
+    with DataselectClient(base_url, max_in_flight=MAX_IN_FLIGHT, cache=WaveformCache(os.path.join(out_dir, 'waveform_cache')),
+                          manifest=manifest) as client:
+        futures = [client.submit(client.download_and_extract, network, station, channel, window[0], window[1],
+                                 out_dir, planner) for window in windows]
+        results = [f.result() for f in futures]
+    finish_metrics()
+    print(f"{sum(r.startswith('Success') for r in results)} of {len(results)} windows downloaded")
+
+def compact(args):
+    """Merges a folder's hourly SAC fragments into per-channel day volumes (day_volumes.py)."""
+    from day_volumes import compact as compact_fragments, list_sac_files, VOLUMES_DIR_NAME, COMPACT_PROCESSES
+
+    folder = args[0]
+    out_dir = args[1] if len(args) > 1 else os.path.join(folder, VOLUMES_DIR_NAME)
+    workers = int(args[2]) if len(args) > 2 else COMPACT_PROCESSES
+    compact_fragments(list_sac_files(folder), out_dir, workers, remove=len(args) > 3 and args[3] == "remove")
+
+def detect(args):
+    """Runs detection over a folder of SAC files or day volumes (test_part2.py), writing next to them unless out_dir is given."""
+    from test_part2 import detect_folder
+    from metrics import enable as enable_metrics, finish as finish_metrics
+
+    folder = args[0]
+    workers = int(args[1]) if len(args) > 1 else None
+    out_dir = args[2] if len(args) > 2 else folder
+    os.makedirs(out_dir, exist_ok=True)
+    enable_metrics(os.path.join(out_dir, 'metrics'))
+    detect_folder(folder, out_dir, workers)
+    finish_metrics()
+
+def pipeline(args):
+    """Downloads and detects every channel of an inventory with scheduler.py."""
+    from scheduler import read_inventory, run_schedule, OUTPUT_DIR
+
+    channels = read_inventory(args[0])
+    start_date, end_date = parse_date(args[1]), parse_date(args[2])
+    print(f"Scheduling {len(channels)} channels from {start_date:%Y-%m-%d} to {end_date:%Y-%m-%d}")
+    run_schedule(channels, start_date, end_date, args[3] if len(args) > 3 else OUTPUT_DIR)
+
+def plot(args):
+    """Bar chart of one station's trigger counts per month/day/hour from the trigger store's time index."""
+    from trigger_query import TriggerQuery
+
+    bucket = args[2] if len(args) > 2 else 'month'
+    start = args[3] if len(args) > 3 else None
+    end = args[4] if len(args) > 4 else None
+    labels, counts = TriggerQuery(args[0]).histogram(args[1], start, end, bucket)
+    if not labels:
+        print(f"⚠️ No triggers for {args[1]} in {args[0]}")
+        return
+
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 6))
+    plt.bar(labels, counts, color='skyblue')
+    plt.xlabel(bucket.capitalize())
+    plt.ylabel('Number of Triggers')
+    plt.title(f'{args[1]}: Number of Triggers Each {bucket.capitalize()}')
+    plt.xticks(rotation=45, ha="right")
+    plt.tight_layout()
+    plt.show()
+
+def status(args):
+    """Ledger and download manifest of an output folder; with a channel and a day, whether that day is done."""
+    from ledger import ProcessedLedger, ledger_key, LEDGER_FILE_NAME
+    from manifest import DownloadManifest, MANIFEST_FILE_NAME
+
+    output_dir = args[0]
+    ledger = ProcessedLedger(os.path.join(output_dir, LEDGER_FILE_NAME))
+    if len(args) > 2:
+        network, station, channel = args[1].split('.')
+        key = ledger_key(network, station, channel, parse_date(args[2]))
+        print(f"✅ {key} is done" if key in ledger else f"⏳ {key} is not done")
+        return
+    print(f"📋 {len(ledger)} units in {os.path.join(output_dir, LEDGER_FILE_NAME)}")
+
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return
+    manifest = DownloadManifest(manifest_path)
+    channels = [tuple(args[1].split('.'))] if len(args) > 1 else manifest.channels()
+    for network, station, channel in channels:
+        print(f"{network}.{station}.{channel}")
+        for month, row in sorted(manifest.report(network, station, channel).items()):
+            statuses = ", ".join(f"{row[s]} {s}" for s in ('ok', 'partial', 'nodata', 'failed', 'error') if s in row)
+            percent = 100 * row['coverage'] / row['expected'] if row['expected'] else 0
+            print(f"  {month}  {percent:6.2f}% covered  {row['bytes'] / 1024 ** 2:10.1f} MB  {statuses}")
+    manifest.close()
+
+COMMANDS = {'download': download, 'compact': compact, 'detect': detect, 'pipeline': pipeline, 'plot': plot, 'status': status}
+
+if __name__ == "__main__":
+    # Usage: python seismic.py <download|compact|detect|pipeline|plot|status> [args]  (python seismic.py help for details)
+    command = sys.argv[1] if len(sys.argv) > 1 else "help"
+    if command in COMMANDS:
+        COMMANDS[command](sys.argv[2:])
+    elif command in ("help", "-h", "--help"):
+        print(USAGE)
+    else:
+        print(f"Unknown command: {command}\n\n{USAGE}")
+        sys.exit(1)